@@ -0,0 +1,28 @@
+"""add messages.truncated
+
+Revision ID: 0003_message_truncated
+Revises: 6c4788efe712
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003_message_truncated"
+down_revision: Union[str, None] = "6c4788efe712"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "messages",
+        sa.Column("truncated", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "truncated")
@@ -0,0 +1,25 @@
+"""add organizations.ai_fallback_provider
+
+Revision ID: 0004_org_ai_fallback_provider
+Revises: 0003_message_truncated
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0004_org_ai_fallback_provider"
+down_revision: Union[str, None] = "0003_message_truncated"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("organizations", sa.Column("ai_fallback_provider", sa.String(length=50), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("organizations", "ai_fallback_provider")
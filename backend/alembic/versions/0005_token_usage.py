@@ -0,0 +1,40 @@
+"""token usage metering on messages and usage
+
+Revision ID: 0005_token_usage
+Revises: 0004_org_ai_fallback_provider
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0005_token_usage"
+down_revision: Union[str, None] = "0004_org_ai_fallback_provider"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("llm_model", sa.String(length=255), nullable=True))
+    op.add_column("messages", sa.Column("prompt_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("completion_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("cached_prompt_tokens", sa.Integer(), nullable=True))
+    op.add_column(
+        "messages",
+        sa.Column("tokens_estimated", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    for column in ("prompt_tokens_used", "completion_tokens_used", "cached_prompt_tokens_used"):
+        op.add_column("usage", sa.Column(column, sa.BigInteger(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    for column in ("cached_prompt_tokens_used", "completion_tokens_used", "prompt_tokens_used"):
+        op.drop_column("usage", column)
+    op.drop_column("messages", "tokens_estimated")
+    op.drop_column("messages", "cached_prompt_tokens")
+    op.drop_column("messages", "completion_tokens")
+    op.drop_column("messages", "prompt_tokens")
+    op.drop_column("messages", "llm_model")
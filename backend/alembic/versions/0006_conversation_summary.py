@@ -0,0 +1,30 @@
+"""rolling summary on conversations
+
+Revision ID: 0006_conversation_summary
+Revises: 0005_token_usage
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0006_conversation_summary"
+down_revision: Union[str, None] = "0005_token_usage"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("conversations", sa.Column("summary", sa.Text(), nullable=True))
+    op.add_column(
+        "conversations",
+        sa.Column("summarized_messages", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("conversations", "summarized_messages")
+    op.drop_column("conversations", "summary")
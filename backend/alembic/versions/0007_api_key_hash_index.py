@@ -0,0 +1,25 @@
+"""restore unique index on api_keys.key_hash
+
+Revision ID: 0007_api_key_hash_index
+Revises: 0006_conversation_summary
+Create Date: 2026-10-19
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "0007_api_key_hash_index"
+down_revision: Union[str, None] = "0006_conversation_summary"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # API-key authentication looks keys up by hash on every request
+    op.create_index("ix_api_keys_key_hash", "api_keys", ["key_hash"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_api_keys_key_hash", table_name="api_keys")
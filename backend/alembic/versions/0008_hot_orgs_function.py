@@ -0,0 +1,45 @@
+"""hot_orgs(): cross-tenant ranking of recent AI queries for warm-up
+
+Revision ID: 0008_hot_orgs_function
+Revises: 0007_api_key_hash_index
+Create Date: 2026-10-19
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0008_hot_orgs_function"
+down_revision: Union[str, None] = "0007_api_key_hash_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Startup warm-up ranks orgs across tenants, which audit_log's RLS policy
+    # hides from a non-owner role. SECURITY DEFINER runs as the table owner
+    # and exposes only org IDs and counts.
+    op.execute(
+        sa.text(
+            """
+            CREATE OR REPLACE FUNCTION hot_orgs(since timestamptz, max_orgs integer)
+            RETURNS TABLE (org_id uuid, queries bigint)
+            LANGUAGE sql STABLE SECURITY DEFINER
+            SET search_path = public
+            AS $$
+                SELECT a.org_id, count(*) AS queries
+                FROM audit_log a
+                WHERE a.action = 'ai_query' AND a.created_at >= since
+                GROUP BY a.org_id
+                ORDER BY count(*) DESC
+                LIMIT max_orgs
+            $$;
+            """
+        )
+    )
+
+
+def downgrade() -> None:
+    op.execute(sa.text("DROP FUNCTION IF EXISTS hot_orgs(timestamptz, integer);"))
@@ -1,18 +1,30 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
+import json
 import logging
-from typing import Any, AsyncGenerator, List, Tuple
+import math
+import re
+import zlib
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, List, Sequence, Tuple
 from uuid import UUID
 
 logger = logging.getLogger(__name__)
 
+import anyio
 import chromadb
+import httpx
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
 from chromadb.utils import embedding_functions
-from groq import Groq
 from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
 
+from . import metrics
+from .circuit_breaker import get_breaker
 from .config import PlanName, get_plan_limits, get_settings
+from .llm_scheduler import LLMSlot
 
 
 settings = get_settings()
@@ -23,10 +35,39 @@ chroma_client = chromadb.PersistentClient(path=settings.chroma_persist_directory
 # by a network request to HuggingFace.
 _embedding_fn = None
 
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Dependency-free feature-hashing embedding. Needs no model download, so it
+    works fully offline (benchmarks, air-gapped dev). Retrieval quality is
+    lexical only — not a substitute for a real model in production.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors: Embeddings = []
+        for text in input:
+            vec = [0.0] * self.dim
+            for token in _TOKEN_RE.findall(text.lower()):
+                h = zlib.crc32(token.encode("utf-8"))
+                vec[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            vectors.append([v / norm for v in vec])
+        return vectors
+
+
 def _get_embedding_fn():
     global _embedding_fn
     if _embedding_fn is not None:
         return _embedding_fn
+    if settings.embedding_backend == "hashing":
+        _embedding_fn = HashingEmbeddingFunction()
+        logger.info("Using offline hashing embedding function.")
+        return _embedding_fn
     try:
         _embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name="all-MiniLM-L6-v2"
@@ -40,7 +81,56 @@ def _get_embedding_fn():
         _embedding_fn = embedding_functions.DefaultEmbeddingFunction()
     return _embedding_fn
 
-groq_client = Groq(api_key=settings.groq_api_key)
+# Long-lived, keep-alive HTTP clients, one per provider and shared by all API
+# keys (the key travels in a header). Opened in the app lifespan so TCP/TLS
+# setup is paid once per connection, not per request.
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_LLM_BASE_URLS = {
+    "groq": settings.groq_base_url,
+    "openai": settings.openai_base_url,
+    "anthropic": settings.anthropic_base_url,
+}
+if settings.mock_llm_enabled:
+    _LLM_BASE_URLS["mock"] = settings.mock_llm_base_url
+_llm_http_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def build_llm_http_client(base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=_HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=settings.llm_http_max_connections,
+            max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+            keepalive_expiry=settings.llm_http_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.llm_http_connect_timeout_seconds,
+            read=settings.llm_http_read_timeout_seconds,
+            write=10.0,
+            pool=10.0,
+        ),
+    )
+
+
+def get_llm_http_client(provider: str) -> httpx.AsyncClient:
+    """Shared client for `provider`; created lazily if the lifespan did not open it."""
+    client = _llm_http_clients.get(provider)
+    if client is None or client.is_closed:
+        client = _llm_http_clients[provider] = build_llm_http_client(_LLM_BASE_URLS[provider])
+    return client
+
+
+async def open_llm_http_clients() -> None:
+    for provider in _LLM_BASE_URLS:
+        get_llm_http_client(provider)
+
+
+async def close_llm_http_clients() -> None:
+    clients = list(_llm_http_clients.values())
+    _llm_http_clients.clear()
+    for client in clients:
+        await client.aclose()
 
 
 def _collection_name(org_id: UUID) -> str:
@@ -54,6 +144,14 @@ def get_org_collection(org_id: UUID):
     )
 
 
+def drop_org_collection(org_id: UUID) -> None:
+    """Delete an organization's whole collection (used when the org itself is deleted)."""
+    try:
+        chroma_client.delete_collection(_collection_name(org_id))
+    except ValueError:
+        pass  # never indexed anything
+
+
 def chunk_text(text: str, size: int = 800, overlap: int = 150) -> List[str]:
     chunks: List[str] = []
     start = 0
@@ -100,7 +198,28 @@ def query_context(
         
     docs = result.get("documents", [[]])[0]
     metadatas = result.get("metadatas", [[]])[0]
-    
+    return _format_context(docs, metadatas)
+
+
+def query_context_batch(
+    org_id: UUID,
+    queries: List[str],
+    top_k: int = 5,
+) -> List[Tuple[str, list[dict[str, Any]]]]:
+    """Like query_context, but embeds all queries in one batch and runs a single vector query."""
+    collection = get_org_collection(org_id)
+    try:
+        result = collection.query(query_texts=queries, n_results=top_k)
+    except Exception as exc:
+        logger.debug("ChromaDB query returned no results: %s", exc)
+        return [("", []) for _ in queries]
+
+    docs = result.get("documents") or [[] for _ in queries]
+    metadatas = result.get("metadatas") or [[] for _ in queries]
+    return [_format_context(d, m) for d, m in zip(docs, metadatas)]
+
+
+def _format_context(docs: list, metadatas: list) -> Tuple[str, list[dict[str, Any]]]:
     context_parts: List[str] = []
     sources: list[dict[str, Any]] = []
     
@@ -117,115 +236,721 @@ def query_context(
     return context, sources
 
 
-def build_prompt(question: str, context: str) -> str:
-    system = (
-        "You are an AI data analyst for a SaaS platform. "
-        "Answer the user's question using ONLY the provided context. "
-        "If you use information from the context, you MUST cite the source using its index directly in the text, e.g. [Source 1]. "
-        "Format your answer as a clear, professional analytical report using standard Markdown. "
-        "Follow these strictly:\n"
-        "- Structure the output using clear sections with bold headings (e.g., **Introduction**, **Key Columns**).\n"
-        "- Use bullet points (-) for readability when listing items or metrics.\n"
-        "- Ensure consistent use of line breaks between sections to avoid walls of text.\n"
-        "- Avoid dumping raw data; summarize insights concisely and professionally.\n"
-        "- Format numerical values clearly with commas.\n"
-        "If the context does not contain the answer, say you are not sure."
+# Static instructions, kept byte-for-byte identical across requests so they
+# form a cacheable prefix on every provider.
+ANALYST_SYSTEM_PROMPT = (
+    "You are an AI data analyst for a SaaS platform. "
+    "Answer the user's question using ONLY the provided context. "
+    "If you use information from the context, you MUST cite the source using its index directly in the text, e.g. [Source 1]. "
+    "Format your answer as a clear, professional analytical report using standard Markdown. "
+    "Follow these strictly:\n"
+    "- Structure the output using clear sections with bold headings (e.g., **Introduction**, **Key Columns**).\n"
+    "- Use bullet points (-) for readability when listing items or metrics.\n"
+    "- Ensure consistent use of line breaks between sections to avoid walls of text.\n"
+    "- Avoid dumping raw data; summarize insights concisely and professionally.\n"
+    "- Format numerical values clearly with commas.\n"
+    "If the context does not contain the answer, say you are not sure."
+)
+
+
+class ChatPrompt:
+    """
+    A prompt split into a stable prefix (`system`) and per-query parts, so
+    providers can cache the prefix. Most-stable parts come first: system,
+    then the conversation `summary`, the recent `turns` as (question,
+    answer) pairs, and finally context and question.
+    """
+
+    __slots__ = ("system", "context", "question", "summary", "turns")
+
+    def __init__(
+        self,
+        system: str,
+        context: str | None,
+        question: str,
+        summary: str | None = None,
+        turns: Sequence[Tuple[str, str]] = (),
+    ) -> None:
+        self.system = system
+        self.context = context
+        self.question = question
+        self.summary = summary
+        self.turns = list(turns)
+
+    @classmethod
+    def from_text(cls, text: str) -> "ChatPrompt":
+        """A bare prompt, sent as a single user message."""
+        return cls("", None, text)
+
+    def summary_text(self) -> str | None:
+        return f"Summary of the earlier conversation:\n{self.summary}" if self.summary else None
+
+    def user_parts(self) -> List[str]:
+        if self.context is None:
+            return [self.question]
+        return [f"Context:\n{self.context}", f"Question: {self.question}"]
+
+    def text(self) -> str:
+        """Everything as one string, e.g. for local token estimates."""
+        parts = [self.system] if self.system else []
+        if self.summary:
+            parts.append(self.summary_text())
+        for question, answer in self.turns:
+            parts += [question, answer]
+        return "\n\n".join(parts + self.user_parts())
+
+
+def build_prompt(
+    question: str,
+    context: str,
+    summary: str | None = None,
+    turns: Sequence[Tuple[str, str]] = (),
+) -> ChatPrompt:
+    return ChatPrompt(ANALYST_SYSTEM_PROMPT, context, question, summary, turns)
+
+
+class LLMUsage:
+    """Token counts reported by the provider for one completion (None = not reported)."""
+
+    __slots__ = (
+        "provider",
+        "model",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_prompt_tokens",
+        "cache_write_tokens",
+        "estimated",
+    )
+
+    def __init__(self) -> None:
+        self.provider: str | None = None
+        self.model: str | None = None
+        self.prompt_tokens: int | None = None
+        self.completion_tokens: int | None = None
+        self.cached_prompt_tokens: int | None = None
+        self.cache_write_tokens: int | None = None
+        self.estimated = False  # set when any count was estimated locally
+
+    def copy_from(self, other: "LLMUsage") -> None:
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough local token count (~4 characters per token) for providers that report none."""
+    return math.ceil(len(text) / 4)
+
+
+def _fill_usage_estimates(usage: LLMUsage, prompt: ChatPrompt, completion_chars: int) -> None:
+    # Cancelled streams never see the provider's final usage event either
+    if usage.prompt_tokens is None:
+        usage.prompt_tokens = estimate_tokens(prompt.text())
+        usage.estimated = True
+    if usage.completion_tokens is None:
+        usage.completion_tokens = math.ceil(completion_chars / 4)
+        usage.estimated = True
+
+
+def _log_usage(usage: LLMUsage) -> None:
+    if usage.prompt_tokens is None:
+        return
+    cached = usage.cached_prompt_tokens or 0
+    logger.info(
+        "llm usage provider=%s model=%s prompt_tokens=%s cached_prompt_tokens=%s "
+        "cache_write_tokens=%s completion_tokens=%s estimated=%s",
+        usage.provider,
+        usage.model,
+        usage.prompt_tokens,
+        cached,
+        usage.cache_write_tokens or 0,
+        usage.completion_tokens,
+        usage.estimated,
     )
-    prompt = f"{system}\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer:"
-    return prompt
+    metrics.inc("llm_prompt_tokens", usage.prompt_tokens, provider=usage.provider)
+    metrics.inc("llm_completion_tokens", usage.completion_tokens or 0, provider=usage.provider)
+    metrics.inc("llm_cached_prompt_tokens", cached, provider=usage.provider)
+    metrics.observe("llm_prompt_cache_hit_ratio", cached / usage.prompt_tokens if usage.prompt_tokens else 0.0,
+                    provider=usage.provider)
+
+
+# Running average of deltas in a completed answer, per provider. Used to
+# estimate how much generation a cancelled stream avoided paying for.
+_completed_deltas_ewma: dict[str, float] = {}
+
+
+def _record_stream_end(provider: str, deltas: int, cancelled: bool) -> None:
+    if not cancelled:
+        previous = _completed_deltas_ewma.get(provider)
+        _completed_deltas_ewma[provider] = deltas if previous is None else 0.9 * previous + 0.1 * deltas
+        return
+    metrics.inc("llm_streams_cancelled", provider=provider)
+    metrics.observe("llm_cancelled_after_deltas", deltas, provider=provider)
+    expected = _completed_deltas_ewma.get(provider)
+    if expected is not None:
+        metrics.inc("llm_tokens_saved_estimate", max(0.0, expected - deltas), provider=provider)
 
 
 async def stream_chat_completion(
     org_plan: PlanName,
-    prompt: str,
+    prompt: ChatPrompt | str,
     ai_provider: str = "groq",
     ai_model: str | None = None,
     ai_api_key: str | None = None,
+    fallback_provider: str | None = None,
+    usage: LLMUsage | None = None,
+    slot: LLMSlot | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Stream chat completion supporting multi-model and BYOK via HTTPx.
+
+    On plans with failover enabled, `fallback_provider` is used when the
+    org's provider fails or (with hedging) is slow to start streaming.
+    `slot` is the caller's scheduler slot. A call to any other provider
+    waits for a slot of its own, so per-provider caps cover failover and
+    hedged requests too.
+    Token counts reported by the provider (estimated locally when it sends
+    none) are logged and copied into `usage` when one is passed.
+
+    Closing this generator (aclose(), or cancelling the task iterating it)
+    closes the upstream HTTP stream straight away, so the provider stops
+    generating tokens nobody will read.
+    """
+    if isinstance(prompt, str):
+        prompt = ChatPrompt.from_text(prompt)
+    if usage is None:
+        usage = LLMUsage()
+    deltas = completion_chars = 0
+    cancelled = False
+    try:
+        async with aclosing(_provider_stream(
+            org_plan, prompt, ai_provider, ai_model, ai_api_key, fallback_provider, usage, slot
+        )) as stream:
+            async for delta in stream:
+                deltas += 1
+                completion_chars += len(delta)
+                yield delta
+    except (GeneratorExit, asyncio.CancelledError):
+        cancelled = True
+        raise
+    finally:
+        _record_stream_end(ai_provider, deltas, cancelled)
+        if usage.provider is not None:  # a provider was actually called
+            _fill_usage_estimates(usage, prompt, completion_chars)
+        _log_usage(usage)
+
+
+_PROVIDER_LABELS = {"groq": "Groq", "openai": "OpenAI", "anthropic": "Anthropic", "mock": "Mock"}
+
+
+class LLMProviderError(Exception):
+    """A provider call failed. `status_code` is None for transport errors."""
+
+    def __init__(self, provider: str, status_code: int | None = None) -> None:
+        super().__init__(f"{provider} failed with status {status_code}")
+        self.provider = provider
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        """Outages and overload are worth failing over; auth / model errors are not."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+    def user_message(self) -> str:
+        label = _PROVIDER_LABELS.get(self.provider, self.provider)
+        if self.status_code is None:
+            return f"{label} Error: the provider could not be reached. Please retry shortly."
+        return f"{label} Error: {self.status_code} - Check your API key or model name."
+
+
+def _fallback_candidate(provider: str, plan_config: dict) -> Tuple[str, str, str] | None:
+    """(provider, model, platform api key) for a failover target, if the platform has a key for it."""
+    if provider == "groq":
+        return ("groq", plan_config.get("model", "llama3-8b-8192"), settings.groq_api_key)
+    if provider == "openai" and settings.openai_api_key:
+        return ("openai", settings.openai_fallback_model, settings.openai_api_key)
+    if provider == "anthropic" and settings.anthropic_api_key:
+        return ("anthropic", settings.anthropic_fallback_model, settings.anthropic_api_key)
+    return None
+
+
+async def _provider_stream(
+    org_plan: PlanName,
+    prompt: ChatPrompt,
+    ai_provider: str,
+    ai_model: str | None,
+    ai_api_key: str | None,
+    fallback_provider: str | None,
+    usage: LLMUsage,
+    slot: LLMSlot | None = None,
 ) -> AsyncGenerator[str, None]:
-    """Stream chat completion supporting multi-model and BYOK via HTTPx."""
     plan_config = get_plan_limits(org_plan)
     
     # Use org specific model if defined, otherwise grab from plan/defaults
     model = (ai_model and ai_model.strip()) or plan_config.get("model", "llama3-8b-8192")
-    
-    if ai_provider == "openai":
-        import httpx
-        import json
-        api_key = (ai_api_key and ai_api_key.strip())
+    api_key = ai_api_key and ai_api_key.strip()
+
+    if ai_provider in ("openai", "anthropic"):
         if not api_key:
-            yield "Configure an OpenAI API key in Organization Settings to use OpenAI."
+            label = _PROVIDER_LABELS[ai_provider]
+            yield f"Configure an {label} API key in Organization Settings to use {label}."
+            return
+    elif ai_provider == "mock":
+        # Offline load-test provider; OpenAI-compatible, needs no key
+        if not settings.mock_llm_enabled:
+            yield "The mock AI provider is not enabled on this deployment."
             return
-            
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST", 
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}"},
-                json={"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}
-            ) as response:
-                if response.status_code != 200:
-                    yield f"OpenAI Error: {response.status_code} - Check your API key or model name."
-                    return
-                async for line in response.aiter_lines():
-                    if line.startswith("data: ") and line != "data: [DONE]":
-                        try:
-                            data = json.loads(line[6:])
-                            delta = data["choices"][0].get("delta", {}).get("content", "")
+        model = (ai_model and ai_model.strip()) or "mock"
+        api_key = "mock"
+    else:
+        # Default Groq provider — falls back to the platform key
+        ai_provider = "groq"
+        api_key = api_key or settings.groq_api_key
+
+    candidates = [(ai_provider, model, api_key)]
+    if plan_config.get("llm_failover") and fallback_provider and fallback_provider != ai_provider:
+        fallback = _fallback_candidate(fallback_provider, plan_config)
+        if fallback:
+            candidates.append(fallback)
+
+    emitted = False
+    try:
+        async with aclosing(_failover_stream(
+            candidates, prompt, plan_config.get("llm_hedge_after_ms"), usage, slot
+        )) as stream:
+            async for delta in stream:
+                emitted = True
+                yield delta
+    except LLMProviderError as exc:
+        if emitted:
+            raise
+        usage.provider = None  # failed before any output: nothing to meter
+        yield exc.user_message()
+
+
+def _open_stream(
+    provider: str, model: str, api_key: str, prompt: ChatPrompt, usage: LLMUsage
+) -> AsyncGenerator[str, None]:
+    usage.provider = provider
+    usage.model = model
+    if provider == "anthropic":
+        return _stream_anthropic(api_key, model, prompt, usage)
+    return _stream_openai_compatible(provider, api_key, model, prompt, usage)
+
+
+@asynccontextmanager
+async def _hold_slot(slot: LLMSlot | None, provider: str) -> AsyncIterator[None]:
+    """Hold a scheduler slot for `provider` while streaming from it; released on exit."""
+    if slot is None:
+        yield
+        return
+    held = await slot.for_provider(provider)
+    try:
+        yield
+    finally:
+        held.release()
+
+
+async def _failover_stream(
+    candidates: List[Tuple[str, str, str]],
+    prompt: ChatPrompt,
+    hedge_after_ms: int | None,
+    usage: LLMUsage,
+    slot: LLMSlot | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Stream from the first candidate, falling back to the second one.
+
+    Before the first token, a retryable error on the primary fails over to
+    the secondary; with `hedge_after_ms` set, a primary that has not produced
+    a token by then gets a hedged request to the secondary and whichever
+    starts streaming first wins (the other is closed). Once a token has been
+    sent there is no switching. Providers whose circuit breaker is open are
+    skipped as long as another candidate remains.
+    """
+    usable = [c for c in candidates if get_breaker(c[0]).allow()] or candidates[:1]
+    if len(usable) == 1:
+        provider, model, api_key = usable[0]
+        breaker = get_breaker(provider)
+        started = False
+        try:
+            async with (
+                _hold_slot(slot, provider),
+                aclosing(_open_stream(provider, model, api_key, prompt, usage)) as stream,
+            ):
+                async for delta in stream:
+                    if not started:
+                        started = True
+                        breaker.record_success()
+                    yield delta
+        except LLMProviderError as exc:
+            if exc.retryable:
+                breaker.record_failure()
+            raise
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    pumps: dict[int, asyncio.Task] = {}
+    usages = [LLMUsage(), LLMUsage()]
+
+    async def pump(index: int) -> None:
+        provider, model, api_key = usable[index]
+        breaker = get_breaker(provider)
+        started = False
+        try:
+            async with (
+                _hold_slot(slot, provider),
+                aclosing(_open_stream(provider, model, api_key, prompt, usages[index])) as stream,
+            ):
+                async for delta in stream:
+                    if not started:
+                        started = True
+                        breaker.record_success()
+                    await queue.put((index, delta))
+            await queue.put((index, _STREAM_END))
+        except LLMProviderError as exc:
+            if exc.retryable:
+                breaker.record_failure()
+            await queue.put((index, _StreamError(exc)))
+        except Exception as exc:
+            await queue.put((index, _StreamError(exc)))
+
+    def launch(index: int) -> None:
+        pumps[index] = asyncio.create_task(pump(index))
+
+    async def stop(index: int) -> None:
+        task = pumps.get(index)
+        if task is not None and not task.done():
+            task.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait({task})
+
+    primary, secondary = usable[0][0], usable[1][0]
+    launch(0)
+    hedge_at = None if hedge_after_ms is None else loop.time() + hedge_after_ms / 1000
+    winner: int | None = None
+    errors: dict[int, BaseException] = {}
+    try:
+        while winner is None:
+            timeout = None if hedge_at is None else max(0.0, hedge_at - loop.time())
+            try:
+                index, item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                hedge_at = None
+                if 1 not in pumps:
+                    metrics.inc("llm_hedged", primary=primary, secondary=secondary)
+                    launch(1)
+                continue
+            if isinstance(item, _StreamError):
+                errors[index] = item.exc
+                retryable = isinstance(item.exc, LLMProviderError) and item.exc.retryable
+                if index == 0 and 1 not in pumps:
+                    if not retryable:
+                        raise item.exc
+                    metrics.inc("llm_failover", primary=primary, secondary=secondary)
+                    hedge_at = None
+                    launch(1)
+                elif len(errors) == len(pumps):
+                    raise errors[0]  # both failed: surface the primary's error
+                continue
+            winner = index
+            if 1 in pumps:
+                metrics.inc("llm_hedge_won", provider=usable[index][0])
+                await stop(1 - index)
+            if item is _STREAM_END:
+                return
+            yield item
+
+        while True:
+            index, item = await queue.get()
+            if index != winner:
+                continue
+            if item is _STREAM_END:
+                return
+            if isinstance(item, _StreamError):
+                raise item.exc
+            yield item
+    finally:
+        for index in list(pumps):
+            await stop(index)
+        if winner is not None:
+            usage.copy_from(usages[winner])
+
+
+def _openai_messages(prompt: ChatPrompt) -> List[dict]:
+    # Stable system prefix first: OpenAI and Groq cache matching prompt
+    # prefixes automatically, no request flags needed.
+    messages = [{"role": "system", "content": prompt.system}] if prompt.system else []
+    if prompt.summary:
+        messages.append({"role": "system", "content": prompt.summary_text()})
+    for question, answer in prompt.turns:
+        messages.append({"role": "user", "content": question})
+        messages.append({"role": "assistant", "content": answer})
+    messages.append({"role": "user", "content": "\n\n".join(prompt.user_parts())})
+    return messages
+
+
+def _read_openai_usage(data: dict, usage: LLMUsage) -> None:
+    # OpenAI sends a final chunk with `usage` (stream_options.include_usage);
+    # Groq also reports it under `x_groq.usage`.
+    reported = data.get("usage") or (data.get("x_groq") or {}).get("usage")
+    if not reported:
+        return
+    usage.prompt_tokens = reported.get("prompt_tokens")
+    usage.completion_tokens = reported.get("completion_tokens")
+    details = reported.get("prompt_tokens_details") or {}
+    usage.cached_prompt_tokens = details.get("cached_tokens")
+
+
+async def _stream_openai_compatible(
+    provider: str,
+    api_key: str,
+    model: str,
+    prompt: ChatPrompt,
+    usage: LLMUsage,
+) -> AsyncGenerator[str, None]:
+    """Stream content deltas from an OpenAI-style /v1/chat/completions SSE endpoint."""
+    client = get_llm_http_client(provider)
+    try:
+        async with client.stream(
+            "POST",
+            "/v1/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={
+                "model": model,
+                "messages": _openai_messages(prompt),
+                "stream": True,
+                "stream_options": {"include_usage": True},
+            },
+        ) as response:
+            if response.status_code != 200:
+                raise LLMProviderError(provider, response.status_code)
+            async for line in response.aiter_lines():
+                if line.startswith("data: ") and line != "data: [DONE]":
+                    try:
+                        data = json.loads(line[6:])
+                        _read_openai_usage(data, usage)
+                        if not data.get("choices"):
+                            continue
+                        delta = data["choices"][0].get("delta", {}).get("content", "")
+                        if delta:
+                            yield delta
+                    except Exception:
+                        pass
+    except httpx.TransportError as exc:
+        raise LLMProviderError(provider) from exc
+
+
+def _anthropic_payload(model: str, prompt: ChatPrompt) -> dict:
+    messages: List[dict] = []
+    for question, answer in prompt.turns:
+        messages.append({"role": "user", "content": [{"type": "text", "text": question}]})
+        messages.append({"role": "assistant", "content": [{"type": "text", "text": answer}]})
+    if messages:
+        # Second breakpoint after the replayed turns: while the verbatim window
+        # is still filling up, the next request extends this prefix unchanged.
+        messages[-1]["content"][-1]["cache_control"] = {"type": "ephemeral"}
+    messages.append({
+        "role": "user",
+        "content": [{"type": "text", "text": part} for part in prompt.user_parts()],
+    })
+    payload: dict = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 1024,
+        "stream": True,
+    }
+    system: List[dict] = []
+    if prompt.system:
+        # Explicit cache breakpoint after the static instructions; Anthropic
+        # ignores it while the prefix is below the model's minimum size.
+        system.append({"type": "text", "text": prompt.system, "cache_control": {"type": "ephemeral"}})
+    if prompt.summary:
+        system.append({"type": "text", "text": prompt.summary_text()})
+    if system:
+        payload["system"] = system
+    return payload
+
+
+def _read_anthropic_usage(data: dict, usage: LLMUsage) -> None:
+    if data.get("type") == "message_start":
+        reported = (data.get("message") or {}).get("usage") or {}
+        cached = reported.get("cache_read_input_tokens") or 0
+        written = reported.get("cache_creation_input_tokens") or 0
+        # input_tokens excludes tokens read from / written to the cache
+        usage.prompt_tokens = (reported.get("input_tokens") or 0) + cached + written
+        usage.cached_prompt_tokens = cached
+        usage.cache_write_tokens = written
+    elif data.get("type") == "message_delta":
+        reported = data.get("usage") or {}
+        if "output_tokens" in reported:
+            usage.completion_tokens = reported["output_tokens"]
+
+
+async def _stream_anthropic(
+    api_key: str,
+    model: str,
+    prompt: ChatPrompt,
+    usage: LLMUsage,
+) -> AsyncGenerator[str, None]:
+    """Stream text deltas from Anthropic's /v1/messages SSE endpoint."""
+    client = get_llm_http_client("anthropic")
+    try:
+        async with client.stream(
+            "POST",
+            "/v1/messages",
+            headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+            json=_anthropic_payload(model, prompt),
+        ) as response:
+            if response.status_code != 200:
+                raise LLMProviderError("anthropic", response.status_code)
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    try:
+                        data = json.loads(line[6:])
+                        if data.get("type") == "content_block_delta":
+                            delta = data.get("delta", {}).get("text", "")
                             if delta:
                                 yield delta
-                        except Exception:
-                            pass
-                            
-    elif ai_provider == "anthropic":
-        import httpx
-        import json
-        api_key = (ai_api_key and ai_api_key.strip())
-        if not api_key:
-            yield "Configure an Anthropic API key in Organization Settings to use Anthropic."
+                        else:
+                            _read_anthropic_usage(data, usage)
+                    except Exception:
+                        pass
+    except httpx.TransportError as exc:
+        raise LLMProviderError("anthropic") from exc
+
+
+class _StreamError:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+_STREAM_END = object()
+_FLUSH_DUE = object()
+
+
+async def coalesce_tokens(
+    source: AsyncGenerator[str, None],
+    flush_ms: int,
+    flush_bytes: int,
+) -> AsyncGenerator[str, None]:
+    """
+    Merge small provider deltas into fewer, larger chunks.
+
+    The first token is passed through untouched so time to first token does
+    not change; after that, buffered text is flushed every `flush_ms`
+    milliseconds or once it reaches `flush_bytes`, whichever comes first
+    (0 disables that trigger; both 0 passes deltas through one by one).
+    The source is drained by a pump task and the interval is a loop timer,
+    so a timed flush never waits for the next delta to arrive.
+    """
+    if flush_ms <= 0 and flush_bytes <= 0:
+        async with aclosing(source):
+            async for token in source:
+                yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+
+    async def pump() -> None:
+        try:
+            async for token in source:
+                await queue.put(token)
+            await queue.put(_STREAM_END)
+        except Exception as exc:
+            await queue.put(_StreamError(exc))
+        finally:
+            await source.aclose()
+
+    def flush_due() -> None:
+        try:
+            queue.put_nowait(_FLUSH_DUE)
+        except asyncio.QueueFull:
+            pass  # the consumer is behind and will flush on the next delta
+
+    pump_task = asyncio.create_task(pump())
+    buffer: list[str] = []
+    buffered_bytes = 0
+    timer: asyncio.TimerHandle | None = None
+    deltas = frames = 0
+    try:
+        item = await queue.get()
+        if item is _STREAM_END:
             return
-            
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST", 
-                "https://api.anthropic.com/v1/messages",
-                headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
-                json={"model": model, "messages": [{"role": "user", "content": prompt}], "max_tokens": 1024, "stream": True}
-            ) as response:
-                if response.status_code != 200:
-                    yield f"Anthropic Error: {response.status_code} - Check your API key or model name."
-                    return
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        try:
-                            data = json.loads(line[6:])
-                            if data.get("type") == "content_block_delta":
-                                delta = data.get("delta", {}).get("text", "")
-                                if delta:
-                                    yield delta
-                        except Exception:
-                            pass
-                            
-    else:
-        # Default Groq provider
-        api_key = (ai_api_key and ai_api_key.strip()) or settings.groq_api_key
-        client = Groq(api_key=api_key)
-        stream = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=model,
-            stream=True,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        for chunk in stream:
-            delta = chunk.choices[0].delta
-            if delta and delta.content:
-                yield delta.content
+        if isinstance(item, _StreamError):
+            raise item.exc
+        deltas += 1
+        frames += 1
+        yield item
+        while True:
+            item = await queue.get()
+            if isinstance(item, str):
+                deltas += 1
+                buffer.append(item)
+                buffered_bytes += len(item.encode())
+                if timer is None and flush_ms > 0:
+                    timer = loop.call_later(flush_ms / 1000, flush_due)
+                if timer is not None and timer.when() <= loop.time():
+                    item = _FLUSH_DUE
+                elif flush_bytes <= 0 or buffered_bytes < flush_bytes:
+                    continue
+            if buffer:
+                frames += 1
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_bytes = 0
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if item is _STREAM_END:
+                break
+            if isinstance(item, _StreamError):
+                raise item.exc
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not pump_task.done():
+            pump_task.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.wait({pump_task})
+        metrics.inc("sse_deltas_in", deltas)
+        metrics.inc("sse_frames_out", frames)
 
 
-async def sse_chat_response(generator: AsyncGenerator[str, None]) -> EventSourceResponse:
-    async def event_publisher() -> AsyncGenerator[dict[str, str], None]:
-        async for token in generator:
-            yield {"data": token}
-        yield {"event": "end", "data": "[DONE]"}
+async def sse_chat_response(
+    generator: AsyncGenerator[str, None],
+    background: BackgroundTask | None = None,
+    flush_ms: int | None = None,
+    flush_bytes: int | None = None,
+) -> EventSourceResponse:
+    """
+    Stream `generator` as SSE `data` events followed by an `end` event.
+    Tokens are coalesced per `coalesce_tokens`; `flush_ms` / `flush_bytes`
+    default to SSE_FLUSH_INTERVAL_MS / SSE_FLUSH_MAX_BYTES.
+    """
+    stream = coalesce_tokens(
+        generator,
+        settings.sse_flush_interval_ms if flush_ms is None else flush_ms,
+        settings.sse_flush_max_bytes if flush_bytes is None else flush_bytes,
+    )
 
-    return EventSourceResponse(event_publisher())
+    async def event_publisher() -> AsyncGenerator[dict[str, str], None]:
+        try:
+            async for token in stream:
+                yield {"data": token}
+            yield {"event": "end", "data": "[DONE]"}
+        finally:
+            # On client disconnect sse-starlette cancels this task, possibly
+            # while we are parked at a yield. Close the token generators right
+            # away (shielded, since the scope is already cancelled) so the
+            # upstream LLM stream is torn down now rather than at GC time.
+            with anyio.CancelScope(shield=True):
+                await stream.aclose()
+                await generator.aclose()
 
+    # `background` runs once the response ends, even if the client disconnected
+    # before the generator started — use it for cleanup that must not leak.
+    return EventSourceResponse(event_publisher(), background=background)
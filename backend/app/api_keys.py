@@ -0,0 +1,180 @@
+"""
+API-key authentication (`Authorization: Bearer aurora_...`).
+
+Keys are looked up by SHA-256 hash through the unique `ix_api_keys_key_hash`
+index and act as the member who created them. Lookups are cached per worker
+in one LRU. A known key is cached for API_KEY_CACHE_TTL_SECONDS. An unknown
+or revoked hash is cached for API_KEY_NEGATIVE_CACHE_TTL_SECONDS, so a client
+retrying a bad key does not reach the database each time. Revoking a key
+evicts it on the worker that handled the revoke; other workers stop
+accepting it within the TTL.
+
+`last_used_at` is not written per request. `api_key_usage` keeps the latest
+use of each key and writes them all in one UPDATE every
+API_KEY_LAST_USED_FLUSH_SECONDS. The app lifespan starts it and flushes it
+on shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, Union
+from uuid import UUID
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+from .config import get_settings
+from .db import SessionLocal
+from .models import ApiKey
+from .security import hash_api_key
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+API_KEY_PREFIX = "aurora_"
+
+
+class ApiKeyIdentity:
+    """The parts of an active ApiKey row that authentication needs."""
+
+    __slots__ = ("id", "org_id", "user_id")
+
+    def __init__(self, id: UUID, org_id: UUID, user_id: Optional[UUID]) -> None:
+        self.id = id
+        self.org_id = org_id
+        self.user_id = user_id
+
+
+_MISS = object()
+
+
+class ApiKeyCache:
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[ApiKeyIdentity]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash: str) -> Union[ApiKeyIdentity, None, object]:
+        """The cached identity, None for a cached unknown key, or _MISS."""
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return _MISS
+            if entry[0] < time.monotonic():
+                del self._entries[key_hash]
+                return _MISS
+            self._entries.move_to_end(key_hash)
+            return entry[1]
+
+    def put(self, key_hash: str, identity: Optional[ApiKeyIdentity]) -> None:
+        ttl = self.ttl if identity is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + ttl, identity)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, key_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+
+api_key_cache = ApiKeyCache(
+    ttl=settings.api_key_cache_ttl_seconds,
+    negative_ttl=settings.api_key_negative_cache_ttl_seconds,
+    max_entries=settings.api_key_cache_max_entries,
+)
+
+
+def _write_last_used(batch: Dict[UUID, datetime]) -> None:
+    with SessionLocal() as db:
+        db.execute(update(ApiKey), [{"id": key_id, "last_used_at": ts} for key_id, ts in batch.items()])
+        db.commit()
+
+
+class ApiKeyUsageRecorder:
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._pending: Dict[UUID, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def touch(self, key_id: UUID) -> None:
+        self._pending[key_id] = datetime.now(timezone.utc)
+        if not self.running:
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await run_in_threadpool(_write_last_used, batch)
+        except Exception:
+            logger.exception("Failed to write last_used_at for %d API keys", len(batch))
+            # Keep them for the next flush unless a newer use replaced them
+            for key_id, ts in batch.items():
+                self._pending.setdefault(key_id, ts)
+            return
+        metrics.observe("api_key_last_used_batch", len(batch))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.flush()
+
+
+api_key_usage = ApiKeyUsageRecorder(interval_seconds=settings.api_key_last_used_flush_seconds)
+
+
+def _lookup(db: Session, key_hash: str) -> Optional[ApiKeyIdentity]:
+    row = (
+        db.query(ApiKey.id, ApiKey.org_id, ApiKey.created_by)
+        .filter(ApiKey.key_hash == key_hash, ApiKey.revoked_at.is_(None))
+        .first()
+    )
+    return ApiKeyIdentity(row.id, row.org_id, row.created_by) if row is not None else None
+
+
+async def resolve_api_key(db: Session, raw_key: str) -> Optional[ApiKeyIdentity]:
+    """The active key matching `raw_key`, or None; records the use."""
+    key_hash = hash_api_key(raw_key)
+    identity = api_key_cache.get(key_hash)
+    if identity is _MISS:
+        identity = await run_in_threadpool(_lookup, db, key_hash)
+        api_key_cache.put(key_hash, identity)
+        metrics.inc("api_key_cache", tier="db")
+    else:
+        metrics.inc("api_key_cache", tier="local")
+    if identity is not None:
+        await api_key_usage.touch(identity.id)
+    return identity  # type: ignore[return-value]
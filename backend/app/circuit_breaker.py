@@ -0,0 +1,77 @@
+"""
+Per-provider circuit breakers for outbound LLM calls.
+
+A breaker opens after LLM_BREAKER_FAILURE_THRESHOLD consecutive hard
+failures and stays open for LLM_BREAKER_COOLDOWN_SECONDS. After that one
+probe request is let through (half-open): success closes the breaker,
+failure re-opens it.
+"""
+import time
+from typing import Dict, Optional
+
+from . import metrics
+from .config import get_settings
+
+
+settings = get_settings()
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, cooldown_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a request may go to this provider now. Claims the probe when half-open."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        # A probe that never reported back (e.g. its client went away) expires
+        if self._probe_started_at is None or now - self._probe_started_at >= self.cooldown_seconds:
+            self._probe_started_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            metrics.set_gauge("llm_breaker_open", 0, provider=self.name)
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probe_started_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+            metrics.inc("llm_breaker_trips", provider=self.name)
+            metrics.set_gauge("llm_breaker_open", 1, provider=self.name)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = _breakers[provider] = CircuitBreaker(
+            provider,
+            failure_threshold=settings.llm_breaker_failure_threshold,
+            cooldown_seconds=settings.llm_breaker_cooldown_seconds,
+        )
+    return breaker
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import List, Literal
+from typing import List, Literal, Optional
 
 from pydantic import AnyHttpUrl, Field
 from pydantic_settings import BaseSettings
@@ -16,11 +16,49 @@ class Settings(BaseSettings):
 
     jwt_secret: str = Field(..., alias="JWT_SECRET")
     jwt_algorithm: str = Field("HS256", alias="JWT_ALGORITHM")
+    # bcrypt cost and the bounded pool it runs on (0 workers = half the CPUs)
+    bcrypt_rounds: int = Field(12, alias="BCRYPT_ROUNDS")
+    password_hash_workers: int = Field(0, alias="PASSWORD_HASH_WORKERS")
+    password_hash_max_queue: int = Field(64, alias="PASSWORD_HASH_MAX_QUEUE")
     access_token_expire_minutes: int = Field(15, alias="ACCESS_TOKEN_EXPIRE_MINUTES")
     refresh_token_expire_days: int = Field(7, alias="REFRESH_TOKEN_EXPIRE_DAYS")
 
     database_url: str = Field(..., alias="DATABASE_URL")
     redis_url: str = Field(..., alias="REDIS_URL")
+    # Redis connection pool: size, how long a command waits for a free
+    # connection, socket timeouts and the idle-connection PING interval
+    redis_max_connections: int = Field(50, alias="REDIS_MAX_CONNECTIONS")
+    redis_pool_timeout_seconds: float = Field(1.0, alias="REDIS_POOL_TIMEOUT_SECONDS")
+    redis_socket_timeout_seconds: float = Field(2.0, alias="REDIS_SOCKET_TIMEOUT_SECONDS")
+    redis_connect_timeout_seconds: float = Field(1.0, alias="REDIS_CONNECT_TIMEOUT_SECONDS")
+    redis_health_check_interval_seconds: int = Field(30, alias="REDIS_HEALTH_CHECK_INTERVAL_SECONDS")
+    # Keys kept in the per-worker, tracking-invalidated Redis cache (0 = off)
+    redis_client_cache_max_keys: int = Field(10_000, alias="REDIS_CLIENT_CACHE_MAX_KEYS")
+    # Principal (user/org) cache behind get_current_user / get_current_org:
+    # per-worker TTL + shared Redis TTL (0 disables a tier)
+    principal_cache_local_ttl_seconds: float = Field(5.0, alias="PRINCIPAL_CACHE_LOCAL_TTL_SECONDS")
+    principal_cache_ttl_seconds: int = Field(60, alias="PRINCIPAL_CACHE_TTL_SECONDS")
+    principal_cache_max_entries: int = Field(10_000, alias="PRINCIPAL_CACHE_MAX_ENTRIES")
+    # Two-tier rate limiter: tokens leased from Redis per worker and key, and
+    # how long to use per-worker fallback limits after a Redis error
+    rate_limit_lease_ttl_seconds: float = Field(2.0, alias="RATE_LIMIT_LEASE_TTL_SECONDS")
+    rate_limit_max_lease: int = Field(16, alias="RATE_LIMIT_MAX_LEASE")
+    rate_limit_local_max_keys: int = Field(10_000, alias="RATE_LIMIT_LOCAL_MAX_KEYS")
+    rate_limit_redis_retry_seconds: float = Field(5.0, alias="RATE_LIMIT_REDIS_RETRY_SECONDS")
+    # Refresh-token blocklist: one Bloom filter per window of token expiry,
+    # each sized for `capacity` revocations at `error_rate` false positives
+    token_blocklist_window_hours: float = Field(24.0, alias="TOKEN_BLOCKLIST_WINDOW_HOURS")
+    token_blocklist_capacity: int = Field(100_000, alias="TOKEN_BLOCKLIST_CAPACITY")
+    token_blocklist_error_rate: float = Field(0.001, alias="TOKEN_BLOCKLIST_ERROR_RATE")
+    # Auth limits apply before the caller's plan is known: per IP and per email
+    register_rate_limit_per_hour: int = Field(5, alias="REGISTER_RATE_LIMIT_PER_HOUR")
+    login_rate_limit_per_minute: int = Field(10, alias="LOGIN_RATE_LIMIT_PER_MINUTE")
+    # API-key auth (Bearer aurora_...): per-worker lookup cache for known and
+    # unknown key hashes, and how often last_used_at is written back
+    api_key_cache_ttl_seconds: float = Field(30.0, alias="API_KEY_CACHE_TTL_SECONDS")
+    api_key_negative_cache_ttl_seconds: float = Field(10.0, alias="API_KEY_NEGATIVE_CACHE_TTL_SECONDS")
+    api_key_cache_max_entries: int = Field(10_000, alias="API_KEY_CACHE_MAX_ENTRIES")
+    api_key_last_used_flush_seconds: float = Field(60.0, alias="API_KEY_LAST_USED_FLUSH_SECONDS")
 
     stripe_secret_key: str = Field(..., alias="STRIPE_SECRET_KEY")
     stripe_webhook_secret: str = Field(..., alias="STRIPE_WEBHOOK_SECRET")
@@ -30,7 +68,60 @@ class Settings(BaseSettings):
     stripe_customer_portal_return_url: str = Field(..., alias="STRIPE_CUSTOMER_PORTAL_RETURN_URL")
 
     groq_api_key: str = Field(..., alias="GROQ_API_KEY")
+    groq_base_url: str = Field("https://api.groq.com/openai", alias="GROQ_BASE_URL")
+    openai_base_url: str = Field("https://api.openai.com", alias="OPENAI_BASE_URL")
+    anthropic_base_url: str = Field("https://api.anthropic.com", alias="ANTHROPIC_BASE_URL")
+    # Optional platform keys, used only when an org fails over to these providers
+    openai_api_key: Optional[str] = Field(None, alias="OPENAI_API_KEY")
+    anthropic_api_key: Optional[str] = Field(None, alias="ANTHROPIC_API_KEY")
+    openai_fallback_model: str = Field("gpt-4o-mini", alias="OPENAI_FALLBACK_MODEL")
+    anthropic_fallback_model: str = Field("claude-3-5-haiku-latest", alias="ANTHROPIC_FALLBACK_MODEL")
+    # Offline `mock` ai_provider (python -m backend.app.mock_llm); never enable in production
+    mock_llm_enabled: bool = Field(False, alias="MOCK_LLM_ENABLED")
+    mock_llm_base_url: str = Field("http://127.0.0.1:8090", alias="MOCK_LLM_BASE_URL")
+    # Per-provider circuit breaker for failover / hedging
+    llm_breaker_failure_threshold: int = Field(5, alias="LLM_BREAKER_FAILURE_THRESHOLD")
+    llm_breaker_cooldown_seconds: float = Field(30.0, alias="LLM_BREAKER_COOLDOWN_SECONDS")
+    # Pooled keep-alive HTTP clients used for Groq / OpenAI / Anthropic streaming
+    llm_http_max_connections: int = Field(100, alias="LLM_HTTP_MAX_CONNECTIONS")
+    llm_http_max_keepalive_connections: int = Field(20, alias="LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    llm_http_keepalive_expiry_seconds: float = Field(60.0, alias="LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS")
+    llm_http_connect_timeout_seconds: float = Field(5.0, alias="LLM_HTTP_CONNECT_TIMEOUT_SECONDS")
+    llm_http_read_timeout_seconds: float = Field(60.0, alias="LLM_HTTP_READ_TIMEOUT_SECONDS")
+    # Admission scheduler in front of LLM calls (per worker process)
+    llm_max_concurrency: int = Field(64, alias="LLM_MAX_CONCURRENCY")
+    llm_provider_max_concurrency: int = Field(32, alias="LLM_PROVIDER_MAX_CONCURRENCY")
+    llm_queue_max_depth: int = Field(100, alias="LLM_QUEUE_MAX_DEPTH")  # per plan
+    llm_queue_max_wait_seconds: float = Field(30.0, alias="LLM_QUEUE_MAX_WAIT_SECONDS")
+    # Max LLM calls in flight per POST /assistant/batch request
+    assistant_batch_concurrency: int = Field(5, alias="ASSISTANT_BATCH_CONCURRENCY")
+    # Chat SSE coalescing: buffered tokens are sent every N ms or M bytes,
+    # whichever comes first (0 and 0 = one event per provider delta)
+    sse_flush_interval_ms: int = Field(40, alias="SSE_FLUSH_INTERVAL_MS")
+    sse_flush_max_bytes: int = Field(256, alias="SSE_FLUSH_MAX_BYTES")
+    # Multi-turn chat memory: the last N exchanges go into the prompt verbatim,
+    # older ones are folded into a rolling summary capped at M characters
+    conversation_memory_turns: int = Field(3, alias="CONVERSATION_MEMORY_TURNS")
+    conversation_summary_max_chars: int = Field(2000, alias="CONVERSATION_SUMMARY_MAX_CHARS")
+    # Finished chat answers are batch-written every N ms, or at once when M are
+    # waiting (0 ms = write each answer as its stream ends)
+    chat_write_behind_interval_ms: int = Field(250, alias="CHAT_WRITE_BEHIND_INTERVAL_MS")
+    chat_write_behind_max_batch: int = Field(200, alias="CHAT_WRITE_BEHIND_MAX_BATCH")
+    # AI query / document counters live in Redis: pending deltas are upserted
+    # into `usage` every N seconds (0 = never, counts go to the database
+    # directly), and each counter is reseeded from `usage` after M seconds
+    usage_flush_interval_seconds: float = Field(5.0, alias="USAGE_FLUSH_INTERVAL_SECONDS")
+    usage_counter_reseed_seconds: int = Field(300, alias="USAGE_COUNTER_RESEED_SECONDS")
     chroma_persist_directory: str = Field("chroma_db", alias="CHROMA_PERSIST_DIRECTORY")
+    # "sentence-transformers" (default) or "hashing" for a fully offline embedding
+    embedding_backend: str = Field("sentence-transformers", alias="EMBEDDING_BACKEND")
+    # Run orphan cleanup + compaction of the vector store in-process every N minutes (0 = off)
+    vector_maintenance_interval_minutes: int = Field(0, alias="VECTOR_MAINTENANCE_INTERVAL_MINUTES")
+
+    # Startup warm-up: preload collections of the N most active orgs (0 = off)
+    warmup_top_orgs: int = Field(20, alias="WARMUP_TOP_ORGS")
+    warmup_lookback_days: int = Field(7, alias="WARMUP_LOOKBACK_DAYS")
+    warmup_timeout_seconds: float = Field(60.0, alias="WARMUP_TIMEOUT_SECONDS")
 
     frontend_origin: AnyHttpUrl = Field("http://localhost:5173", alias="FRONTEND_ORIGIN")
 
@@ -53,29 +144,47 @@ PLAN_LIMITS = {
     "free": {
         "max_users": 1,
         "max_ai_queries": 50,
+        "max_ai_tokens": 200_000,  # prompt + completion tokens per period
         "max_documents": 5,
+        "chat_requests_per_minute": 10,
+        "batch_requests_per_minute": 5,
         "conversation_history": False,
         "audit_log": False,
         "model": "llama-3.1-8b-instant",
         "priority_queue": False,
+        "queue_weight": 1,
+        "llm_failover": False,
+        "llm_hedge_after_ms": None,
     },
     "pro": {
         "max_users": 5,
         "max_ai_queries": 500,
+        "max_ai_tokens": 5_000_000,
         "max_documents": None,
+        "chat_requests_per_minute": 30,
+        "batch_requests_per_minute": 15,
         "conversation_history": True,
         "audit_log": True,
         "model": "llama-3.1-8b-instant",
         "priority_queue": False,
+        "queue_weight": 4,
+        "llm_failover": True,
+        "llm_hedge_after_ms": None,
     },
     "enterprise": {
         "max_users": None,
         "max_ai_queries": None,
+        "max_ai_tokens": None,
         "max_documents": None,
+        "chat_requests_per_minute": 120,
+        "batch_requests_per_minute": 60,
         "conversation_history": True,
         "audit_log": True,
         "model": "llama-3.3-70b-versatile",
         "priority_queue": True,
+        "queue_weight": 16,
+        "llm_failover": True,
+        "llm_hedge_after_ms": 1500,
     },
 }
 
@@ -0,0 +1,251 @@
+"""
+Bounded conversation memory for multi-turn chat.
+
+A chat prompt carries the conversation's rolling summary plus its last
+CONVERSATION_MEMORY_TURNS exchanges verbatim, so prompt tokens per turn stay
+bounded however long the conversation gets. After each exchange, messages
+that slid out of the verbatim window are folded into `Conversation.summary`
+with one short LLM call over the previous summary and the evicted turns.
+If that call fails, a plain extractive digest is used instead so the window
+always advances. `Conversation.summarized_messages` counts the messages the
+summary covers.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .ai import ChatPrompt, LLMUsage, stream_chat_completion
+from .config import PlanName, get_settings
+from .db import SessionLocal
+from .dependencies import add_token_usage
+from .llm_scheduler import QueueFull, scheduler
+from .models import Conversation, Message
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI data analyst. "
+    "Merge the new exchanges into the existing summary. Keep the facts, figures, entities and "
+    "open questions a follow-up question could refer to; drop greetings and formatting. "
+    "Reply with the updated summary only, as plain text, in at most {max_words} words."
+)
+
+Turn = Tuple[str, str]
+
+
+def _pair_turns(messages: Sequence[Message]) -> List[Turn]:
+    """(question, answer) pairs; unanswered questions and empty answers are dropped."""
+    turns: List[Turn] = []
+    question: Optional[str] = None
+    for msg in messages:
+        if msg.role == "user":
+            question = msg.content
+        elif msg.role == "assistant" and question is not None:
+            if msg.content:
+                turns.append((question, msg.content))
+            question = None
+    return turns
+
+
+def load_history(db: Session, conversation: Conversation) -> Tuple[Optional[str], List[Turn]]:
+    """The summary and the last CONVERSATION_MEMORY_TURNS exchanges to replay in the next prompt."""
+    window = max(0, settings.conversation_memory_turns) * 2
+    recent: List[Message] = []
+    if window:
+        recent = (
+            db.query(Message)
+            .filter(Message.conversation_id == conversation.id)
+            .order_by(Message.created_at.desc())
+            .limit(window)
+            .all()
+        )
+    return conversation.summary, _pair_turns(recent[::-1])
+
+
+def _format_turns(turns: Sequence[Turn]) -> str:
+    return "\n\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+
+
+def _clip(summary: str, max_chars: int) -> str:
+    if len(summary) <= max_chars:
+        return summary
+    return summary[:max_chars].rsplit(" ", 1)[0]
+
+
+def extractive_summary(summary: Optional[str], turns: Sequence[Turn], max_chars: int) -> str:
+    """Fallback digest: one line per evicted exchange, oldest lines dropped to fit."""
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        lines.append(f"- Q: {question[:160]} A: {' '.join(answer.split())[:240]}")
+    while len(lines) > 1 and len("\n".join(lines)) > max_chars:
+        lines.pop(0)
+    return _clip("\n".join(lines), max_chars)
+
+
+def _scoped_session(org_id: UUID) -> Session:
+    db = SessionLocal()
+    try:
+        db.execute(text("SET LOCAL app.current_org_id = :org_id"), {"org_id": str(org_id)})
+    except Exception:
+        db.rollback()  # Non-Postgres dev databases have no RLS to satisfy
+    return db
+
+
+async def _summarize_with_llm(
+    plan: PlanName,
+    org_id: UUID,
+    summary: Optional[str],
+    turns: Sequence[Turn],
+    usage: LLMUsage,
+    ai_provider: Optional[str],
+    ai_model: Optional[str],
+    ai_api_key: Optional[str],
+) -> Optional[str]:
+    max_chars = settings.conversation_summary_max_chars
+    question = (
+        f"Existing summary:\n{summary or '(none)'}\n\n"
+        f"New exchanges:\n{_format_turns(turns)}"
+    )
+    prompt = ChatPrompt(SUMMARY_SYSTEM_PROMPT.format(max_words=max(20, max_chars // 7)), None, question)
+    try:
+        # Already-admitted follow-up work: queue for a slot rather than bounce
+        slot = await scheduler.acquire(plan, org_id, ai_provider or "groq", bounded=False)
+    except QueueFull:
+        return None
+    parts: List[str] = []
+    try:
+        async with aclosing(stream_chat_completion(
+            org_plan=plan,
+            prompt=prompt,
+            ai_provider=ai_provider,
+            ai_model=ai_model,
+            ai_api_key=ai_api_key,
+            usage=usage,
+            slot=slot,
+        )) as upstream:
+            async for token in upstream:
+                parts.append(token)
+    finally:
+        slot.release()
+    # Provider errors come back as user-facing text with no provider recorded
+    result = "".join(parts).strip()
+    if usage.provider is None or not result:
+        return None
+    return _clip(result, max_chars)
+
+
+def _load_evicted(
+    org_id: UUID, conversation_id: UUID, window: int
+) -> Optional[Tuple[Optional[str], int, int, List[Turn]]]:
+    """
+    (previous summary, messages it covers, new cover count, evicted turns),
+    or None when nothing has left the verbatim window.
+    """
+    with _scoped_session(org_id) as db:
+        conv = db.query(Conversation).filter(
+            Conversation.id == conversation_id,
+            Conversation.org_id == org_id,
+        ).first()
+        if conv is None:
+            return None
+        total = db.query(Message).filter(Message.conversation_id == conversation_id).count()
+        covered = conv.summarized_messages or 0
+        fold_until = total - window
+        if fold_until <= covered:
+            return None
+        # Conversations older than this feature can have a long backlog;
+        # summarise only the most recent evicted turns, not all of it.
+        start = max(covered, fold_until - max(window, 2))
+        evicted = (
+            db.query(Message)
+            .filter(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc())
+            .offset(start)
+            .limit(fold_until - start)
+            .all()
+        )
+        return conv.summary, covered, fold_until, _pair_turns(evicted)
+
+
+def _store_summary(
+    org_id: UUID,
+    conversation_id: UUID,
+    covered: int,
+    fold_until: int,
+    summary: str,
+    usage: LLMUsage,
+) -> bool:
+    """Save the new summary and meter the call; False if another refresh got there first."""
+    with _scoped_session(org_id) as db:
+        # Only the first of two racing refreshes for the same window wins
+        updated = db.query(Conversation).filter(
+            Conversation.id == conversation_id,
+            Conversation.summarized_messages == covered,
+        ).update(
+            {Conversation.summary: summary or None, Conversation.summarized_messages: fold_until},
+            synchronize_session=False,
+        )
+        # The summary call is metered like any other completion;
+        # add_token_usage commits both writes in this RLS-scoped transaction.
+        if usage.provider is not None:
+            add_token_usage(
+                db,
+                org_id,
+                usage.prompt_tokens or 0,
+                usage.completion_tokens or 0,
+                usage.cached_prompt_tokens or 0,
+            )
+        else:
+            db.commit()
+    return bool(updated)
+
+
+async def refresh_summary(
+    org_id: UUID,
+    conversation_id: UUID,
+    plan: PlanName,
+    ai_provider: Optional[str],
+    ai_model: Optional[str],
+    ai_api_key: Optional[str],
+) -> None:
+    """
+    Fold messages that left the verbatim window into the rolling summary.
+    Runs after the chat response has been sent; failures only cost memory
+    quality, so they are logged and swallowed. The database reads and the
+    write run in worker threads; only the LLM call runs on the event loop.
+    """
+    window = max(0, settings.conversation_memory_turns) * 2
+    try:
+        loaded = await asyncio.to_thread(_load_evicted, org_id, conversation_id, window)
+        if loaded is None:
+            return
+        previous, covered, fold_until, turns = loaded
+
+        usage = LLMUsage()
+        summary = None
+        if turns:
+            summary = await _summarize_with_llm(
+                plan, org_id, previous, turns, usage, ai_provider, ai_model, ai_api_key
+            )
+        mode = "llm" if summary is not None else "extractive"
+        if summary is None:
+            summary = extractive_summary(previous, turns, settings.conversation_summary_max_chars)
+
+        updated = await asyncio.to_thread(
+            _store_summary, org_id, conversation_id, covered, fold_until, summary, usage
+        )
+        if updated:
+            metrics.inc("conversation_summaries", mode=mode)
+            metrics.observe("conversation_summary_chars", len(summary))
+    except Exception:
+        logger.exception("Conversation summary refresh failed for %s", conversation_id)
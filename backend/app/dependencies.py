@@ -1,14 +1,18 @@
-from typing import Annotated, Optional
+from typing import Annotated, Optional, Union
 from uuid import UUID
 
 from fastapi import Depends, Header, HTTPException, Request, status
 from sqlalchemy import text
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from .api_keys import API_KEY_PREFIX, resolve_api_key
 from .config import PlanName, get_plan_limits
 from .db import get_db
 from .models import Organization, Usage, User
-from .security import verify_token
+from .principal_cache import load_org, load_user
+from .redis_client import get_auth_versions
+from .security import create_access_token, verify_token
 
 
 CurrentUser = Annotated[User, Depends(lambda request: get_current_user(request))]
@@ -25,8 +29,7 @@ def _get_auth_header(authorization: Optional[str] = Header(None)) -> str:
     return authorization.split(" ", 1)[1]
 
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
-    token = _get_auth_header(request.headers.get("Authorization"))
+def _access_token_payload(token: str) -> dict:
     try:
         payload = verify_token(token)
     except ValueError:
@@ -35,22 +38,47 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    sub = payload.get("sub")
-    if sub is None:
+    if payload.get("sub") is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    user_id = UUID(sub)
-    user = db.query(User).filter(User.id == user_id).first()
+    return payload
+
+
+async def _api_key_user(request: Request, db: Session, raw_key: str) -> User:
+    """The member an API key acts as; the key must still belong to their org."""
+    identity = await resolve_api_key(db, raw_key)
+    user = await load_user(db, identity.user_id) if identity is not None and identity.user_id else None
+    if user is None or user.org_id != identity.org_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    request.state.api_key_id = identity.id
+    return user
+
+
+async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+    # Resolved once per request, however many dependencies ask for it
+    user: Optional[User] = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    token = _get_auth_header(request.headers.get("Authorization"))
+    if token.startswith(API_KEY_PREFIX):
+        user = await _api_key_user(request, db, token)
+    else:
+        user = await load_user(db, UUID(_access_token_payload(token)["sub"]))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     request.state.user = user
     return user
 
 
-def get_current_org(request: Request, db: Session = Depends(get_db)) -> Organization:
-    user: User = getattr(request.state, "user", None)
-    if not user:
-        user = get_current_user(request, db)
-    org = db.query(Organization).filter(Organization.id == user.org_id).first()
+async def get_current_org(request: Request, db: Session = Depends(get_db)) -> Organization:
+    org: Optional[Organization] = getattr(request.state, "org", None)
+    if org is not None:
+        return org
+    user = await get_current_user(request, db)
+    org = await load_org(db, user.org_id)
     if not org:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
 
@@ -58,24 +86,105 @@ def get_current_org(request: Request, db: Session = Depends(get_db)) -> Organiza
     # will be automatically scoped to this org_id by the RLS policies.
     # FastAPI caches Depends(get_db) per request, so the same session object is
     # shared between this dependency and the route handlers that use Depends(get_db).
+    await run_in_threadpool(_set_rls_org, db, org.id)
+
+    request.state.org = org
+    return org
+
+
+def _set_rls_org(db: Session, org_id: UUID) -> None:
     try:
         db.execute(
             text("SET LOCAL app.current_org_id = :org_id"),
-            {"org_id": str(org.id)},
+            {"org_id": str(org_id)},
         )
         db.flush()
     except Exception:
         pass  # Non-fatal: RLS enforcement falls back to application-level filters
 
-    request.state.org = org
-    return org
+
+class Principal:
+    """Who is calling and for which org, as signed into the access token."""
+
+    __slots__ = ("user_id", "org_id", "role", "plan")
+
+    def __init__(self, user_id: UUID, org_id: UUID, role: str, plan: str) -> None:
+        self.user_id = user_id
+        self.org_id = org_id
+        self.role = role
+        self.plan = plan
+
+
+async def issue_access_token(db: Session, user: User) -> str:
+    """
+    Access token carrying signed org/role/plan claims and the current token
+    versions. Without Redis the versions are unknown, so only `sub` is
+    signed and every request takes the lookup path.
+    """
+    versions = await get_auth_versions(user.id, user.org_id)
+    if versions is None:
+        return create_access_token(str(user.id))
+    # Role and plan are read after the versions: a change committed in between
+    # leaves the token stale (refused, then refreshed) rather than wrong.
+    row = await run_in_threadpool(
+        lambda: db.query(User.role, Organization.plan)
+        .join(Organization, Organization.id == User.org_id)
+        .filter(User.id == user.id)
+        .first()
+    )
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    claims = {
+        "org_id": str(user.org_id),
+        "role": row.role,
+        "plan": row.plan,
+        "ver": versions[0],
+        "org_ver": versions[1],
+    }
+    return create_access_token(str(user.id), claims=claims)
+
+
+async def get_principal(request: Request, db: Session = Depends(get_db)) -> Principal:
+    """
+    Authorise from token claims alone when they are still current.
+
+    Claims are current while the per-user and per-org versions in Redis match
+    the ones signed into the token; role, plan and membership changes bump
+    them (`invalidate_principals(revoke_tokens=True)`). A stale token gets a
+    401 so the client refreshes. Tokens without claims, or a Redis outage,
+    fall back to get_current_user/get_current_org.
+    """
+    principal: Optional[Principal] = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+    token = _get_auth_header(request.headers.get("Authorization"))
+    # API keys carry no claims and always take the lookup path
+    payload = {} if token.startswith(API_KEY_PREFIX) else _access_token_payload(token)
+    versions = None
+    if "org_id" in payload:
+        versions = await get_auth_versions(payload["sub"], payload["org_id"])
+    if versions is None:
+        user = await get_current_user(request, db)
+        org = await get_current_org(request, db)
+        principal = Principal(user.id, org.id, user.role, org.plan)
+    elif versions != (payload.get("ver"), payload.get("org_ver")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token is stale",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'},
+        )
+    else:
+        principal = Principal(UUID(payload["sub"]), UUID(payload["org_id"]), payload["role"], payload["plan"])
+        await run_in_threadpool(_set_rls_org, db, principal.org_id)
+    request.state.principal = principal
+    return principal
 
 
 def require_role(*roles: str):
-    def dependency(user: User = Depends(get_current_user)) -> User:
-        if user.role not in roles:
+    def dependency(principal: Principal = Depends(get_principal)) -> Principal:
+        if principal.role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
-        return user
+        return principal
 
     return dependency
 
@@ -108,12 +217,35 @@ def get_usage_for_org(db: Session, org_id: UUID, period: Optional[str] = None) -
     return usage
 
 
+def add_token_usage(
+    db: Session,
+    org_id: UUID,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_prompt_tokens: int = 0,
+) -> None:
+    """Roll token counts into the org's current-period usage with an atomic increment."""
+    usage = get_usage_for_org(db, org_id)
+    db.query(Usage).filter(Usage.id == usage.id).update(
+        {
+            Usage.prompt_tokens_used: Usage.prompt_tokens_used + prompt_tokens,
+            Usage.completion_tokens_used: Usage.completion_tokens_used + completion_tokens,
+            Usage.cached_prompt_tokens_used: Usage.cached_prompt_tokens_used + cached_prompt_tokens,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+
+
 def enforce_plan_limits(
-    org: Organization,
+    org: Union[Organization, Principal],
     usage: Usage,
     kind: str,
 ):
-    """Raise HTTP 429 if limits are exceeded for kind: 'ai_queries', 'documents', or 'seats'."""
+    """
+    Raise HTTP 429 if limits are exceeded for kind: 'ai_queries', 'ai_tokens', 'documents', or 'seats'.
+    Only the plan is read, so a Principal works as well as the org row.
+    """
     plan: PlanName = org.plan  # type: ignore[assignment]
     limits = get_plan_limits(plan)
     if kind == "ai_queries":
@@ -123,6 +255,13 @@ def enforce_plan_limits(
                 status_code=429,
                 detail="AI query limit exceeded for current plan. Upgrade to continue.",
             )
+    elif kind == "ai_tokens":
+        max_tokens = limits["max_ai_tokens"]
+        if max_tokens is not None and usage.prompt_tokens_used + usage.completion_tokens_used >= max_tokens:
+            raise HTTPException(
+                status_code=429,
+                detail="AI token limit exceeded for current plan. Upgrade to continue.",
+            )
     elif kind == "documents":
         max_docs = limits["max_documents"]
         if max_docs is not None and usage.documents_uploaded >= max_docs:
@@ -0,0 +1,217 @@
+"""
+Plan-aware admission control in front of stream_chat_completion.
+
+Every LLM call takes a slot from a per-worker scheduler with a global cap and
+a per-provider cap. When no slot is free the request waits in a queue:
+
+  * plans with PLAN_LIMITS[plan]["priority_queue"] are always served first,
+  * other plans share capacity by weighted fair queuing (stride scheduling
+    on PLAN_LIMITS[plan]["queue_weight"]),
+  * within a plan, orgs are served round-robin so one busy tenant cannot
+    starve the rest.
+
+A full queue, or a wait longer than LLM_QUEUE_MAX_WAIT_SECONDS, is rejected
+straight away with 429 + Retry-After instead of piling up.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Deque, Dict, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, status
+
+from . import metrics
+from .config import PlanName, get_plan_limits, get_settings
+
+
+settings = get_settings()
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int, reason: str) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class LLMSlot:
+    """A granted slot. release() is idempotent so every exit path can call it."""
+
+    def __init__(self, scheduler: "LLMScheduler", plan: PlanName, org_id: UUID, provider: str) -> None:
+        self._scheduler = scheduler
+        self.plan = plan
+        self.org_id = org_id
+        self.provider = provider
+        self.granted_at = time.monotonic()
+        self._released = False
+
+    async def for_provider(self, provider: str) -> "LLMSlot":
+        """
+        This slot if it is for `provider`, otherwise a new slot for it. Used
+        when failover or a hedged request calls another provider; the request
+        was already admitted, so the new slot skips the queue-depth check.
+        """
+        if provider == self.provider:
+            return self
+        return await self._scheduler.acquire(self.plan, self.org_id, provider, bounded=False)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self.provider, time.monotonic() - self.granted_at)
+
+
+class _Waiter:
+    __slots__ = ("future", "plan", "org_id", "provider", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, plan: str, org_id: UUID, provider: str) -> None:
+        self.future = future
+        self.plan = plan
+        self.org_id = org_id
+        self.provider = provider
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        provider_max_concurrency: int,
+        max_queue_depth: int,
+        max_wait_seconds: float,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.provider_max_concurrency = provider_max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_seconds = max_wait_seconds
+        self._active = 0
+        self._active_by_provider: Dict[str, int] = defaultdict(int)
+        # plan -> org_id -> FIFO of waiters; OrderedDict order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[UUID, Deque[_Waiter]]"] = defaultdict(OrderedDict)
+        self._depth: Dict[str, int] = defaultdict(int)
+        self._pass: Dict[str, float] = defaultdict(float)
+        self._service_seconds = 5.0  # EWMA of slot hold time, for Retry-After
+
+    def _has_capacity(self, provider: str) -> bool:
+        return (
+            self._active < self.max_concurrency
+            and self._active_by_provider[provider] < self.provider_max_concurrency
+        )
+
+    def _retry_after(self, plan: str) -> int:
+        return max(1, math.ceil((self._depth[plan] + 1) * self._service_seconds / self.max_concurrency))
+
+    def _reject(self, plan: str, reason: str) -> QueueFull:
+        metrics.inc("llm_queue_rejected", plan=plan, reason=reason)
+        return QueueFull(self._retry_after(plan), reason)
+
+    def _publish(self, plan: Optional[str] = None, provider: Optional[str] = None) -> None:
+        if plan is not None:
+            metrics.set_gauge("llm_queue_depth", self._depth[plan], plan=plan)
+        if provider is not None:
+            metrics.set_gauge("llm_active_slots", self._active_by_provider[provider], provider=provider)
+        metrics.set_gauge("llm_active_slots_total", self._active)
+
+    async def acquire(self, plan: PlanName, org_id: UUID, provider: str, bounded: bool = True) -> LLMSlot:
+        """
+        Wait for a slot. `bounded=False` skips the queue-depth check, for work
+        that was already admitted (e.g. the fan-out of an accepted batch).
+        """
+        if bounded and not self._has_capacity(provider) and self._depth[plan] >= self.max_queue_depth:
+            raise self._reject(plan, "queue_full")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), plan, org_id, provider)
+        queues = self._queues[plan]
+        if self._depth[plan] == 0:
+            # A plan returning from idle must not bank credit from the time it was away
+            busy = [self._pass[p] for p, depth in self._depth.items() if depth and p != plan]
+            if busy:
+                self._pass[plan] = max(self._pass[plan], min(busy))
+        queues.setdefault(org_id, deque()).append(waiter)
+        self._depth[plan] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            raise self._reject(plan, "timeout")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(provider, 0.0)  # granted just as the caller went away
+            else:
+                self._discard(waiter)
+            raise
+
+        metrics.observe("llm_queue_wait_ms", (time.monotonic() - waiter.enqueued_at) * 1000, plan=plan)
+        return LLMSlot(self, plan, org_id, provider)
+
+    def _discard(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.plan].get(waiter.org_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._depth[waiter.plan] -= 1
+            if not queue:
+                del self._queues[waiter.plan][waiter.org_id]
+            self._publish(plan=waiter.plan)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        plans = [p for p, depth in self._depth.items() if depth]
+        plans.sort(key=lambda p: (not get_plan_limits(p)["priority_queue"], self._pass[p]))  # type: ignore[arg-type]
+        for plan in plans:
+            queues = self._queues[plan]
+            for org_id in list(queues):
+                queue = queues[org_id]
+                if not self._has_capacity(queue[0].provider):
+                    continue
+                waiter = queue.popleft()
+                if queue:
+                    queues.move_to_end(org_id)
+                else:
+                    del queues[org_id]
+                self._depth[plan] -= 1
+                self._pass[plan] += 1.0 / get_plan_limits(plan)["queue_weight"]  # type: ignore[arg-type]
+                return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            if waiter.future.done():
+                continue  # timed out or cancelled, not yet discarded by its caller
+            self._active += 1
+            self._active_by_provider[waiter.provider] += 1
+            waiter.future.set_result(None)
+            self._publish(plan=waiter.plan, provider=waiter.provider)
+
+    def _release(self, provider: str, held_seconds: float) -> None:
+        self._active -= 1
+        self._active_by_provider[provider] -= 1
+        if held_seconds > 0:
+            self._service_seconds = 0.9 * self._service_seconds + 0.1 * held_seconds
+        self._publish(provider=provider)
+        self._dispatch()
+
+
+scheduler = LLMScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    provider_max_concurrency=settings.llm_provider_max_concurrency,
+    max_queue_depth=settings.llm_queue_max_depth,
+    max_wait_seconds=settings.llm_queue_max_wait_seconds,
+)
+
+
+async def acquire_llm_slot(plan: PlanName, org_id: UUID, provider: str) -> LLMSlot:
+    """Take a scheduler slot or fail fast with 429 + Retry-After."""
+    try:
+        return await scheduler.acquire(plan, org_id, provider)
+    except QueueFull as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="The AI service is at capacity. Please retry shortly.",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
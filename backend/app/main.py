@@ -1,11 +1,17 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 import sentry_sdk
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from .ai import close_llm_http_clients, open_llm_http_clients
+from .api_keys import api_key_usage
 from .config import get_settings
 from .db import engine
+from . import metrics
 from . import models  # noqa: F401
 from .routes_auth import router as auth_router
 from .routes_team import router as team_router
@@ -15,7 +21,13 @@ from .routes_documents import router as documents_router
 from .routes_assistant import router as assistant_router
 from .routes_billing import router as billing_router
 from .routes_settings import router as settings_router
+from .redis_client import client_cache
 from .routes_apikeys import router as apikeys_router
+from .token_blocklist import token_blocklist
+from .usage_counters import usage_flusher
+from .vector_maintenance import maintenance_loop
+from .warmup import is_warm, run_warmup
+from .write_behind import chat_writer
 
 
 settings = get_settings()
@@ -32,7 +44,29 @@ if _sentry_dsn:
     )
 # ─────────────────────────────────────────────────────────────────────────────
 
-app = FastAPI(title=settings.app_name)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_llm_http_clients()
+    background: list[asyncio.Task] = [asyncio.create_task(run_warmup())]
+    if settings.vector_maintenance_interval_minutes > 0:
+        background.append(asyncio.create_task(maintenance_loop(settings.vector_maintenance_interval_minutes)))
+    chat_writer.start()
+    api_key_usage.start()
+    token_blocklist.start()
+    client_cache.start()
+    usage_flusher.start()
+    yield
+    for task in background:
+        task.cancel()
+    await chat_writer.close()
+    await api_key_usage.close()
+    await token_blocklist.close()
+    await client_cache.close()
+    await usage_flusher.close()
+    await close_llm_http_clients()
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
 # CORS: in production only allow FRONTEND_ORIGIN; in dev also allow localhost
 _cors_origins = [str(settings.frontend_origin)]
@@ -45,6 +79,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "Accept"],
+    expose_headers=[
+        "Server-Timing",
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "RateLimit-Policy",
+        "Retry-After",
+    ],
 )
 
 
@@ -88,6 +130,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail, "code": code},
+        headers=exc.headers,
     )
 
 
@@ -96,6 +139,12 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    # Per-worker snapshot: counters, gauges and recent-window histograms
+    return metrics.snapshot()
+
+
 @app.get("/ready")
 async def ready():
     # Simple readiness check: ensure DB can be reached
@@ -104,6 +153,8 @@ async def ready():
             conn.execute(models.Organization.__table__.select().limit(1))
     except Exception:
         raise HTTPException(status_code=503, detail="Database not ready")
+    if not is_warm():
+        raise HTTPException(status_code=503, detail="Warming up vector indexes")
     return {"status": "ready"}
 
 
@@ -0,0 +1,105 @@
+"""
+Minimal in-process metrics registry.
+
+Each worker keeps its own counters, gauges and bounded histograms; GET /metrics
+returns a JSON snapshot. Labels are folded into the key, e.g.
+`llm_queue_depth{plan=pro}`.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+
+_HISTOGRAM_WINDOW = 2048
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_histograms: Dict[str, Deque[float]] = {}
+_histogram_totals: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Record a sample; percentiles are computed over the most recent window."""
+    key = _key(name, labels)
+    with _lock:
+        window = _histograms.get(key)
+        if window is None:
+            window = _histograms[key] = deque(maxlen=_HISTOGRAM_WINDOW)
+        window.append(value)
+        totals = _histogram_totals[key]
+        totals[0] += 1
+        totals[1] += value
+
+
+def _percentile(ordered: list, p: int) -> float:
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[rank - 1]
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        histograms = {}
+        for key, window in _histograms.items():
+            ordered = sorted(window)
+            count, total = _histogram_totals[key]
+            histograms[key] = {
+                "count": count,
+                "sum": round(total, 3),
+                "p50": round(_percentile(ordered, 50), 3),
+                "p95": round(_percentile(ordered, 95), 3),
+                "p99": round(_percentile(ordered, 99), 3),
+            }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": histograms,
+        }
+
+
+class ServerTiming:
+    """
+    Stage durations for one request, rendered as a `Server-Timing` header and
+    recorded as `{name}_stage_ms{stage=...}` histograms. Stages may overlap;
+    `total` is wall time since the timer was created.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._started = time.perf_counter()
+        self._stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def record(self, stage: str, ms: float) -> None:
+        self._stages[stage] = ms
+        observe(f"{self.name}_stage_ms", ms, stage=stage)
+
+    def header(self, total_stage: str = "total") -> str:
+        self.record(total_stage, (time.perf_counter() - self._started) * 1000)
+        return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in list(self._stages.items()))
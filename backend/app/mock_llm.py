@@ -0,0 +1,115 @@
+"""
+Offline mock LLM provider for development and load tests.
+
+Serves OpenAI-compatible `POST /v1/chat/completions` (also used by the
+`mock` ai_provider) and Anthropic-style `POST /v1/messages` streaming
+endpoints, with configurable time to first token, token rate and error
+rate. Usage events are included so token metering works end to end.
+
+    python -m backend.app.mock_llm --port 8090 --ttft-ms 300 --tokens-per-sec 60 --error-rate 0.01
+
+Point the API at it with MOCK_LLM_ENABLED=true and MOCK_LLM_BASE_URL, then
+select `mock` as the org's AI provider. Nothing here reads app settings, so
+it also runs standalone.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+
+_WORDS = (
+    "revenue growth margin region quarter customers churn pipeline forecast "
+    "segment analysis trend baseline cohort retention conversion"
+).split()
+
+
+def make_app(
+    ttft_ms: float = 200.0,
+    tokens: int = 120,
+    tokens_per_sec: float = 60.0,
+    error_rate: float = 0.0,
+    error_status: int = 503,
+    seed: int | None = None,
+):
+    """ASGI app streaming `tokens` deltas; `error_rate` of requests get `error_status`."""
+    rng = random.Random(seed)
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        if rng.random() < error_rate:
+            payload = json.dumps({"error": {"message": "mock provider error"}}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": error_status,
+                "headers": [(b"content-type", b"application/json")],
+            })
+            await send({"type": "http.response.body", "body": payload})
+            return
+
+        async def emit(event: dict) -> None:
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(event)}\n\n".encode(), "more_body": True})
+
+        prompt_tokens = max(1, len(body) // 4)
+        anthropic = scope["path"].endswith("/messages")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream")],
+        })
+        await asyncio.sleep(ttft_ms / 1000)
+        if anthropic:
+            await emit({"type": "message_start", "message": {"usage": {"input_tokens": prompt_tokens, "output_tokens": 1}}})
+        for i in range(tokens):
+            text = f"tok{i} " if seed is None else f"{rng.choice(_WORDS)} "
+            if anthropic:
+                await emit({"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}})
+            else:
+                await emit({"choices": [{"delta": {"content": text}}]})
+            if tokens_per_sec > 0:
+                await asyncio.sleep(1 / tokens_per_sec)
+        if anthropic:
+            await emit({"type": "message_delta", "usage": {"output_tokens": tokens}})
+            tail = b""
+        else:
+            await emit({"choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens}})
+            tail = b"data: [DONE]\n\n"
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the offline mock LLM provider.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="delay before the first token")
+    parser.add_argument("--tokens", type=int, default=120, help="tokens per response")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="0 streams as fast as possible")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, help="emit seeded pseudo-words instead of tok0 tok1 ...")
+    args = parser.parse_args()
+
+    app = make_app(args.ttft_ms, args.tokens, args.tokens_per_sec, args.error_rate, args.error_status, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
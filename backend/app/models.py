@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     CheckConstraint,
     Column,
@@ -36,6 +37,8 @@ class Organization(Base):
     ai_provider = Column(String(50), nullable=False, default="groq")
     ai_model = Column(String(255), nullable=True) 
     ai_api_key = Column(String(512), nullable=True)
+    # Provider to fail over / hedge to (platform key); None keeps prompts on ai_provider
+    ai_fallback_provider = Column(String(50), nullable=True)
 
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -118,6 +121,10 @@ class Conversation(Base):
     org_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     title = Column(String(255), nullable=False)
+    # Rolling summary of the oldest `summarized_messages` messages; newer ones
+    # are replayed verbatim (see conversation_memory)
+    summary = Column(Text, nullable=True)
+    summarized_messages = Column(Integer, default=0, nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
 
@@ -138,6 +145,14 @@ class Message(Base):
     )
     content = Column(Text, nullable=False)
     sources = Column(JSON, nullable=True)
+    # Set when the client disconnected before the answer finished streaming
+    truncated = Column(Boolean, nullable=False, default=False)
+    # Token metering for assistant messages (estimated when the provider sent no usage)
+    llm_model = Column(String(255), nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_prompt_tokens = Column(Integer, nullable=True)
+    tokens_estimated = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
 
     __table_args__ = (
@@ -153,6 +168,9 @@ class Usage(Base):
     org_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
     period = Column(String(7), nullable=False)  # e.g. "2026-02"
     ai_queries_used = Column(Integer, nullable=False, default=0)
+    prompt_tokens_used = Column(BigInteger, nullable=False, default=0)
+    completion_tokens_used = Column(BigInteger, nullable=False, default=0)
+    cached_prompt_tokens_used = Column(BigInteger, nullable=False, default=0)
     documents_uploaded = Column(Integer, nullable=False, default=0)
     seats_used = Column(Integer, nullable=False, default=0)
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -193,6 +211,7 @@ class ApiKey(Base):
     __table_args__ = (
         Index("ix_api_keys_org_id", "org_id"),
         Index("ix_api_keys_org_id_revoked_at", "org_id", "revoked_at"),
+        Index("ix_api_keys_key_hash", "key_hash", unique=True),
     )
 
 
@@ -0,0 +1,112 @@
+"""
+Bounded worker pool for bcrypt.
+
+A bcrypt hash or check costs tens to hundreds of milliseconds of CPU
+(BCRYPT_ROUNDS). Run inline in an `async def` route, it blocks every other
+request on the worker, SSE streams included. Routes await `hash_password`
+and `check_password` instead. These run passlib on a dedicated thread pool
+of PASSWORD_HASH_WORKERS threads; the bcrypt C extension releases the GIL,
+so the event loop keeps running. Sync routes already run in the threadpool
+and keep their database work there; they call `hash_password_blocking` and
+`check_password_blocking`, which wait on the same pool.
+
+At most PASSWORD_HASH_MAX_QUEUE jobs wait behind the running ones. Past
+that, a login storm gets 503 + Retry-After instead of an ever-growing
+queue. Queue depth, wait time and hash time are exported through `metrics`.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from . import metrics
+from .config import get_settings
+from .security import get_password_hash, verify_password
+
+
+settings = get_settings()
+
+
+class PasswordPoolFull(Exception):
+    pass
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _publish(self) -> None:
+        metrics.set_gauge("password_hash_in_flight", self._in_flight)
+        metrics.set_gauge("password_hash_queue_depth", max(0, self._in_flight - self.workers))
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                metrics.inc("password_hash_rejected")
+                raise PasswordPoolFull()
+            self._in_flight += 1
+            self._publish()
+        queued_at = time.perf_counter()
+
+        def job() -> Any:
+            started = time.perf_counter()
+            metrics.observe("password_hash_wait_ms", (started - queued_at) * 1000)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe("password_hash_ms", (time.perf_counter() - started) * 1000)
+
+        def done(_: "Future[Any]") -> None:
+            # Also runs when a queued job is cancelled (client went away)
+            with self._lock:
+                self._in_flight -= 1
+                self._publish()
+
+        future = self._executor.submit(job)
+        future.add_done_callback(done)
+        return future
+
+
+password_pool = PasswordHashPool(
+    workers=settings.password_hash_workers or max(1, (os.cpu_count() or 2) // 2),
+    max_queue=settings.password_hash_max_queue,
+)
+
+
+def _submit(fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+    try:
+        return password_pool.submit(fn, *args)
+    except PasswordPoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-in requests in progress. Please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def _run(fn: Callable[..., Any], *args: Any) -> Any:
+    return await asyncio.wrap_future(_submit(fn, *args))
+
+
+async def hash_password(password: str) -> str:
+    return await _run(get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+def hash_password_blocking(password: str) -> str:
+    return _submit(get_password_hash, password).result()
+
+
+def check_password_blocking(plain_password: str, hashed_password: str) -> bool:
+    return _submit(verify_password, plain_password, hashed_password).result()
@@ -0,0 +1,244 @@
+"""
+Cached principal resolution for get_current_user / get_current_org.
+
+User and organization rows are cached as plain-column snapshots in two
+tiers. The first is a per-worker LRU with a short TTL. The second is Redis
+with a longer TTL, shared by all workers. The database is only queried on
+a miss.
+
+A snapshot is attached to the request's session with
+`Session.merge(load=False)`. Routes can then read, update and delete it like
+a queried row without a SELECT. Secrets are left out of snapshots (the
+password hash and the BYOK key). They load lazily on first access, like any
+unloaded column.
+
+Writes that change a cached row call `invalidate_principals()` after they
+commit: role and plan changes, member removal, org deletion, org settings
+and AI preferences. Changes that alter access-token claims (role, plan,
+membership) also pass `revoke_tokens=True`, which bumps the Redis token
+versions so outstanding access tokens are refused. Another worker's local
+copy can outlive an invalidation by up to PRINCIPAL_CACHE_LOCAL_TTL_SECONDS.
+Redis outages fall back to the database.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple, Type
+from uuid import UUID
+
+import anyio
+from redis.exceptions import RedisError
+from sqlalchemy import DateTime
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.orm import Session, make_transient_to_detached
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+from .config import get_settings
+from .db import Base
+from .models import Organization, User
+from .redis_client import client_cache, org_version_key, redis, run_pipeline, user_version_key
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_FIELDS: Dict[str, Tuple[Type[Base], Tuple[str, ...]]] = {
+    "user": (User, ("id", "org_id", "email", "role", "is_verified", "last_login", "created_at")),
+    "org": (
+        Organization,
+        (
+            "id",
+            "name",
+            "slug",
+            "logo_url",
+            "stripe_customer_id",
+            "stripe_subscription_id",
+            "plan",
+            "ai_provider",
+            "ai_model",
+            "ai_fallback_provider",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+}
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode(model: Type[Base], field: str, value: Any) -> Any:
+    if value is None:
+        return None
+    column_type = model.__table__.c[field].type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, PG_UUID):
+        return UUID(value)
+    return value
+
+
+def snapshot(kind: str, obj: Base) -> Dict[str, Any]:
+    _, fields = _FIELDS[kind]
+    return {field: _encode(getattr(obj, field)) for field in fields}
+
+
+def attach(db: Session, kind: str, snap: Dict[str, Any]) -> Base:
+    """A persistent instance in `db` built from `snap`, without querying."""
+    model, _ = _FIELDS[kind]
+    obj = model(**{field: _decode(model, field, value) for field, value in snap.items()})
+    make_transient_to_detached(obj)
+    return db.merge(obj, load=False)
+
+
+class PrincipalCache:
+    def __init__(self, local_ttl: float, remote_ttl: int, max_entries: int) -> None:
+        self.local_ttl = local_ttl
+        self.remote_ttl = remote_ttl
+        self.max_entries = max_entries
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Invalidations can come from threadpool routes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind: str, ident: UUID) -> str:
+        return f"principal:{kind}:{ident}"
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry[1]
+
+    def _put_local(self, key: str, snap: Dict[str, Any]) -> None:
+        if self.local_ttl <= 0:
+            return
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, snap)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    async def get(self, kind: str, ident: UUID) -> Optional[Dict[str, Any]]:
+        key = self.key(kind, ident)
+        snap = self._get_local(key)
+        if snap is not None:
+            metrics.inc("principal_cache", kind=kind, tier="local")
+            return snap
+        if self.remote_ttl <= 0:
+            return None
+        try:
+            raw = await redis.get(key)
+        except RedisError:
+            logger.warning("Redis unavailable — principal cache lookup skipped for %s", key)
+            return None
+        if raw is None:
+            return None
+        snap = json.loads(raw)
+        self._put_local(key, snap)
+        metrics.inc("principal_cache", kind=kind, tier="redis")
+        return snap
+
+    async def put(self, kind: str, ident: UUID, snap: Dict[str, Any]) -> None:
+        key = self.key(kind, ident)
+        self._put_local(key, snap)
+        if self.remote_ttl <= 0:
+            return
+        try:
+            await redis.set(key, json.dumps(snap), ex=self.remote_ttl)
+        except RedisError:
+            logger.warning("Redis unavailable — principal cache write skipped for %s", key)
+
+    def evict_local(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+
+principal_cache = PrincipalCache(
+    local_ttl=settings.principal_cache_local_ttl_seconds,
+    remote_ttl=settings.principal_cache_ttl_seconds,
+    max_entries=settings.principal_cache_max_entries,
+)
+
+
+async def _load(db: Session, kind: str, ident: UUID) -> Optional[Base]:
+    snap = await principal_cache.get(kind, ident)
+    if snap is not None:
+        return attach(db, kind, snap)
+    model, _ = _FIELDS[kind]
+    obj = await run_in_threadpool(lambda: db.query(model).filter(model.id == ident).first())
+    metrics.inc("principal_cache", kind=kind, tier="db")
+    if obj is not None:
+        await principal_cache.put(kind, ident, snapshot(kind, obj))
+    return obj
+
+
+async def load_user(db: Session, user_id: UUID) -> Optional[User]:
+    return await _load(db, "user", user_id)  # type: ignore[return-value]
+
+
+async def load_org(db: Session, org_id: UUID) -> Optional[Organization]:
+    return await _load(db, "org", org_id)  # type: ignore[return-value]
+
+
+_evictions: "set[asyncio.Task]" = set()
+
+
+def invalidate_principals(
+    user_ids: Iterable[UUID] = (),
+    org_ids: Iterable[UUID] = (),
+    revoke_tokens: bool = False,
+) -> None:
+    """
+    Drop cached users/orgs after a committed change. Callable from async
+    routes and from threadpool (sync) routes alike. With `revoke_tokens`,
+    access tokens carrying claims for these users/orgs stop being accepted.
+    """
+    user_ids, org_ids = list(user_ids), list(org_ids)
+    keys = [principal_cache.key("user", i) for i in user_ids] + [principal_cache.key("org", i) for i in org_ids]
+    principal_cache.evict_local(keys)
+    commands: list[tuple] = []
+    if keys and principal_cache.remote_ttl > 0:
+        commands.append(("DEL", *keys))
+    if revoke_tokens:
+        version_keys = [user_version_key(i) for i in user_ids] + [org_version_key(i) for i in org_ids]
+        # Don't serve this worker's copy until Redis's invalidation arrives
+        client_cache.invalidate(version_keys)
+        commands += [("INCR", key) for key in version_keys]
+
+    async def evict() -> None:
+        # Snapshot deletes and token version bumps in one round trip
+        await run_pipeline(commands, f"principal cache invalidation for {keys}")
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(evict())
+        _evictions.add(task)
+        task.add_done_callback(_evictions.discard)
+        return
+    try:
+        anyio.from_thread.run(evict)
+    except RuntimeError:
+        # Not on an event loop worker thread (scripts, maintenance jobs)
+        logger.warning("No event loop — principal cache invalidation skipped in Redis for %s", keys)
@@ -0,0 +1,308 @@
+"""
+Request rate limiting.
+
+Each limit is a token bucket in Redis. It holds up to `limit` tokens and
+refills continuously at `limit` per `window_seconds`, so there is no burst at
+window edges. A Lua script refills the bucket, hands out tokens and sets the
+key's expiry atomically in one round trip. It reads Redis server time, so
+workers with skewed clocks agree. A key expires once its bucket would be
+full again, so idle keys never linger.
+
+Workers do not go to Redis for every request. Each one leases a small batch
+of tokens per key and spends it in memory. The batch starts at one token and
+doubles while a key keeps using up its lease within RATE_LIMIT_LEASE_TTL_SECONDS.
+It is capped at RATE_LIMIT_MAX_LEASE tokens, and at a quarter of the limit so
+one worker cannot hoard a user's quota. Busy keys refill their lease in the
+background before it runs out. A lease that expires partly unused is handed
+back on that key's next refill. A denial is remembered until the bucket has
+a token again, so a client hammering a 429 causes no Redis traffic. Redis
+never hands out more than `limit` tokens, so leasing does not loosen the limit.
+
+If Redis is unreachable, each worker falls back to its own in-memory bucket
+with the same limit. Redis is retried after RATE_LIMIT_REDIS_RETRY_SECONDS.
+Limits then hold per worker rather than cluster-wide, instead of failing
+open.
+
+Chat limits come from PLAN_LIMITS. Login and registration limits come from
+settings (REGISTER_RATE_LIMIT_PER_HOUR, LOGIN_RATE_LIMIT_PER_MINUTE), because
+the caller's plan is not known yet. Limited responses carry
+RateLimit-Limit / -Remaining / -Reset / -Policy headers, and 429s add
+Retry-After.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from . import metrics
+from .config import get_settings
+from .redis_client import redis
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# KEYS[1] bucket; ARGV: capacity, window_ms, tokens wanted, unused tokens handed back.
+# Returns {granted, remaining, ms until full, ms until a token is available}.
+_TOKEN_BUCKET_LUA = """
+redis.replicate_commands()
+local capacity = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local give_back = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = capacity / window_ms
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+  tokens = capacity
+  ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate + give_back)
+local granted = 0
+local retry_ms = 0
+if tokens >= 1 then
+  granted = math.min(want, math.floor(tokens))
+  tokens = tokens - granted
+else
+  retry_ms = math.ceil((1 - tokens) / rate)
+end
+local full_ms = math.ceil((capacity - tokens) / rate)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.max(full_ms, 1))
+return {granted, math.floor(tokens), full_ms, retry_ms}
+"""
+
+_token_bucket = redis.register_script(_TOKEN_BUCKET_LUA)
+
+
+class RateLimitResult:
+    """Outcome of one check; `remaining` is None when the limiter could not decide."""
+
+    __slots__ = ("allowed", "limit", "window_seconds", "remaining", "reset_seconds", "retry_after")
+
+    def __init__(
+        self,
+        allowed: bool,
+        limit: int,
+        window_seconds: int,
+        remaining: Optional[int] = None,
+        reset_seconds: int = 0,
+        retry_after: int = 0,
+    ) -> None:
+        self.allowed = allowed
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.remaining = remaining
+        self.reset_seconds = reset_seconds
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        if self.remaining is None:
+            return {}
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_seconds),
+            "RateLimit-Policy": f"{self.limit};w={self.window_seconds}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class _Lease:
+    """Tokens this worker holds for one key, plus what Redis last said about the bucket."""
+
+    __slots__ = (
+        "tokens",
+        "size",
+        "expires_at",
+        "denied_until",
+        "shared_remaining",
+        "full_at",
+        "refill",
+    )
+
+    def __init__(self) -> None:
+        self.tokens = 0
+        self.size = 1
+        self.expires_at = 0.0
+        self.denied_until = 0.0
+        self.shared_remaining = 0
+        self.full_at = 0.0
+        self.refill: Optional[asyncio.Task] = None
+
+
+class _LocalBucket:
+    """Per-worker fallback bucket used while Redis is unreachable."""
+
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class TwoTierRateLimiter:
+    def __init__(self, lease_ttl: float, max_lease: int, max_keys: int, redis_retry_seconds: float) -> None:
+        self.lease_ttl = lease_ttl
+        self.max_lease = max(1, max_lease)
+        self.max_keys = max_keys
+        self.redis_retry_seconds = redis_retry_seconds
+        self._leases: "OrderedDict[str, _Lease]" = OrderedDict()
+        self._fallback: "OrderedDict[str, _LocalBucket]" = OrderedDict()
+        self._redis_down_until = 0.0
+
+    def _lease(self, key: str) -> _Lease:
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = self._leases[key] = _Lease()
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        else:
+            self._leases.move_to_end(key)
+        return lease
+
+    def _lease_cap(self, limit: int) -> int:
+        return max(1, min(self.max_lease, limit // 4))
+
+    def _result(self, lease: _Lease, allowed: bool, limit: int, window_seconds: int, now: float) -> RateLimitResult:
+        return RateLimitResult(
+            allowed,
+            limit,
+            window_seconds,
+            remaining=lease.shared_remaining + lease.tokens,
+            reset_seconds=max(0, math.ceil(lease.full_at - now)),
+            retry_after=max(1, math.ceil(lease.denied_until - now)) if not allowed else 0,
+        )
+
+    async def _refill(self, key: str, lease: _Lease, limit: int, window_seconds: int) -> None:
+        now = time.monotonic()
+        # The last batch ran out before it expired: lease more this time
+        busy = lease.tokens == 0 and lease.expires_at > now
+        give_back = 0
+        if lease.tokens and lease.expires_at <= now:
+            # Stale lease: hand the unused tokens back and shrink the next batch
+            give_back, lease.tokens = lease.tokens, 0
+            lease.size = max(1, lease.size // 2)
+            metrics.inc("ratelimit_lease_returned", give_back)
+        granted, remaining, full_ms, retry_ms = await _token_bucket(
+            keys=[f"ratelimit:{key}"], args=[limit, window_seconds * 1000, lease.size, give_back]
+        )
+        metrics.inc("ratelimit_redis_calls")
+        now = time.monotonic()
+        lease.tokens += int(granted)
+        lease.shared_remaining = int(remaining)
+        lease.full_at = now + int(full_ms) / 1000
+        lease.expires_at = now + self.lease_ttl
+        if int(granted) == 0:
+            lease.denied_until = now + int(retry_ms) / 1000
+        if busy:
+            lease.size = min(self._lease_cap(limit), lease.size * 2)
+
+    def _prefetch(self, key: str, lease: _Lease, limit: int, window_seconds: int) -> None:
+        async def run() -> None:
+            try:
+                await self._refill(key, lease, limit, window_seconds)
+            except RedisError:
+                self._redis_down_until = time.monotonic() + self.redis_retry_seconds
+            finally:
+                lease.refill = None
+
+        lease.refill = asyncio.get_running_loop().create_task(run())
+
+    def _check_fallback(self, key: str, limit: int, window_seconds: int, now: float) -> RateLimitResult:
+        rate = limit / window_seconds
+        bucket = self._fallback.get(key)
+        if bucket is None:
+            bucket = self._fallback[key] = _LocalBucket(float(limit), now)
+            while len(self._fallback) > self.max_keys:
+                self._fallback.popitem(last=False)
+        bucket.tokens = min(float(limit), bucket.tokens + (now - bucket.updated_at) * rate)
+        bucket.updated_at = now
+        metrics.inc("ratelimit_checks", tier="fallback")
+        allowed = bucket.tokens >= 1
+        if allowed:
+            bucket.tokens -= 1
+        return RateLimitResult(
+            allowed,
+            limit,
+            window_seconds,
+            remaining=int(bucket.tokens),
+            reset_seconds=math.ceil((limit - bucket.tokens) / rate),
+            retry_after=0 if allowed else max(1, math.ceil((1 - bucket.tokens) / rate)),
+        )
+
+    async def check(self, key: str, limit: int, window_seconds: int) -> RateLimitResult:
+        now = time.monotonic()
+        if now < self._redis_down_until:
+            return self._check_fallback(key, limit, window_seconds, now)
+        lease = self._lease(key)
+        if now < lease.denied_until:
+            metrics.inc("ratelimit_checks", tier="local")
+            return self._result(lease, False, limit, window_seconds, now)
+        if lease.tokens and lease.expires_at > now:
+            lease.tokens -= 1
+            metrics.inc("ratelimit_checks", tier="local")
+            if lease.size > 1 and lease.tokens < lease.size // 2 and lease.refill is None:
+                self._prefetch(key, lease, limit, window_seconds)
+            return self._result(lease, True, limit, window_seconds, now)
+
+        metrics.inc("ratelimit_checks", tier="redis")
+        try:
+            if lease.refill is not None:
+                # Share the refill already on its way rather than send another
+                await asyncio.shield(lease.refill)
+            else:
+                await self._refill(key, lease, limit, window_seconds)
+        except RedisError:
+            self._redis_down_until = time.monotonic() + self.redis_retry_seconds
+        now = time.monotonic()
+        if now < self._redis_down_until:
+            logger.warning("Redis unavailable — falling back to per-worker rate limits for key: %s", key)
+            return self._check_fallback(key, limit, window_seconds, now)
+        allowed = lease.tokens > 0
+        if allowed:
+            lease.tokens -= 1
+        elif lease.denied_until <= now:
+            # Tokens granted to this refill went to concurrent requests first
+            lease.denied_until = now + window_seconds / limit
+        return self._result(lease, allowed, limit, window_seconds, now)
+
+
+limiter = TwoTierRateLimiter(
+    lease_ttl=settings.rate_limit_lease_ttl_seconds,
+    max_lease=settings.rate_limit_max_lease,
+    max_keys=settings.rate_limit_local_max_keys,
+    redis_retry_seconds=settings.rate_limit_redis_retry_seconds,
+)
+
+
+async def rate_limit(key: str, limit: int, window_seconds: int) -> RateLimitResult:
+    """Take one request from `key`'s bucket."""
+    return await limiter.check(key, limit, window_seconds)
+
+
+async def enforce_rate_limit(
+    key: str,
+    limit: int,
+    window_seconds: int,
+    detail: str = "Too many requests. Please slow down.",
+) -> RateLimitResult:
+    """Like rate_limit(), but raises 429 with RateLimit-* and Retry-After headers."""
+    result = await rate_limit(key, limit, window_seconds)
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers=result.headers(),
+        )
+    return result
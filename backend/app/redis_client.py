@@ -1,45 +1,275 @@
+"""
+Shared Redis client.
+
+All modules use the one `redis` client. Its connection pool holds up to
+REDIS_MAX_CONNECTIONS connections. When they are all busy, a command waits
+up to REDIS_POOL_TIMEOUT_SECONDS for one and then fails like any other Redis
+error, so callers take their fallback paths instead of queueing without
+bound. Idle connections are PINGed after REDIS_HEALTH_CHECK_INTERVAL_SECONDS
+before reuse. Command latency, pipeline size and pool usage are exported
+through `metrics`.
+
+`run_pipeline` sends several commands in one round trip. `client_cache`
+keeps hot read-mostly keys (the access-token version counters) in memory.
+Redis CLIENT TRACKING invalidates them when any client writes one, so
+reads skip the network without going stale. The app lifespan starts and
+stops its invalidation listener.
+"""
+import asyncio
 import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
 
 from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.connection import BlockingConnectionPool
 from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError, ResponseError
 
+from . import metrics
 from .config import get_settings
 
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-redis = aioredis.from_url(settings.redis_url, decode_responses=True)
+_PING_SECONDS = 15.0
+_RETRY_SECONDS = 5.0
+
+
+class _InstrumentedPool(BlockingConnectionPool):
+    def _publish(self) -> None:
+        metrics.set_gauge("redis_pool_in_use", len(self._in_use_connections))
+
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        connection = await super().get_connection(command_name, *keys, **options)
+        metrics.observe("redis_pool_wait_ms", (time.perf_counter() - started) * 1000)
+        self._publish()
+        return connection
+
+    async def release(self, connection) -> None:
+        await super().release(connection)
+        self._publish()
+
+
+class _InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        commands = len(self.command_stack)
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            metrics.observe("redis_pipeline_ms", (time.perf_counter() - started) * 1000)
+            metrics.observe("redis_pipeline_commands", commands)
+
 
+class _InstrumentedRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except RedisError:
+            metrics.inc("redis_command_errors", command=command)
+            raise
+        finally:
+            metrics.observe("redis_command_ms", (time.perf_counter() - started) * 1000, command=command)
 
-async def rate_limit(key: str, limit: int, window_seconds: int) -> bool:
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return _InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+_pool = _InstrumentedPool.from_url(
+    settings.redis_url,
+    decode_responses=True,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout_seconds,
+    socket_timeout=settings.redis_socket_timeout_seconds,
+    socket_connect_timeout=settings.redis_connect_timeout_seconds,
+    socket_keepalive=True,
+    health_check_interval=settings.redis_health_check_interval_seconds,
+)
+metrics.set_gauge("redis_pool_max_connections", settings.redis_max_connections)
+
+redis = _InstrumentedRedis(connection_pool=_pool)
+
+
+async def run_pipeline(commands: Sequence[Tuple[Any, ...]], what: str) -> Optional[List[Any]]:
     """
-    Simple fixed-window rate limiter.
-    Returns True if allowed, False if over limit.
-    Fails open (allows request) if Redis is unavailable.
+    Send `commands` ((name, *args) tuples) in one round trip, without MULTI.
+    Returns their replies, or None if Redis is unavailable.
     """
+    if not commands:
+        return []
     try:
-        current = await redis.incr(key)
-        if current == 1:
-            await redis.expire(key, window_seconds)
-        return current <= limit
-    except RedisConnectionError:
-        logger.warning("Redis unavailable — rate limiting disabled for key: %s", key)
-        return True  # fail open: allow request
+        async with redis.pipeline(transaction=False) as pipe:
+            for command in commands:
+                pipe.execute_command(*command)
+            return await pipe.execute()
+    except RedisError:
+        logger.warning("Redis unavailable — %s skipped", what)
+        return None
 
 
-async def blacklist_token(jti: str, expires_in_seconds: int) -> None:
-    """Add a refresh token JTI to the Redis blocklist until its expiry."""
-    try:
-        await redis.setex(f"blocklist:{jti}", expires_in_seconds, "1")
-    except RedisConnectionError:
-        logger.warning("Redis unavailable — token blacklisting skipped for jti: %s", jti)
+class ClientSideCache:
+    """
+    Per-worker copy of Redis string keys under `prefixes`.
+
+    A dedicated connection subscribes to `__redis__:invalidate` and turns on
+    CLIENT TRACKING BCAST for the prefixes, redirected to itself. Redis then
+    names every key under them that any client writes. redis-py's asyncio
+    client has no built-in client-side cache, so this is RESP2 redirect mode
+    done by hand. Entries are only served while that connection is up. On
+    any error the cache is cleared, and reads go to Redis until tracking is
+    re-established.
+    """
+
+    def __init__(self, prefixes: Tuple[str, ...], max_keys: int) -> None:
+        self.prefixes = prefixes
+        self.max_keys = max_keys
+        self.synced = False
+        self._entries: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; a fill started before one is dropped
+        self._epoch = 0
+        self._warned = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+        metrics.set_gauge("redis_client_cache_keys", 0)
+
+    def invalidate(self, keys: Optional[List[str]]) -> None:
+        """Drop `keys` (None: everything). Safe to call from any thread."""
+        if keys is None:
+            # FLUSHALL / FLUSHDB
+            self._reset()
+            return
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            size = len(self._entries)
+        metrics.set_gauge("redis_client_cache_keys", size)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """MGET served from memory where possible. Raises RedisError like redis.mget."""
+        if not self.synced:
+            return await redis.mget(keys)
+        values: List[Optional[str]] = []
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values.append(self._entries[key])
+                else:
+                    values.append(None)
+                    missing.append(key)
+            epoch = self._epoch
+        metrics.inc("redis_client_cache", len(keys) - len(missing), tier="local")
+        if not missing:
+            return values
+        metrics.inc("redis_client_cache", len(missing), tier="redis")
+        fetched = dict(zip(missing, await redis.mget(missing)))
+        with self._lock:
+            if self.synced and epoch == self._epoch:
+                self._entries.update(fetched)
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            size = len(self._entries)
+        metrics.set_gauge("redis_client_cache_keys", size)
+        return [fetched[key] if key in fetched else value for key, value in zip(keys, values)]
+
+    async def _listen(self) -> None:
+        # Not from the pool: it must not run pool health checks, whose plain
+        # PING reply a subscribed connection cannot give
+        connection = _pool.connection_class(**{**_pool.connection_kwargs, "health_check_interval": 0})
+        try:
+            await connection.connect()
+            await connection.send_command("CLIENT", "ID")
+            client_id = await connection.read_response()
+            tracking: List[Any] = ["CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST"]
+            for prefix in self.prefixes:
+                tracking += ["PREFIX", prefix]
+            await connection.send_command(*tracking)
+            await connection.read_response()
+            await connection.send_command("SUBSCRIBE", "__redis__:invalidate")
+            await connection.read_response()
+            self._reset()
+            self.synced = True
+            self._warned = False
+            metrics.set_gauge("redis_client_cache_synced", 1)
+            awaiting_pong = False
+            while True:
+                reply = await connection.read_response(timeout=_PING_SECONDS)
+                if reply is None:
+                    if awaiting_pong:
+                        raise RedisConnectionError("client cache invalidation connection stopped answering PING")
+                    await connection.send_command("PING", check_health=False)
+                    awaiting_pong = True
+                    continue
+                awaiting_pong = False
+                if reply[0] == "message":
+                    self.invalidate(reply[2])
+        finally:
+            self.synced = False
+            self._reset()
+            metrics.set_gauge("redis_client_cache_synced", 0)
+            await connection.disconnect()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except ResponseError as exc:
+                # CLIENT TRACKING needs Redis 6+ and may be disabled by the host
+                logger.warning("Redis client-side caching unavailable: %s", exc)
+                return
+            except RedisError as exc:
+                if not self._warned:
+                    logger.warning("Redis unavailable — client-side cache disabled, retrying: %s", exc)
+                    self._warned = True
+            await asyncio.sleep(_RETRY_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None and self.max_keys > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 
-async def is_token_blacklisted(jti: str) -> bool:
-    """Return True if the given refresh token JTI has been revoked."""
+client_cache = ClientSideCache(prefixes=("authver:",), max_keys=settings.redis_client_cache_max_keys)
+
+
+def user_version_key(user_id: object) -> str:
+    return f"authver:user:{user_id}"
+
+
+def org_version_key(org_id: object) -> str:
+    return f"authver:org:{org_id}"
+
+
+async def get_auth_versions(user_id: object, org_id: object) -> Optional[tuple[int, int]]:
+    """
+    Current (user, org) token versions for access-token claims; a missing
+    counter is version 0. None if Redis is unavailable.
+    """
     try:
-        return await redis.exists(f"blocklist:{jti}") == 1
-    except RedisConnectionError:
-        logger.warning("Redis unavailable — assuming token %s is NOT blacklisted", jti)
-        return False  # fail safe: assume token is valid
+        user_ver, org_ver = await client_cache.mget([user_version_key(user_id), org_version_key(org_id)])
+    except RedisError:
+        logger.warning("Redis unavailable — token versions unknown for user %s", user_id)
+        return None
+    return int(user_ver or 0), int(org_ver or 0)
@@ -1,4 +1,3 @@
-import hashlib
 import secrets
 from datetime import datetime, timezone
 from uuid import UUID
@@ -7,19 +6,17 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from . import schemas
+from .api_keys import API_KEY_PREFIX, api_key_cache
 from .audit import log_audit_event
 from .db import get_db
 from .dependencies import get_current_org, get_current_user, require_role
 from .models import ApiKey, Organization, User
+from .security import hash_api_key
 
 
 router = APIRouter(prefix="/api-keys", tags=["api-keys"])
 
 
-def _hash_key(key: str) -> str:
-    return hashlib.sha256(key.encode()).hexdigest()
-
-
 @router.get("/", response_model=schemas.ApiKeyListResponse)
 def list_api_keys(
     db: Session = Depends(get_db),
@@ -58,7 +55,7 @@ def create_api_key(
             detail="Maximum 10 active API keys per organization.",
         )
 
-    raw_key = f"aurora_{secrets.token_urlsafe(32)}"
+    raw_key = f"{API_KEY_PREFIX}{secrets.token_urlsafe(32)}"
     prefix = raw_key[:12]
 
     key = ApiKey(
@@ -66,7 +63,7 @@ def create_api_key(
         created_by=user.id,
         name=payload.name,
         key_prefix=prefix,
-        key_hash=_hash_key(raw_key),
+        key_hash=hash_api_key(raw_key),
     )
     db.add(key)
     db.commit()
@@ -103,5 +100,6 @@ def revoke_api_key(
 
     key.revoked_at = datetime.now(timezone.utc)
     db.commit()
+    api_key_cache.evict(key.key_hash)
 
     log_audit_event(db, org.id, user.id, "api_key_revoked", {"key_name": key.name})
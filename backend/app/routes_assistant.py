@@ -1,20 +1,45 @@
+import asyncio
+import json
+from contextlib import aclosing
 from datetime import datetime, timezone
 from typing import Optional
 from uuid import UUID
 
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 from sqlalchemy.orm import Session
+from starlette.background import BackgroundTasks
 
 from . import schemas
-from .ai import build_prompt, query_context, sse_chat_response, stream_chat_completion
+from .ai import (
+    LLMUsage,
+    build_prompt,
+    query_context,
+    query_context_batch,
+    sse_chat_response,
+    stream_chat_completion,
+)
 from .audit import log_audit_event
-from .config import PlanName, get_plan_limits
+from .config import PlanName, get_plan_limits, get_settings
+from .conversation_memory import load_history, refresh_summary
 from .crypto import decrypt_field
 from .db import get_db
-from .dependencies import get_current_org, get_current_user, get_usage_for_org
-from .models import Conversation, Message, Organization, Usage, User
-from .redis_client import rate_limit
+from .dependencies import (
+    Principal,
+    add_token_usage,
+    get_current_org,
+    get_current_user,
+    get_principal,
+    get_usage_for_org,
+)
+from .llm_scheduler import QueueFull, acquire_llm_slot, scheduler
+from .metrics import ServerTiming
+from .models import AuditLog, Conversation, Message, Organization, Usage, User
+from .rate_limits import enforce_rate_limit
+from .usage_counters import UsageLimitExceeded, charge
+from .write_behind import PendingAnswer, chat_writer
 
 
 router = APIRouter(prefix="/assistant", tags=["assistant"])
@@ -23,10 +48,9 @@ router = APIRouter(prefix="/assistant", tags=["assistant"])
 @router.get("/conversations", response_model=schemas.ConversationListResponse)
 def list_conversations(
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
-    plan: PlanName = org.plan  # type: ignore[assignment]
+    plan: PlanName = principal.plan  # type: ignore[assignment]
     limits = get_plan_limits(plan)
     if not limits["conversation_history"]:
         raise HTTPException(
@@ -35,7 +59,7 @@ def list_conversations(
         )
     convs = (
         db.query(Conversation)
-        .filter(Conversation.org_id == org.id)
+        .filter(Conversation.org_id == principal.org_id)
         .order_by(Conversation.updated_at.desc())
         .limit(50)
         .all()
@@ -47,10 +71,9 @@ def list_conversations(
 def get_conversation_messages(
     conversation_id: UUID,
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
-    plan: PlanName = org.plan  # type: ignore[assignment]
+    plan: PlanName = principal.plan  # type: ignore[assignment]
     limits = get_plan_limits(plan)
     if not limits["conversation_history"]:
         raise HTTPException(
@@ -59,7 +82,7 @@ def get_conversation_messages(
         )
     conv = db.query(Conversation).filter(
         Conversation.id == conversation_id,
-        Conversation.org_id == org.id,
+        Conversation.org_id == principal.org_id,
     ).first()
     if not conv:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
@@ -75,102 +98,361 @@ def get_conversation_messages(
     )
 
 
-@router.post("/chat", response_class=EventSourceResponse, responses={429: {"model": schemas.ErrorResponse}})
-async def chat(
-    payload: schemas.ChatRequest,
-    db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
-):
-    # Rate limit per user via Redis
-    allowed = await rate_limit(f"chat:{user.id}", limit=10, window_seconds=60)
-    if not allowed:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many requests. Please slow down.",
-        )
-
-    # Plan limits for AI queries with proper logging when hard limit hit
-    usage = get_usage_for_org(db, org.id)
-    plan: PlanName = org.plan  # type: ignore[assignment]
-    limits = get_plan_limits(plan)
-    max_q = limits["max_ai_queries"]
-    if max_q is not None and usage.ai_queries_used >= max_q:
+def _check_token_quota(db: Session, org: Organization, user: User, usage: Usage, plan: PlanName, limits: dict) -> None:
+    """429 once the org has used its plan's token allowance for the period."""
+    max_tokens = limits["max_ai_tokens"]
+    used = usage.prompt_tokens_used + usage.completion_tokens_used
+    if max_tokens is not None and used >= max_tokens:
         log_audit_event(
             db,
             org.id,
             user.id,
             "limit_hit",
-            {"kind": "ai_queries", "plan": plan, "used": usage.ai_queries_used, "limit": max_q},
+            {"kind": "ai_tokens", "plan": plan, "used": used, "limit": max_tokens},
         )
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="AI query limit exceeded for current plan. Upgrade to continue.",
+            detail="AI token limit exceeded for current plan. Upgrade to continue.",
         )
 
-    # Fetch per-tenant context from Chroma
-    context, sources = query_context(org.id, payload.message)
-    prompt = build_prompt(payload.message, context)
 
-    # Conversation history persistence (Pro+)
-    conv_id: Optional[UUID] = payload.conversation_id
-    if limits["conversation_history"]:
+async def _refund_query(org_id: UUID, queries: int = 1) -> None:
+    """Give back charged queries that failed before an answer was produced."""
+    with anyio.CancelScope(shield=True):
+        await charge(org_id, "ai_queries_used", -queries)
+
+
+def _record_chat_turn(
+    db: Session,
+    org: Organization,
+    user: User,
+    message: str,
+    conv_id: Optional[UUID],
+    history: bool,
+) -> tuple[Optional[UUID], Optional[str], list[tuple[str, str]]]:
+    """
+    Record the question in one transaction: conversation (Pro+), user
+    message and audit entry. Returns the conversation id with its summary
+    and recent turns for the prompt.
+    """
+    summary: Optional[str] = None
+    turns: list[tuple[str, str]] = []
+    if history:
         if conv_id:
             conv = db.query(Conversation).filter(Conversation.id == conv_id, Conversation.org_id == org.id).first()
+            if not conv:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+            # Rolling summary + last few exchanges, read before this question is added
+            summary, turns = load_history(db, conv)
         else:
             conv = Conversation(
                 org_id=org.id,
                 user_id=user.id,
-                title=payload.message[:80] or "Conversation",
+                title=message[:80] or "Conversation",
             )
             db.add(conv)
             db.flush()
             conv_id = conv.id
-        user_msg = Message(conversation_id=conv_id, role="user", content=payload.message)
-        db.add(user_msg)
+        db.add(Message(conversation_id=conv_id, role="user", content=message))
 
-    usage.ai_queries_used += 1
+    db.add(AuditLog(
+        org_id=org.id,
+        user_id=user.id,
+        action="ai_query",
+        details={"conversation_id": str(conv_id) if conv_id else None},
+    ))
     db.commit()
+    return conv_id, summary, turns
 
-    log_audit_event(
-        db,
-        org.id,
-        user.id,
-        "ai_query",
-        {"conversation_id": str(conv_id) if conv_id else None},
-    )
-    # Capture ORM variables explicitly to prevent DetachedInstanceError
-    _ai_provider = org.ai_provider
-    _ai_model = org.ai_model
-    # Decrypt BYOK key before passing to the AI client
-    _ai_api_key = decrypt_field(org.ai_api_key) if org.ai_api_key else None
+
+@router.post("/chat", response_class=EventSourceResponse, responses={429: {"model": schemas.ErrorResponse}})
+async def chat(
+    payload: schemas.ChatRequest,
+    db: Session = Depends(get_db),
+    org: Organization = Depends(get_current_org),
+    user: User = Depends(get_current_user),
+):
+    timing = ServerTiming("chat")
+    # Rate limit per user via Redis, at the org's plan rate
+    with timing.stage("ratelimit"):
+        chat_rate = get_plan_limits(org.plan)["chat_requests_per_minute"]  # type: ignore[arg-type]
+        limited = await enforce_rate_limit(f"chat:{user.id}", limit=chat_rate, window_seconds=60)
+
+    # Retrieval (embedding + Chroma query) is the slowest pre-stream stage and
+    # needs nothing from the database, so it runs in a worker thread while
+    # quota checks, admission and bookkeeping proceed here.
+    _org_id = org.id
+
+    def retrieve() -> tuple[str, list[dict]]:
+        with timing.stage("retrieval"):
+            return query_context(_org_id, payload.message)
+
+    retrieval = asyncio.get_running_loop().run_in_executor(None, retrieve)
+    charged = False
+    try:
+        # Plan limits with proper logging when a hard limit is hit. The query
+        # is checked and counted in one atomic step on the Redis counter, and
+        # given back below if the request fails before the answer starts.
+        with timing.stage("quota"):
+            usage = get_usage_for_org(db, org.id)
+            plan: PlanName = org.plan  # type: ignore[assignment]
+            limits = get_plan_limits(plan)
+            max_q = limits["max_ai_queries"]
+            _check_token_quota(db, org, user, usage, plan, limits)
+            try:
+                await charge(org.id, "ai_queries_used", 1, max_q)
+            except UsageLimitExceeded as exc:
+                log_audit_event(
+                    db,
+                    org.id,
+                    user.id,
+                    "limit_hit",
+                    {"kind": "ai_queries", "plan": plan, "used": exc.used, "limit": max_q},
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="AI query limit exceeded for current plan. Upgrade to continue.",
+                )
+            charged = True
+
+        # Admission control: wait for an LLM slot (enterprise first, fair share
+        # otherwise) or fail fast with 429.
+        with timing.stage("queue"):
+            slot = await acquire_llm_slot(plan, org.id, org.ai_provider or "groq")
+    except BaseException:
+        retrieval.cancel()
+        if charged:
+            await _refund_query(org.id)
+        raise
+    try:
+        with timing.stage("bookkeeping"):
+            if payload.conversation_id and chat_writer.has_pending(payload.conversation_id):
+                # A follow-up sent right after the previous answer: make sure
+                # that answer is in the history we are about to read
+                await chat_writer.sync()
+            conv_id, summary, turns = _record_chat_turn(
+                db, org, user, payload.message, payload.conversation_id, limits["conversation_history"]
+            )
+            # Capture ORM variables explicitly to prevent DetachedInstanceError
+            _ai_provider = org.ai_provider
+            _ai_model = org.ai_model
+            _ai_fallback_provider = org.ai_fallback_provider
+            # Decrypt BYOK key before passing to the AI client
+            _ai_api_key = decrypt_field(org.ai_api_key) if org.ai_api_key else None
+
+        with timing.stage("retrieval_wait"):
+            context, sources = await retrieval
+        prompt = build_prompt(payload.message, context, summary, turns)
+    except BaseException:
+        retrieval.cancel()
+        slot.release()
+        await _refund_query(_org_id)
+        raise
 
     async def token_stream():
         answer_parts: list[str] = []
-        async for token in stream_chat_completion(
-            org_plan=plan,
-            prompt=prompt,
-            ai_provider=_ai_provider,
-            ai_model=_ai_model,
-            ai_api_key=_ai_api_key,
-        ):
-            answer_parts.append(token)
-            yield token
-
-        # Persist assistant message with sources at the end if plan allows history
-        if limits["conversation_history"] and conv_id:
-            full_answer = "".join(answer_parts)
-            conv = db.query(Conversation).filter(Conversation.id == conv_id).first()
-            if conv:
-                conv.updated_at = datetime.now(timezone.utc)
-            msg = Message(
-                conversation_id=conv_id,
-                role="assistant",
-                content=full_answer,
-                sources=sources,
-            )
-            db.add(msg)
-            db.commit()
+        llm_usage = LLMUsage()
+        truncated = True
+        try:
+            async with aclosing(stream_chat_completion(
+                org_plan=plan,
+                prompt=prompt,
+                ai_provider=_ai_provider,
+                ai_model=_ai_model,
+                ai_api_key=_ai_api_key,
+                fallback_provider=_ai_fallback_provider,
+                usage=llm_usage,
+                slot=slot,
+            )) as upstream:
+                async for token in upstream:
+                    answer_parts.append(token)
+                    yield token
+            truncated = False
+        finally:
+            slot.release()
+            # Hand the answer to the write-behind queue so teardown does not
+            # wait on the database. The assistant message (with sources) is
+            # kept if the plan allows history; a client that disconnects
+            # mid-answer still gets the partial answer recorded, flagged as
+            # truncated.
+            message = None
+            if limits["conversation_history"] and conv_id:
+                message = {
+                    "role": "assistant",
+                    "content": "".join(answer_parts),
+                    "sources": sources,
+                    "truncated": truncated,
+                    "llm_model": llm_usage.model,
+                    "prompt_tokens": llm_usage.prompt_tokens,
+                    "completion_tokens": llm_usage.completion_tokens,
+                    "cached_prompt_tokens": llm_usage.cached_prompt_tokens,
+                    "tokens_estimated": llm_usage.estimated,
+                }
+            metered = llm_usage.provider is not None
+            if message is not None or metered:
+                chat_writer.submit(PendingAnswer(
+                    _org_id,
+                    conv_id if message is not None else None,
+                    message,
+                    datetime.now(timezone.utc),
+                    (llm_usage.prompt_tokens or 0) if metered else 0,
+                    (llm_usage.completion_tokens or 0) if metered else 0,
+                    (llm_usage.cached_prompt_tokens or 0) if metered else 0,
+                ))
+
+    background = BackgroundTasks()
+    background.add_task(slot.release)
+    if limits["conversation_history"] and conv_id:
+        # The summary refresh counts persisted messages, so flush this answer first
+        background.add_task(chat_writer.sync)
+        background.add_task(refresh_summary, _org_id, conv_id, plan, _ai_provider, _ai_model, _ai_api_key)
+
+    response = await sse_chat_response(
+        token_stream(),
+        background=background,
+        flush_ms=payload.flush_ms,
+        flush_bytes=payload.flush_bytes,
+    )
+    # Pre-stream breakdown; `prestream` is when the LLM request starts
+    response.headers["Server-Timing"] = timing.header("prestream")
+    response.headers.update(limited.headers())
+    return response
+
+
+@router.post(
+    "/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}, 429: {"model": schemas.ErrorResponse}},
+)
+async def chat_batch(
+    payload: schemas.BatchChatRequest,
+    db: Session = Depends(get_db),
+    org: Organization = Depends(get_current_org),
+    user: User = Depends(get_current_user),
+):
+    """
+    Answer many questions about the org's corpus in one request. Questions are
+    embedded and retrieved in a single vector query, LLM calls fan out with
+    bounded concurrency, and each answer is streamed back as one NDJSON line
+    ({"index", "question", "answer", "sources", "usage"}) as soon as it finishes.
+    Batch answers are not stored in conversation history.
+    """
+    batch_rate = get_plan_limits(org.plan)["batch_requests_per_minute"]  # type: ignore[arg-type]
+    limited = await enforce_rate_limit(f"chat_batch:{user.id}", limit=batch_rate, window_seconds=60)
+
+    questions = payload.questions
+    n = len(questions)
+    usage = get_usage_for_org(db, org.id)
+    plan: PlanName = org.plan  # type: ignore[assignment]
+    limits = get_plan_limits(plan)
+    max_q = limits["max_ai_queries"]
+    _check_token_quota(db, org, user, usage, plan, limits)
+
+    # Count the whole batch in one atomic check-and-increment so concurrent
+    # requests cannot jointly overshoot the plan limit.
+    try:
+        await charge(org.id, "ai_queries_used", n, max_q)
+    except UsageLimitExceeded as exc:
+        log_audit_event(
+            db,
+            org.id,
+            user.id,
+            "limit_hit",
+            {"kind": "ai_queries", "plan": plan, "used": exc.used, "limit": max_q, "batch": n},
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=(
+                f"Batch of {n} questions would exceed the AI query limit for current plan "
+                f"({max(0, max_q - exc.used)} remaining). Upgrade to continue."
+            ),
+        )
+    _org_id = org.id
+    try:
+        db.add_all([
+            AuditLog(org_id=org.id, user_id=user.id, action="ai_query", details={"batch": True})
+            for _ in questions
+        ])
+        db.commit()
+
+        _ai_provider = org.ai_provider
+        _ai_model = org.ai_model
+        _ai_fallback_provider = org.ai_fallback_provider
+        _ai_api_key = decrypt_field(org.ai_api_key) if org.ai_api_key else None
+
+        contexts = await asyncio.to_thread(query_context_batch, _org_id, questions)
+    except BaseException:
+        await _refund_query(_org_id, n)
+        raise
+    semaphore = asyncio.Semaphore(max(1, get_settings().assistant_batch_concurrency))
+    usages = [LLMUsage() for _ in questions]
+    # Questions answered with an error are given back once the batch ends
+    failed = 0
+
+    async def answer(index: int) -> dict:
+        nonlocal failed
+        context, sources = contexts[index]
+        result = {"index": index, "question": questions[index]}
+        async with semaphore:
+            try:
+                # Already admitted and charged, so wait for a slot rather than bounce
+                slot = await scheduler.acquire(plan, _org_id, _ai_provider or "groq", bounded=False)
+            except QueueFull as exc:
+                failed += 1
+                return {**result, "error": "The AI service is at capacity.", "retry_after": exc.retry_after}
+            try:
+                async with aclosing(stream_chat_completion(
+                    org_plan=plan,
+                    prompt=build_prompt(questions[index], context),
+                    ai_provider=_ai_provider,
+                    ai_model=_ai_model,
+                    ai_api_key=_ai_api_key,
+                    fallback_provider=_ai_fallback_provider,
+                    usage=usages[index],
+                    slot=slot,
+                )) as upstream:
+                    parts = [token async for token in upstream]
+            except Exception as exc:
+                failed += 1
+                return {**result, "error": str(exc)}
+            finally:
+                slot.release()
+        if usages[index].provider is None:
+            # The provider failed before answering (or is not configured);
+            # the text is its error message, not an answer
+            failed += 1
+            return {**result, "error": "".join(parts)}
+        tokens = {
+            "prompt_tokens": usages[index].prompt_tokens,
+            "completion_tokens": usages[index].completion_tokens,
+        }
+        return {**result, "answer": "".join(parts), "sources": sources, "usage": tokens}
 
-    return await sse_chat_response(token_stream())
+    async def ndjson_stream():
+        tasks = [asyncio.create_task(answer(i)) for i in range(n)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client went away mid-batch: stop any LLM calls still running,
+            # give back the questions that were cut off, then meter whatever
+            # was generated in one update.
+            for task in tasks:
+                task.cancel()
+            with anyio.CancelScope(shield=True):
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                cancelled = sum(isinstance(r, asyncio.CancelledError) for r in results)
+                if failed + cancelled:
+                    await _refund_query(_org_id, failed + cancelled)
+                metered = [u for u in usages if u.provider is not None]
+                if metered:
+                    await asyncio.to_thread(
+                        add_token_usage,
+                        db,
+                        _org_id,
+                        sum(u.prompt_tokens or 0 for u in metered),
+                        sum(u.completion_tokens or 0 for u in metered),
+                        sum(u.cached_prompt_tokens or 0 for u in metered),
+                    )
 
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson", headers=limited.headers())
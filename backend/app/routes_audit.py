@@ -11,7 +11,7 @@ from sqlalchemy.orm import Session
 from . import schemas
 from .config import PlanName, get_plan_limits
 from .db import get_db
-from .dependencies import get_current_org, get_current_user, require_role
+from .dependencies import Principal, get_current_org, get_current_user, get_principal, require_role
 from .models import AuditLog, Organization, User
 
 
@@ -21,8 +21,7 @@ router = APIRouter(prefix="/audit-log", tags=["audit"])
 @router.get("/", response_model=schemas.AuditLogListResponse, dependencies=[Depends(require_role("owner", "admin"))])
 def list_audit_log(
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
     action: Optional[str] = Query(None),
     user_id: Optional[str] = Query(None),
     start: Optional[datetime] = Query(None),
@@ -30,12 +29,12 @@ def list_audit_log(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
 ):
-    plan: PlanName = org.plan  # type: ignore[assignment]
+    plan: PlanName = principal.plan  # type: ignore[assignment]
     limits = get_plan_limits(plan)
     if not limits["audit_log"]:
         raise HTTPException(status_code=403, detail="Audit log not available on current plan")
 
-    q = db.query(AuditLog).filter(AuditLog.org_id == org.id)
+    q = db.query(AuditLog).filter(AuditLog.org_id == principal.org_id)
 
     if action:
         q = q.filter(AuditLog.action == action)
@@ -1,24 +1,23 @@
 from datetime import datetime, timedelta, timezone
 import secrets
 from typing import Optional
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
 from . import schemas
 from .audit import log_audit_event
 from .config import PlanName, get_settings
 from .db import get_db
-from .dependencies import get_current_org, get_current_user
+from .dependencies import get_current_org, get_current_user, issue_access_token
 from .email_service import send_password_reset_email
 from .models import Organization, PasswordResetToken, Usage, User
-from .redis_client import blacklist_token, is_token_blacklisted, rate_limit
-from .security import (
-    create_access_token,
-    create_refresh_token,
-    get_password_hash,
-    verify_password,
-)
+from .principal_cache import invalidate_principals
+from .rate_limits import enforce_rate_limit
+from .token_blocklist import blacklist_token, is_token_blacklisted
+from .password_hashing import check_password, hash_password, hash_password_blocking
+from .security import create_refresh_token
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -31,11 +30,21 @@ def _slugify(name: str) -> str:
 
 
 @router.post("/register", response_model=schemas.TokenPair, responses={400: {"model": schemas.ErrorResponse}})
-async def register(request: Request, payload: schemas.RegisterRequest, db: Session = Depends(get_db)):
+async def register(
+    request: Request,
+    response: Response,
+    payload: schemas.RegisterRequest,
+    db: Session = Depends(get_db),
+):
     # Rate-limit registrations per IP to prevent abuse (Security #6)
     client_ip = request.client.host if request.client else "unknown"
-    if not await rate_limit(f"register:{client_ip}", limit=5, window_seconds=3600):
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many registration attempts. Try again later.")
+    limited = await enforce_rate_limit(
+        f"register:{client_ip}",
+        limit=get_settings().register_rate_limit_per_hour,
+        window_seconds=3600,
+        detail="Too many registration attempts. Try again later.",
+    )
+    response.headers.update(limited.headers())
 
     existing = db.query(User).filter(User.email == payload.email).first()
     if existing:
@@ -44,6 +53,9 @@ async def register(request: Request, payload: schemas.RegisterRequest, db: Sessi
             detail="User with this email already exists",
         )
 
+    # Hash before the first write so the transaction isn't held open across bcrypt
+    password_hash = await hash_password(payload.password)
+
     slug_base = _slugify(payload.org_name)
     slug = slug_base
     idx = 1
@@ -59,7 +71,7 @@ async def register(request: Request, payload: schemas.RegisterRequest, db: Sessi
     user = User(
         org_id=org.id,
         email=payload.email,
-        password_hash=get_password_hash(payload.password),
+        password_hash=password_hash,
         role="owner",
         is_verified=True,
         last_login=now,
@@ -74,23 +86,34 @@ async def register(request: Request, payload: schemas.RegisterRequest, db: Sessi
 
     log_audit_event(db, org.id, user.id, "login", {"method": "register"})
 
-    access = create_access_token(str(user.id))
+    access = await issue_access_token(db, user)
     refresh = create_refresh_token(str(user.id))
     return schemas.TokenPair(access_token=access, refresh_token=refresh)
 
 
 @router.post("/login", response_model=schemas.TokenPair, responses={400: {"model": schemas.ErrorResponse}})
-async def login(request: Request, payload: schemas.LoginRequest, db: Session = Depends(get_db)):
+async def login(
+    request: Request,
+    response: Response,
+    payload: schemas.LoginRequest,
+    db: Session = Depends(get_db),
+):
     # Rate-limit login attempts per email to prevent brute-force (Security #6)
-    if not await rate_limit(f"login:{payload.email}", limit=10, window_seconds=60):
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many login attempts. Try again in a minute.")
+    limited = await enforce_rate_limit(
+        f"login:{payload.email}",
+        limit=get_settings().login_rate_limit_per_minute,
+        window_seconds=60,
+        detail="Too many login attempts. Try again in a minute.",
+    )
+    response.headers.update(limited.headers())
 
     user = db.query(User).filter(User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+    if not user or not await check_password(payload.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect email or password")
     user.last_login = datetime.now(timezone.utc)
     db.commit()
     db.refresh(user)
+    invalidate_principals(user_ids=[user.id])
 
     org = db.query(Organization).filter(Organization.id == user.org_id).first()
     if not org:
@@ -98,7 +121,7 @@ async def login(request: Request, payload: schemas.LoginRequest, db: Session = D
 
     log_audit_event(db, org.id, user.id, "login", {"method": "password"})
 
-    access = create_access_token(str(user.id))
+    access = await issue_access_token(db, user)
     refresh = create_refresh_token(str(user.id))
     return schemas.TokenPair(access_token=access, refresh_token=refresh)
 
@@ -121,21 +144,22 @@ async def refresh(payload: schemas.RefreshRequest, db: Session = Depends(get_db)
 
     # Bug 10: Check if this refresh token has been revoked
     jti = decoded.get("jti")
-    if jti and await is_token_blacklisted(jti):
+    if jti and await is_token_blacklisted(jti, decoded.get("exp", 0)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has been revoked")
 
-    user = db.query(User).filter(User.id == sub).first()
+    try:
+        user_id = UUID(sub)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
     # Blacklist the consumed refresh token (token rotation)
     if jti:
-        import math
-        exp = decoded.get("exp", 0)
-        remaining = max(0, math.ceil(exp - datetime.now(timezone.utc).timestamp()))
-        await blacklist_token(jti, remaining)
+        await blacklist_token(jti, decoded.get("exp", 0))
 
-    access = create_access_token(str(user.id))
+    access = await issue_access_token(db, user)
     new_refresh = create_refresh_token(str(user.id))
     return schemas.TokenPair(access_token=access, refresh_token=new_refresh)
 
@@ -154,10 +178,7 @@ async def logout(payload: schemas.RefreshRequest):
         )
         jti = decoded.get("jti")
         if jti:
-            import math
-            exp = decoded.get("exp", 0)
-            remaining = max(0, math.ceil(exp - datetime.now(timezone.utc).timestamp()))
-            await blacklist_token(jti, remaining)
+            await blacklist_token(jti, decoded.get("exp", 0))
     except JWTError:
         pass  # Token already invalid — still OK to return 200
     return {"status": "ok"}
@@ -194,16 +215,13 @@ def password_reset_confirm(payload: schemas.PasswordResetConfirmRequest, db: Ses
     user = db.query(User).filter(User.id == reset.user_id).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
-    user.password_hash = get_password_hash(payload.new_password)
+    user.password_hash = hash_password_blocking(payload.new_password)
     reset.used_at = now
     db.commit()
     return {"status": "ok"}
 
 
 @router.get("/me", response_model=schemas.MeResponse)
-def me(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    org = db.query(Organization).filter(Organization.id == user.org_id).first()
-    if not org:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+def me(user: User = Depends(get_current_user), org: Organization = Depends(get_current_org)):
     return schemas.MeResponse(user=user, organization=org)
 
@@ -11,6 +11,7 @@ from .config import PlanName, get_plan_limits, get_settings
 from .db import get_db
 from .dependencies import get_current_org, get_current_user
 from .models import Organization, StripeEvent, User
+from .principal_cache import invalidate_principals
 
 
 settings = get_settings()
@@ -52,6 +53,7 @@ def create_checkout_session(
         customer_id = customer["id"]
         org.stripe_customer_id = customer_id
         db.commit()
+        invalidate_principals(org_ids=[org.id])
 
     session = stripe.checkout.Session.create(
         customer=customer_id,
@@ -113,6 +115,7 @@ async def stripe_webhook(
                 org.plan = target_plan
                 org.stripe_subscription_id = subscription_id
                 db.commit()
+                invalidate_principals(org_ids=[org.id], revoke_tokens=True)
                 log_audit_event(
                     db,
                     org.id,
@@ -137,6 +140,7 @@ async def stripe_webhook(
             if new_plan:
                 org.plan = new_plan
                 db.commit()
+                invalidate_principals(org_ids=[org.id], revoke_tokens=True)
                 log_audit_event(
                     db,
                     org.id,
@@ -153,6 +157,7 @@ async def stripe_webhook(
             org.plan = "free"
             org.stripe_subscription_id = None
             db.commit()
+            invalidate_principals(org_ids=[org.id], revoke_tokens=True)
             log_audit_event(
                 db,
                 org.id,
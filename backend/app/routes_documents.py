@@ -4,16 +4,23 @@ from pathlib import Path
 from typing import List
 from uuid import UUID
 
+import anyio
 from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 
 from . import schemas
 from .ai import get_org_collection, index_document
 from .audit import log_audit_event
-from .config import get_settings
+from .config import get_plan_limits, get_settings
 from .db import get_db
-from .dependencies import enforce_plan_limits, get_current_org, get_current_user, get_usage_for_org
-from .models import Document, Organization, Usage, User
+from .dependencies import (
+    Principal,
+    get_current_org,
+    get_current_user,
+    get_principal,
+)
+from .models import Document, Organization, User
+from .usage_counters import UsageLimitExceeded, charge
 
 logger = logging.getLogger(__name__)
 
@@ -96,12 +103,11 @@ def _document_path(org_id: UUID, document_id: UUID, filename: str) -> Path:
 @router.get("/", response_model=schemas.DocumentListResponse)
 def list_documents(
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
     docs = (
         db.query(Document)
-        .filter(Document.org_id == org.id)
+        .filter(Document.org_id == principal.org_id)
         .order_by(Document.created_at.desc())
         .all()
     )
@@ -121,9 +127,6 @@ async def upload_document(
     org: Organization = Depends(get_current_org),
     user: User = Depends(get_current_user),
 ):
-    usage = get_usage_for_org(db, org.id)
-    enforce_plan_limits(org, usage, kind="documents")
-
     contents = await file.read()
     if len(contents) == 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty file")
@@ -149,6 +152,15 @@ async def upload_document(
     # MIME / magic-byte check — catches renamed binary files (e.g. malware.exe → doc.pdf)
     _validate_content(file.filename or "", contents)
 
+    # Checked and counted in one atomic step on the Redis counter
+    try:
+        await charge(org.id, "documents_uploaded", 1, get_plan_limits(org.plan)["max_documents"])  # type: ignore[arg-type]
+    except UsageLimitExceeded:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Document upload limit exceeded for current plan. Upgrade to continue.",
+        )
+
     doc = Document(
         org_id=org.id,
         uploaded_by=user.id,
@@ -157,9 +169,12 @@ async def upload_document(
         status="processing",
     )
     db.add(doc)
-
-    usage.documents_uploaded += 1
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        await charge(org.id, "documents_uploaded", -1)
+        raise
     db.refresh(doc)
 
     # Persist file to disk
@@ -220,10 +235,9 @@ async def upload_document(
 def get_document_status(
     document_id: UUID,
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
-    doc = db.query(Document).filter(Document.id == document_id, Document.org_id == org.id).first()
+    doc = db.query(Document).filter(Document.id == document_id, Document.org_id == principal.org_id).first()
     if not doc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
     return schemas.DocumentStatusResponse(id=doc.id, status=doc.status)
@@ -233,16 +247,15 @@ def get_document_status(
 def get_document_chunks(
     document_id: UUID,
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
-    doc = db.query(Document).filter(Document.id == document_id, Document.org_id == org.id).first()
+    doc = db.query(Document).filter(Document.id == document_id, Document.org_id == principal.org_id).first()
     if not doc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
     if doc.status != "ready":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Document is not yet indexed")
 
-    collection = get_org_collection(org.id)
+    collection = get_org_collection(principal.org_id)
     all_data = collection.get(
         ids=[f"{document_id}_{i}" for i in range(doc.chunk_count)],
         include=["documents", "metadatas"],
@@ -270,12 +283,10 @@ def delete_document(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
 
     db.delete(doc)
+    db.commit()
 
     # MED-06: decrement usage counter so freed slots can be reused
-    usage = get_usage_for_org(db, org.id)
-    usage.documents_uploaded = max(0, usage.documents_uploaded - 1)
-
-    db.commit()
+    anyio.from_thread.run(charge, org.id, "documents_uploaded", -1)
 
     # Bug 6 fix: remove vector embeddings from ChromaDB so deleted docs
     # are no longer retrieved as AI context
@@ -1,14 +1,22 @@
+import logging
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from . import schemas
+from .ai import drop_org_collection
 from .audit import log_audit_event
+from .config import get_settings
 from .crypto import encrypt_field
 from .db import get_db
 from .dependencies import get_current_org, get_current_user, require_role
 from .models import Organization, User
-from .security import get_password_hash, verify_password
+from .password_hashing import check_password_blocking, hash_password_blocking
+from .principal_cache import invalidate_principals
+
 
+logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
@@ -31,6 +39,7 @@ def update_org(
 ):
     org.name = payload.name
     db.commit()
+    invalidate_principals(org_ids=[org.id])
     log_audit_event(db, org.id, user.id, "org_updated", {"name": payload.name})
     return {"status": "ok"}
 
@@ -41,6 +50,11 @@ def update_ai_prefs(
     org: Organization = Depends(get_current_org),
     user: User = Depends(get_current_user),
 ):
+    if payload.ai_provider == "mock" and not settings.mock_llm_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The mock AI provider is not enabled on this deployment.",
+        )
     # Only update the AI key if the user actually typed a new one, else keep the existing
     org.ai_provider = payload.ai_provider
     if payload.ai_model:
@@ -48,9 +62,18 @@ def update_ai_prefs(
     if payload.ai_api_key and payload.ai_api_key.strip():
         # Encrypt at rest — never store plaintext BYOK keys in the DB
         org.ai_api_key = encrypt_field(payload.ai_api_key.strip())
+    if "ai_fallback_provider" in payload.model_fields_set:
+        org.ai_fallback_provider = payload.ai_fallback_provider
 
     db.commit()
-    log_audit_event(db, org.id, user.id, "ai_prefs_updated", {"provider": payload.ai_provider})
+    invalidate_principals(org_ids=[org.id])
+    log_audit_event(
+        db,
+        org.id,
+        user.id,
+        "ai_prefs_updated",
+        {"provider": payload.ai_provider, "fallback_provider": org.ai_fallback_provider},
+    )
     return {"status": "ok"}
 
 
@@ -65,10 +88,19 @@ def delete_org(
     user: User = Depends(get_current_user),
 ):
     org_id = org.id
+    member_ids = [row.id for row in db.query(User.id).filter(User.org_id == org_id)]
     db.delete(org)
     db.commit()
+    invalidate_principals(user_ids=member_ids, org_ids=[org_id], revoke_tokens=True)
     log_audit_event(db, org_id, user.id, "org_deleted", {})
 
+    # Drop the tenant's vectors too; anything missed here is picked up by
+    # the vector maintenance job.
+    try:
+        drop_org_collection(org_id)
+    except Exception as exc:
+        logger.warning("Could not drop ChromaDB collection for org %s: %s", org_id, exc)
+
 
 @router.post("/profile/password", response_model=dict)
 def change_password(
@@ -76,9 +108,9 @@ def change_password(
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    if not verify_password(payload.current_password, user.password_hash):
+    if not check_password_blocking(payload.current_password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Current password is incorrect")
-    user.password_hash = get_password_hash(payload.new_password)
+    user.password_hash = hash_password_blocking(payload.new_password)
     db.commit()
     return {"status": "ok"}
 
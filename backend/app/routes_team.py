@@ -2,6 +2,7 @@ from datetime import datetime, timedelta, timezone
 import secrets
 from typing import Optional
 
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
@@ -17,6 +18,7 @@ from .dependencies import (
 )
 from .email_service import send_invite_email
 from .models import Invite, Organization, Usage, User
+from .principal_cache import invalidate_principals
 
 
 router = APIRouter(prefix="/team", tags=["team"])
@@ -107,8 +109,9 @@ def accept_invite(payload: schemas.InviteAcceptRequest, db: Session = Depends(ge
     if not org:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Organization not found")
 
-    from .security import get_password_hash, create_access_token, create_refresh_token
-    from .dependencies import get_current_period
+    from .password_hashing import hash_password_blocking
+    from .security import create_refresh_token
+    from .dependencies import get_current_period, issue_access_token
 
     existing = db.query(User).filter(User.org_id == org.id, User.email == invite.email).first()
     if existing:
@@ -117,7 +120,7 @@ def accept_invite(payload: schemas.InviteAcceptRequest, db: Session = Depends(ge
     user = User(
         org_id=org.id,
         email=invite.email,
-        password_hash=get_password_hash(payload.password),
+        password_hash=hash_password_blocking(payload.password),
         role=invite.role,
         is_verified=True,
         last_login=datetime.now(timezone.utc),
@@ -139,7 +142,7 @@ def accept_invite(payload: schemas.InviteAcceptRequest, db: Session = Depends(ge
 
     log_audit_event(db, org.id, user.id, "member_invited", {"email": invite.email, "accepted": True})
 
-    access = create_access_token(str(user.id))
+    access = anyio.from_thread.run(issue_access_token, db, user)
     refresh = create_refresh_token(str(user.id))
     return schemas.TokenPair(access_token=access, refresh_token=refresh)
 
@@ -164,6 +167,7 @@ def update_member_role(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
     member.role = payload.role
     db.commit()
+    invalidate_principals(user_ids=[member_id], revoke_tokens=True)
 
     log_audit_event(
         db,
@@ -201,6 +205,7 @@ def remove_member(
         usage.seats_used -= 1
 
     db.commit()
+    invalidate_principals(user_ids=[member_id], revoke_tokens=True)
 
     log_audit_event(
         db,
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta, timezone
 
+import anyio
 from fastapi import APIRouter, Depends
 from sqlalchemy import func
 from sqlalchemy.orm import Session
@@ -7,8 +8,9 @@ from sqlalchemy.orm import Session
 from . import schemas
 from .config import PlanName, get_plan_limits
 from .db import get_db
-from .dependencies import get_current_org, get_current_user, get_usage_for_org
-from .models import AuditLog, Organization, User
+from .dependencies import Principal, get_principal, get_usage_for_org
+from .models import AuditLog
+from .usage_counters import live_totals
 
 
 router = APIRouter(prefix="/usage", tags=["usage"])
@@ -17,13 +19,19 @@ router = APIRouter(prefix="/usage", tags=["usage"])
 @router.get("/", response_model=schemas.UsageResponse)
 def get_usage(
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
+    principal: Principal = Depends(get_principal),
 ):
-    usage = get_usage_for_org(db, org.id)
-    plan: PlanName = org.plan  # type: ignore[assignment]
+    usage = get_usage_for_org(db, principal.org_id)
+    # The row trails the Redis counters by up to one flush interval
+    live = anyio.from_thread.run(live_totals, principal.org_id)
+    ai_queries_used = live.get("ai_queries_used", usage.ai_queries_used)
+    documents_uploaded = live.get("documents_uploaded", usage.documents_uploaded)
+    plan: PlanName = principal.plan  # type: ignore[assignment]
     limits = get_plan_limits(plan)
 
     ai_limit = limits["max_ai_queries"]
+    token_limit = limits["max_ai_tokens"]
+    tokens_used = usage.prompt_tokens_used + usage.completion_tokens_used
     doc_limit = limits["max_documents"]
     seat_limit = limits["max_users"]
 
@@ -36,16 +44,22 @@ def get_usage(
         if 0.8 <= ratio < 1.0:
             warnings.append(f"You've used {int(ratio * 100)}% of your {label} {unit} this month.")
 
-    maybe_warn(usage.ai_queries_used, ai_limit, "AI query", "limit")
-    maybe_warn(usage.documents_uploaded, doc_limit, "document upload", "limit")
+    maybe_warn(ai_queries_used, ai_limit, "AI query", "limit")
+    maybe_warn(tokens_used, token_limit, "AI token", "limit")
+    maybe_warn(documents_uploaded, doc_limit, "document upload", "limit")
     maybe_warn(usage.seats_used, seat_limit, "team seat", "limit")
 
     return schemas.UsageResponse(
         usage=schemas.UsageMetrics(
             period=usage.period,
-            ai_queries_used=usage.ai_queries_used,
+            ai_queries_used=ai_queries_used,
             ai_queries_limit=ai_limit,
-            documents_uploaded=usage.documents_uploaded,
+            ai_tokens_used=tokens_used,
+            ai_tokens_limit=token_limit,
+            prompt_tokens_used=usage.prompt_tokens_used,
+            completion_tokens_used=usage.completion_tokens_used,
+            cached_prompt_tokens_used=usage.cached_prompt_tokens_used,
+            documents_uploaded=documents_uploaded,
             documents_limit=doc_limit,
             seats_used=usage.seats_used,
             seats_limit=seat_limit,
@@ -57,8 +71,7 @@ def get_usage(
 @router.get("/analytics", response_model=schemas.AnalyticsResponse)
 def get_analytics(
     db: Session = Depends(get_db),
-    org: Organization = Depends(get_current_org),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_principal),
 ):
     now = datetime.now(timezone.utc)
     start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -68,7 +81,7 @@ def get_analytics(
     query_rows = (
         db.query(date_col, func.count())
         .filter(
-            AuditLog.org_id == org.id,
+            AuditLog.org_id == principal.org_id,
             AuditLog.action == "ai_query",
             AuditLog.created_at >= start_of_month,
         )
@@ -80,7 +93,7 @@ def get_analytics(
     doc_rows = (
         db.query(date_col, func.count())
         .filter(
-            AuditLog.org_id == org.id,
+            AuditLog.org_id == principal.org_id,
             AuditLog.action == "document_uploaded",
             AuditLog.created_at >= start_of_month,
         )
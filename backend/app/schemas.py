@@ -35,15 +35,18 @@ class OrganizationBase(BaseModel):
     ai_provider: str
     ai_model: Optional[str] = None
     ai_api_key: Optional[str] = None
+    ai_fallback_provider: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
 class UpdateAIPrefsRequest(BaseModel):
-    ai_provider: Literal["groq", "openai", "anthropic"]
+    ai_provider: Literal["groq", "openai", "anthropic", "mock"]
     ai_model: Optional[str] = None
     ai_api_key: Optional[str] = None
+    # Only changed when sent; null turns failover off
+    ai_fallback_provider: Optional[Literal["groq", "openai", "anthropic"]] = None
 
 
 class MeResponse(BaseModel):
@@ -109,6 +112,11 @@ class UsageMetrics(BaseModel):
     period: str
     ai_queries_used: int
     ai_queries_limit: Optional[int]
+    ai_tokens_used: int
+    ai_tokens_limit: Optional[int]
+    prompt_tokens_used: int
+    completion_tokens_used: int
+    cached_prompt_tokens_used: int
     documents_uploaded: int
     documents_limit: Optional[int]
     seats_used: int
@@ -161,6 +169,13 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[UUID] = None
+    # Per-request SSE coalescing; omitted fields use SSE_FLUSH_* settings
+    flush_ms: Optional[int] = Field(None, ge=0, le=1000)
+    flush_bytes: Optional[int] = Field(None, ge=0, le=65536)
+
+
+class BatchChatRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1, max_length=50)
 
 
 class ConversationItem(BaseModel):
@@ -181,6 +196,9 @@ class MessageItem(BaseModel):
     id: UUID
     role: Literal["user", "assistant"]
     content: str
+    truncated: bool = False
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
     created_at: datetime
 
     class Config:
@@ -1,3 +1,4 @@
+import hashlib
 import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
@@ -8,15 +9,20 @@ from passlib.context import CryptContext
 from .config import get_settings
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 settings = get_settings()
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 
-def create_access_token(subject: str, expires_delta: Optional[timedelta] = None) -> str:
+def create_access_token(
+    subject: str,
+    expires_delta: Optional[timedelta] = None,
+    claims: Optional[dict[str, Any]] = None,
+) -> str:
     if expires_delta is None:
         expires_delta = timedelta(minutes=settings.access_token_expire_minutes)
     expire = datetime.now(timezone.utc) + expires_delta
-    to_encode: dict[str, Any] = {"sub": subject, "exp": expire}
+    # Extra claims (org_id, role, plan, token versions) let read paths authorise without a lookup
+    to_encode: dict[str, Any] = {**(claims or {}), "sub": subject, "exp": expire}
     return jwt.encode(to_encode, settings.jwt_secret, algorithm=settings.jwt_algorithm)
 
 
@@ -42,6 +48,11 @@ def verify_token(token: str) -> dict[str, Any]:
         raise ValueError("Invalid token") from exc
 
 
+def hash_api_key(key: str) -> str:
+    # API keys are high-entropy random strings, so a fast unsalted hash is enough
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
 def get_password_hash(password: str) -> str:
     # bcrypt has a hard 72-byte limit; defensively truncate longer passwords
     encoded = password.encode("utf-8")
@@ -0,0 +1,230 @@
+"""
+Refresh-token blocklist.
+
+A revoked refresh token's JTI is stored in Redis as `blocklist:{jti}` until
+the token expires. Most tokens checked in `refresh` were never revoked, so
+each worker also keeps a Bloom filter of revoked JTIs. A JTI the filter has
+not seen is answered locally with no Redis call. A possible hit is confirmed
+with EXISTS, so false positives cost one round trip and never reject a valid
+token.
+
+There is one filter per TOKEN_BLOCKLIST_WINDOW_HOURS of token expiry time,
+and a JTI goes in the filter for the window its token expires in. Once a
+window is in the past, every token in it has expired and the filter is
+dropped. Memory is therefore bounded by the refresh-token lifetime divided
+by the window, times one filter. Each filter is sized for
+TOKEN_BLOCKLIST_CAPACITY revocations at TOKEN_BLOCKLIST_ERROR_RATE. A busier
+window still works; it just sends more checks to Redis.
+
+Workers learn about each other's revocations over the `blocklist:revoked`
+pub/sub channel, usually within milliseconds. On (re)subscribing, a worker
+loads existing entries with SCAN. Until that has finished, and whenever the
+subscription is down, every check goes to Redis as before. An idle
+subscription is pinged, so a dead connection is noticed within about two
+ping intervals. The app lifespan starts and stops the listener.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, Iterator, Optional
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError
+
+from . import metrics
+from .config import get_settings
+from .redis_client import redis
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+REVOKED_CHANNEL = "blocklist:revoked"
+_KEY_PREFIX = "blocklist:"
+_PING_SECONDS = 15.0
+_RETRY_SECONDS = 5.0
+_LOAD_BATCH = 1000
+
+
+class BloomFilter:
+    __slots__ = ("size", "hashes", "_bits")
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class TokenBlocklist:
+    def __init__(self, window_seconds: float, capacity: int, error_rate: float) -> None:
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.synced = False
+        self._warned = False
+        self._filters: Dict[int, BloomFilter] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _window(self, expires_at: float) -> int:
+        return int(expires_at // self.window_seconds)
+
+    def _rotate(self, now: float) -> None:
+        current = self._window(now)
+        for window in [w for w in self._filters if w < current]:
+            del self._filters[window]
+        metrics.set_gauge("token_blocklist_filters", len(self._filters))
+
+    def add(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        if expires_at <= now:
+            return
+        self._rotate(now)
+        window = self._window(expires_at)
+        bloom = self._filters.get(window)
+        if bloom is None:
+            bloom = self._filters[window] = BloomFilter(self.capacity, self.error_rate)
+            metrics.set_gauge("token_blocklist_filters", len(self._filters))
+        bloom.add(jti)
+
+    def might_contain(self, jti: str, expires_at: float) -> bool:
+        bloom = self._filters.get(self._window(expires_at))
+        return bloom is not None and jti in bloom
+
+    def _apply(self, data: str) -> None:
+        jti, _, expires_at = data.partition(" ")
+        try:
+            self.add(jti, float(expires_at))
+        except ValueError:
+            logger.warning("Ignoring malformed blocklist message: %r", data)
+
+    async def _load(self) -> None:
+        keys: list[str] = []
+        async for key in redis.scan_iter(match=f"{_KEY_PREFIX}*", count=_LOAD_BATCH):
+            keys.append(key)
+            if len(keys) >= _LOAD_BATCH:
+                await self._load_batch(keys)
+                keys = []
+        if keys:
+            await self._load_batch(keys)
+
+    async def _load_batch(self, keys: list[str]) -> None:
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.get(key)
+                pipe.pttl(key)
+            replies = await pipe.execute()
+        now = time.time()
+        for key, value, ttl_ms in zip(keys, replies[::2], replies[1::2]):
+            jti = key[len(_KEY_PREFIX):]
+            if value and value != "1":
+                self.add(jti, float(value))
+            elif ttl_ms and ttl_ms > 0:
+                # Entry written before expiries were stored: the token expired
+                # up to a second before the key does
+                expires_at = now + ttl_ms / 1000
+                self.add(jti, expires_at)
+                self.add(jti, expires_at - 1)
+
+    async def _listen(self) -> None:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(REVOKED_CHANNEL)
+            # Subscribe first: revocations published during the load queue up
+            await self._load()
+            self.synced = True
+            self._warned = False
+            metrics.set_gauge("token_blocklist_synced", 1)
+            logger.info("Token blocklist synced (%d filters)", len(self._filters))
+            awaiting_pong = False
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=_PING_SECONDS)
+                if message is None:
+                    if awaiting_pong:
+                        raise RedisConnectionError("blocklist subscription stopped answering PING")
+                    await pubsub.ping()
+                    awaiting_pong = True
+                    continue
+                awaiting_pong = False
+                if message["type"] == "message":
+                    self._apply(message["data"])
+        finally:
+            self.synced = False
+            metrics.set_gauge("token_blocklist_synced", 0)
+            try:
+                await pubsub.aclose()
+            except RedisError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except RedisError as exc:
+                if not self._warned:
+                    logger.warning("Redis unavailable — token blocklist not synced, retrying: %s", exc)
+                    self._warned = True
+            await asyncio.sleep(_RETRY_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+token_blocklist = TokenBlocklist(
+    window_seconds=settings.token_blocklist_window_hours * 3600,
+    capacity=settings.token_blocklist_capacity,
+    error_rate=settings.token_blocklist_error_rate,
+)
+
+
+async def blacklist_token(jti: str, expires_at: float) -> None:
+    """Revoke a refresh token JTI until its expiry (epoch seconds) on every worker."""
+    ttl = math.ceil(expires_at - time.time())
+    if ttl <= 0:
+        return
+    token_blocklist.add(jti, expires_at)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.setex(f"{_KEY_PREFIX}{jti}", ttl, str(int(expires_at)))
+            pipe.publish(REVOKED_CHANNEL, f"{jti} {int(expires_at)}")
+            await pipe.execute()
+    except RedisConnectionError:
+        logger.warning("Redis unavailable — token blacklisting skipped for jti: %s", jti)
+
+
+async def is_token_blacklisted(jti: str, expires_at: float) -> bool:
+    """Return True if the given refresh token JTI has been revoked."""
+    if token_blocklist.synced and not token_blocklist.might_contain(jti, expires_at):
+        metrics.inc("token_blocklist_checks", tier="bloom")
+        return False
+    metrics.inc("token_blocklist_checks", tier="redis")
+    try:
+        return await redis.exists(f"{_KEY_PREFIX}{jti}") == 1
+    except RedisConnectionError:
+        logger.warning("Redis unavailable — assuming token %s is NOT blacklisted", jti)
+        return False  # fail safe: assume token is valid
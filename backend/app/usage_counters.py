@@ -0,0 +1,389 @@
+"""
+Quota counters in Redis, written back to `usage` in the background.
+
+AI queries and document uploads are counted in a Redis hash per org and
+period, `usage:{org_id}:{period}`. A Lua script checks the plan limit and
+applies the increment in one call, so concurrent requests cannot overshoot
+and the hot path never writes the `usage` row. The same increment is added
+to `usage:pending:{org_id}:{period}`, and the org is marked dirty.
+
+`usage_flusher` runs every USAGE_FLUSH_INTERVAL_SECONDS. It renames each
+dirty pending hash to `usage:processing:{org_id}:{period}` and adds those
+deltas to `usage` with one upsert per org on `uq_usage_org_period`, all in
+one transaction. The processing hash is deleted only after the commit. Any
+worker's flusher can write any org's deltas, but only one holds a
+processing hash at a time. If the write fails, the hash is released and
+retried on the next flush. A hash held longer than _CLAIM_STALE_SECONDS
+(its flusher died) is taken over. The app lifespan starts the flusher and
+flushes it on shutdown. With USAGE_FLUSH_INTERVAL_SECONDS=0 counters are
+not kept in Redis at all.
+
+A counter hash is seeded from the `usage` row plus the pending and
+processing deltas, which have not been committed yet. Each commit bumps
+`usage:epoch:{org_id}:{period}`. A seed whose database read raced a commit
+is discarded and read again. The hash expires USAGE_COUNTER_RESEED_SECONDS
+after seeding and is then rebuilt the same way. If Redis is unreachable,
+counts go straight to the database with a conditional UPDATE. Redis is
+retried after a few seconds. Counts written that way reach the Redis totals
+at the next reseed, so limits can run loose by that much until then. Token
+counts are not handled here; they stay on the chat write-behind path.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+from .config import get_settings
+from .db import SessionLocal
+from .dependencies import _set_rls_org, get_current_period, get_usage_for_org
+from .models import Usage, User
+from .redis_client import redis, run_pipeline
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+COUNTED = ("ai_queries_used", "documents_uploaded")
+
+_DIRTY_KEY = "usage:dirty"
+_FLUSH_BATCH = 500
+_REDIS_RETRY_SECONDS = 5.0
+_SEED_ATTEMPTS = 3
+_CLAIM_STALE_SECONDS = 300
+# Outlives the counters of the period it belongs to
+_EPOCH_TTL_SECONDS = 40 * 24 * 3600
+
+# KEYS: totals hash, pending hash, dirty set; ARGV: field, amount, limit (-1 = none), dirty member.
+# Returns {1, new total} when applied, {0, current total} over the limit, {-1, 0} if not seeded.
+_CHARGE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {-1, 0}
+end
+local amount = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local used = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if amount > 0 and limit >= 0 and used + amount > limit then
+  return {0, used}
+end
+if used + amount < 0 then
+  amount = -used
+end
+if amount ~= 0 then
+  redis.call('HINCRBY', KEYS[1], ARGV[1], amount)
+  redis.call('HINCRBY', KEYS[2], ARGV[1], amount)
+  redis.call('SADD', KEYS[3], ARGV[4])
+end
+return {1, used + amount}
+"""
+
+# KEYS: totals hash, pending hash, processing hash, epoch; ARGV: ttl ms, epoch read before
+# the usage row, then field/value pairs from the row. Returns -1 if a flush committed since.
+_SEED_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+if tonumber(redis.call('GET', KEYS[4]) or '0') ~= tonumber(ARGV[2]) then
+  return -1
+end
+for i = 3, #ARGV, 2 do
+  local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+  local processing = tonumber(redis.call('HGET', KEYS[3], ARGV[i]) or '0')
+  redis.call('HSET', KEYS[1], ARGV[i], tonumber(ARGV[i + 1]) + pending + processing)
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: pending, processing hash pairs; ARGV: now ms, stale ms. Per member returns the
+# claimed processing hash as a flat field/value list, {} if nothing is pending, or 0 if
+# another flusher holds it.
+_CLAIM_LUA = """
+local claimed = {}
+for i = 1, #KEYS, 2 do
+  local pending, processing = KEYS[i], KEYS[i + 1]
+  local result
+  if redis.call('EXISTS', processing) == 1 then
+    local since = tonumber(redis.call('HGET', processing, '_claimed_at') or '0')
+    if tonumber(ARGV[1]) - since < tonumber(ARGV[2]) then
+      result = 0
+    else
+      local deltas = redis.call('HGETALL', pending)
+      for j = 1, #deltas, 2 do
+        redis.call('HINCRBY', processing, deltas[j], deltas[j + 1])
+      end
+      redis.call('DEL', pending)
+    end
+  elseif redis.call('EXISTS', pending) == 1 then
+    redis.call('RENAME', pending, processing)
+  else
+    result = {}
+  end
+  if result == nil then
+    redis.call('HSET', processing, '_claimed_at', ARGV[1])
+    result = redis.call('HGETALL', processing)
+  end
+  claimed[#claimed + 1] = result
+end
+return claimed
+"""
+
+_charge_script = redis.register_script(_CHARGE_LUA)
+_seed_script = redis.register_script(_SEED_LUA)
+_claim_script = redis.register_script(_CLAIM_LUA)
+
+_redis_down_until = 0.0
+
+
+class UsageLimitExceeded(Exception):
+    def __init__(self, field: str, used: int, limit: Optional[int]) -> None:
+        super().__init__(f"{field} limit reached ({used}/{limit})")
+        self.field = field
+        self.used = used
+        self.limit = limit
+
+
+def _use_redis() -> bool:
+    return settings.usage_flush_interval_seconds > 0 and time.monotonic() >= _redis_down_until
+
+
+def _member(org_id: UUID, period: str) -> str:
+    return f"{org_id}:{period}"
+
+
+def _totals_key(member: str) -> str:
+    return f"usage:{member}"
+
+
+def _pending_key(member: str) -> str:
+    return f"usage:pending:{member}"
+
+
+def _processing_key(member: str) -> str:
+    return f"usage:processing:{member}"
+
+
+def _epoch_key(member: str) -> str:
+    return f"usage:epoch:{member}"
+
+
+def _read_row(org_id: UUID, period: str) -> Dict[str, int]:
+    with SessionLocal() as db:
+        _set_rls_org(db, org_id)
+        usage = get_usage_for_org(db, org_id, period)
+        return {field: getattr(usage, field) for field in COUNTED}
+
+
+def _charge_db(org_id: UUID, period: str, field: str, amount: int, limit: Optional[int]) -> int:
+    with SessionLocal() as db:
+        _set_rls_org(db, org_id)
+        usage_id = get_usage_for_org(db, org_id, period).id
+        # get_usage_for_org may have committed, ending the SET LOCAL
+        _set_rls_org(db, org_id)
+        column = getattr(Usage, field)
+        query = db.query(Usage).filter(Usage.id == usage_id)
+        if amount > 0 and limit is not None:
+            query = query.filter(column + amount <= limit)
+        elif amount < 0:
+            query = query.filter(column + amount >= 0)
+        updated = query.update({column: column + amount}, synchronize_session=False)
+        db.commit()
+        _set_rls_org(db, org_id)
+        used = db.query(column).filter(Usage.id == usage_id).scalar()
+    if not updated and amount > 0:
+        raise UsageLimitExceeded(field, used, limit)
+    return used
+
+
+async def _seed(org_id: UUID, period: str, member: str) -> None:
+    keys = [_totals_key(member), _pending_key(member), _processing_key(member), _epoch_key(member)]
+    for _ in range(_SEED_ATTEMPTS):
+        epoch = await redis.get(keys[3])
+        row = await run_in_threadpool(_read_row, org_id, period)
+        args = [settings.usage_counter_reseed_seconds * 1000, int(epoch or 0)]
+        for name, value in row.items():
+            args += [name, value]
+        if await _seed_script(keys=keys, args=args) != -1:
+            return
+
+
+async def charge(org_id: UUID, field: str, amount: int = 1, limit: Optional[int] = None) -> int:
+    """
+    Add `amount` to the org's current-period `field` and return the new total.
+    Raises UsageLimitExceeded, changing nothing, if that would pass `limit`.
+    A negative amount gives back (never below zero).
+    """
+    global _redis_down_until
+    period = get_current_period()
+    if _use_redis():
+        member = _member(org_id, period)
+        keys = [_totals_key(member), _pending_key(member), _DIRTY_KEY]
+        args = [field, amount, -1 if limit is None else limit, member]
+        try:
+            applied, used = await _charge_script(keys=keys, args=args)
+            if applied == -1:
+                await _seed(org_id, period, member)
+                applied, used = await _charge_script(keys=keys, args=args)
+        except RedisError:
+            logger.warning("Redis unavailable — usage counted in the database for org %s", org_id)
+            _redis_down_until = time.monotonic() + _REDIS_RETRY_SECONDS
+        else:
+            if applied == 0:
+                metrics.inc("usage_counter", result="denied")
+                raise UsageLimitExceeded(field, int(used), limit)
+            if applied == 1:
+                metrics.inc("usage_counter", result="redis")
+                return int(used)
+    metrics.inc("usage_counter", result="database")
+    return await run_in_threadpool(_charge_db, org_id, period, field, amount, limit)
+
+
+async def live_totals(org_id: UUID) -> Dict[str, int]:
+    """Live counter totals for the current period; empty if Redis has none."""
+    if not _use_redis():
+        return {}
+    try:
+        values = await redis.hmget(_totals_key(_member(org_id, get_current_period())), list(COUNTED))
+    except RedisError:
+        return {}
+    return {field: int(value) for field, value in zip(COUNTED, values) if value is not None}
+
+
+def _write_deltas(rows: List[Tuple[UUID, str, Dict[str, int]]]) -> None:
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+
+            conflict = {"constraint": "uq_usage_org_period"}
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+            conflict = {"index_elements": ["org_id", "period"]}
+        for org_id, period, deltas in rows:
+            _set_rls_org(db, org_id)
+            # A new period's row starts with the org's real seat count (Bug 9)
+            seats = select(func.count(User.id)).where(User.org_id == org_id).scalar_subquery()
+            stmt = insert(Usage).values(
+                org_id=org_id,
+                period=period,
+                seats_used=seats,
+                updated_at=now,
+                **{field: max(0, delta) for field, delta in deltas.items()},
+            )
+            db.execute(stmt.on_conflict_do_update(
+                **conflict,
+                set_={
+                    "updated_at": now,
+                    **{field: getattr(Usage, field) + delta for field, delta in deltas.items()},
+                },
+            ))
+        db.commit()
+
+
+class UsageFlusher:
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _take(self) -> Tuple[List[Tuple[UUID, str, Dict[str, int]]], List[str], List[str], bool]:
+        """Claim a batch of dirty members: (rows to write, claimed, held elsewhere, more)."""
+        members = await redis.spop(_DIRTY_KEY, _FLUSH_BATCH)
+        if not members:
+            return [], [], [], False
+        keys: List[str] = []
+        for member in members:
+            keys += [_pending_key(member), _processing_key(member)]
+        now_ms = int(time.time() * 1000)
+        replies = await _claim_script(keys=keys, args=[now_ms, _CLAIM_STALE_SECONDS * 1000])
+        rows, claimed, busy = [], [], []
+        for member, reply in zip(members, replies):
+            if reply == 0:
+                busy.append(member)
+                continue
+            if not reply:
+                continue
+            claimed.append(member)
+            fields = dict(zip(reply[::2], reply[1::2]))
+            deltas = {field: int(fields[field]) for field in COUNTED if int(fields.get(field, 0))}
+            if deltas:
+                org_id, _, period = member.partition(":")
+                rows.append((UUID(org_id), period, deltas))
+        return rows, claimed, busy, len(members) == _FLUSH_BATCH
+
+    async def _finish(self, claimed: List[str]) -> None:
+        # One MULTI, so a concurrent seed sees the deltas either still in
+        # processing or committed with the epoch bumped
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                for member in claimed:
+                    pipe.delete(_processing_key(member))
+                    pipe.incr(_epoch_key(member))
+                    pipe.expire(_epoch_key(member), _EPOCH_TTL_SECONDS)
+                await pipe.execute()
+        except RedisError:
+            # The claims go stale and are written again: counted twice
+            logger.error("Usage deltas committed but not cleared in Redis for %d orgs", len(claimed))
+
+    async def _release(self, members: List[str], claimed: bool) -> None:
+        commands: List[tuple] = [("SADD", _DIRTY_KEY, *members)]
+        if claimed:
+            # Stale at once, so the next flush takes these claims over
+            commands += [("HSET", _processing_key(member), "_claimed_at", 0) for member in members]
+        if await run_pipeline(commands, "usage flush release") is None:
+            logger.error("Usage deltas for %d orgs wait %ds for a stale claim", len(members), _CLAIM_STALE_SECONDS)
+
+    async def flush(self) -> None:
+        held: List[str] = []
+        more = True
+        while more:
+            try:
+                rows, claimed, busy, more = await self._take()
+            except RedisError:
+                logger.warning("Redis unavailable — usage flush skipped")
+                break
+            held += busy
+            if not claimed:
+                continue
+            started = time.perf_counter()
+            try:
+                if rows:
+                    await run_in_threadpool(_write_deltas, rows)
+            except Exception:
+                logger.exception("Failed to write usage deltas for %d orgs", len(rows))
+                await self._release(claimed, claimed=True)
+                break
+            await self._finish(claimed)
+            metrics.observe("usage_flush_ms", (time.perf_counter() - started) * 1000)
+            metrics.observe("usage_flush_rows", len(rows))
+        if held:
+            # Another worker is writing these; look again next time
+            await self._release(held, claimed=False)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.flush()
+
+
+usage_flusher = UsageFlusher(interval_seconds=settings.usage_flush_interval_seconds)
@@ -0,0 +1,245 @@
+"""
+Vector store maintenance: reconcile Chroma against Postgres and compact.
+
+Orphans come from three places:
+  * organizations removed via DELETE /settings/org leave a whole org_{id} collection,
+  * deleted documents whose chunk removal failed leave stray chunk IDs,
+  * indexing jobs that failed (or died mid-way) leave chunks for documents that
+    are "failed" or stuck in "processing".
+
+Chroma's PersistentClient is single-process, so reconciliation is meant to run
+inside the API worker (see VECTOR_MAINTENANCE_INTERVAL_MINUTES), where it shares
+the live client. Compaction deletes segment directories and VACUUMs the SQLite
+store behind that client, so it only runs from the CLI, in a maintenance window
+with the API stopped:
+
+    python -m backend.app.vector_maintenance --dry-run
+    python -m backend.app.vector_maintenance --batch-size 200 --pause 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import text
+
+from .ai import chroma_client
+from .config import get_settings
+from .db import SessionLocal
+from .models import Document, Organization
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_COLLECTION_RE = re.compile(r"^org_([0-9a-f-]{36})$")
+_UUID_DIR_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def _dir_size(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _live_document_ids(org_id: UUID, stale_before: datetime) -> set[str]:
+    """Document IDs whose chunks should be kept: ready, or still plausibly indexing."""
+    with SessionLocal() as db:
+        try:
+            # Scope to the tenant so RLS does not hide its rows from a non-owner role
+            db.execute(text("SET LOCAL app.current_org_id = :org_id"), {"org_id": str(org_id)})
+        except Exception:
+            db.rollback()  # Non-Postgres dev databases have no RLS to satisfy
+        rows = db.query(Document.id, Document.status, Document.created_at).filter(Document.org_id == org_id).all()
+    live: set[str] = set()
+    for doc_id, status, created_at in rows:
+        if status == "ready":
+            live.add(str(doc_id))
+        elif status == "processing":
+            created = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+            if created >= stale_before:
+                live.add(str(doc_id))
+    return live
+
+
+def _chunk_ids_by_document(collection, page_size: int) -> dict[str, list[str]]:
+    chunks: dict[str, list[str]] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+        if not page:
+            break
+        for chunk_id in page:
+            doc_id, sep, _ = chunk_id.rpartition("_")
+            # Leave IDs we did not write (no "<uuid>_<n>" shape) untouched
+            if sep and _UUID_DIR_RE.match(doc_id):
+                chunks.setdefault(doc_id, []).append(chunk_id)
+        offset += len(page)
+    return chunks
+
+
+def reconcile(
+    batch_size: int = 500,
+    pause_seconds: float = 0.2,
+    stale_after: timedelta = timedelta(hours=1),
+    dry_run: bool = False,
+) -> dict[str, Any]:
+    """
+    Delete orphan collections and chunk IDs. Deletes go out in batches of
+    `batch_size` with `pause_seconds` between them so an online run does not
+    starve concurrent queries.
+
+    Chroma is always listed before the database is read. A document row is
+    committed before its chunks are written, and an organization exists
+    before its collection, so anything created while the job runs is either
+    missing from the listing or already in the database. It is never
+    mistaken for an orphan.
+    """
+    collections = chroma_client.list_collections()
+    with SessionLocal() as db:
+        org_ids = {str(org_id) for (org_id,) in db.query(Organization.id).all()}
+
+    stale_before = datetime.now(timezone.utc) - stale_after
+    report: dict[str, Any] = {
+        "collections_scanned": 0,
+        "collections_deleted": [],
+        "chunks_deleted": 0,
+        "dry_run": dry_run,
+    }
+
+    for collection in collections:
+        match = _COLLECTION_RE.match(collection.name)
+        if not match:
+            continue
+        report["collections_scanned"] += 1
+        org_id = match.group(1)
+
+        if org_id not in org_ids:
+            logger.info("Dropping collection %s: organization no longer exists", collection.name)
+            if not dry_run:
+                chroma_client.delete_collection(collection.name)
+                time.sleep(pause_seconds)
+            report["collections_deleted"].append(collection.name)
+            continue
+
+        chunks = _chunk_ids_by_document(collection, page_size=max(batch_size, 1000))
+        live = _live_document_ids(UUID(org_id), stale_before)
+        orphans = [chunk_id for doc_id, ids in chunks.items() if doc_id not in live for chunk_id in ids]
+        if not orphans:
+            continue
+        logger.info("Collection %s: %d orphan chunks", collection.name, len(orphans))
+        report["chunks_deleted"] += len(orphans)
+        if dry_run:
+            continue
+        for start in range(0, len(orphans), batch_size):
+            collection.delete(ids=orphans[start:start + batch_size])
+            time.sleep(pause_seconds)
+
+    return report
+
+
+def compact(dry_run: bool = False) -> dict[str, Any]:
+    """
+    Remove HNSW segment directories no longer referenced by Chroma's catalogue
+    and VACUUM the SQLite store so freed pages go back to the filesystem.
+    Offline only: a collection created during the run would lose its segment
+    directory, and VACUUM must not run under a live client.
+    """
+    root = Path(settings.chroma_persist_directory)
+    db_path = root / "chroma.sqlite3"
+    report: dict[str, Any] = {"segment_dirs_removed": [], "vacuumed": False}
+    if not db_path.exists():
+        return report
+
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30) as conn:
+        known = {row[0] for row in conn.execute("SELECT id FROM segments")}
+
+    for child in root.iterdir():
+        if child.is_dir() and _UUID_DIR_RE.match(child.name) and child.name not in known:
+            logger.info("Removing unreferenced segment directory %s", child.name)
+            if not dry_run:
+                shutil.rmtree(child, ignore_errors=True)
+            report["segment_dirs_removed"].append(child.name)
+
+    if not dry_run:
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("VACUUM")
+            report["vacuumed"] = True
+        except sqlite3.OperationalError as exc:
+            # Another writer holds the lock; try again on the next run
+            logger.warning("Chroma VACUUM skipped: %s", exc)
+        finally:
+            conn.close()
+    return report
+
+
+def run_maintenance(
+    batch_size: int = 500,
+    pause_seconds: float = 0.2,
+    stale_after: timedelta = timedelta(hours=1),
+    dry_run: bool = False,
+    offline: bool = False,
+) -> dict[str, Any]:
+    """
+    Reconcile, compact when `offline` (the API is stopped), and report how
+    many bytes were reclaimed on disk.
+    """
+    root = Path(settings.chroma_persist_directory)
+    before = _dir_size(root)
+    report = reconcile(batch_size, pause_seconds, stale_after, dry_run)
+    if offline:
+        report.update(compact(dry_run))
+    after = _dir_size(root)
+    report.update({"bytes_before": before, "bytes_after": after, "bytes_reclaimed": max(0, before - after)})
+    logger.info(
+        "Vector maintenance: %d collections dropped, %d chunks deleted, %d bytes reclaimed",
+        len(report["collections_deleted"]), report["chunks_deleted"], report["bytes_reclaimed"],
+    )
+    return report
+
+
+async def maintenance_loop(interval_minutes: int) -> None:
+    """Run maintenance periodically in a worker thread; started from the app lifespan."""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception as exc:
+            logger.error("Vector maintenance run failed: %s", exc, exc_info=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconcile and compact the Chroma vector store.")
+    parser.add_argument("--batch-size", type=int, default=500, help="chunk IDs per delete call")
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds to sleep between delete batches")
+    parser.add_argument("--stale-after-minutes", type=int, default=60,
+                        help="treat documents stuck in 'processing' longer than this as failed")
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting anything")
+    parser.add_argument("--no-compact", action="store_true",
+                        help="reconcile only (compaction requires the API to be stopped)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    report = run_maintenance(
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        stale_after=timedelta(minutes=args.stale_after_minutes),
+        dry_run=args.dry_run,
+        offline=not args.no_compact,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup warm-up of hot tenant collections.
+
+The first query against an org's collection after a restart pays for loading
+its HNSW index (and the embedding model) from disk. At startup we pick the
+orgs with the most recent `ai_query` audit events, open their collections and
+run a throwaway query in a worker thread. audit_log is under RLS, so on
+Postgres the ranking goes through the SECURITY DEFINER function `hot_orgs`
+(migration 0008); a plain query would see no rows from a non-owner role.
+/ready reports unready until this finishes or WARMUP_TIMEOUT_SECONDS
+elapses.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+from uuid import UUID
+
+from sqlalchemy import func, text
+
+from .ai import _get_embedding_fn, get_org_collection
+from .config import get_settings
+from .db import SessionLocal
+from .models import AuditLog
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_state = {"done": False, "deadline": None, "warmed": 0}
+
+
+def is_warm() -> bool:
+    """True once warm-up has finished, timed out, or was never scheduled."""
+    if _state["done"]:
+        return True
+    deadline = _state["deadline"]
+    return deadline is None or time.monotonic() >= deadline
+
+
+def hot_org_ids(limit: int, lookback_days: int) -> List[UUID]:
+    since = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            rows = db.execute(
+                text("SELECT org_id FROM hot_orgs(:since, :limit)"), {"since": since, "limit": limit}
+            ).all()
+            return [row[0] for row in rows]
+        rows = (
+            db.query(AuditLog.org_id, func.count().label("n"))
+            .filter(AuditLog.action == "ai_query", AuditLog.created_at >= since)
+            .group_by(AuditLog.org_id)
+            .order_by(func.count().desc())
+            .limit(limit)
+            .all()
+        )
+    return [row[0] for row in rows]
+
+
+def _warm(limit: int, lookback_days: int) -> None:
+    org_ids = hot_org_ids(limit, lookback_days)
+    if not org_ids:
+        logger.info("Warm-up: no orgs with AI queries in the last %d days", lookback_days)
+        return
+    _get_embedding_fn()(["warm-up"])
+    for org_id in org_ids:
+        try:
+            collection = get_org_collection(org_id)
+            if collection.count():
+                collection.query(query_texts=["warm-up"], n_results=1)
+            _state["warmed"] += 1
+        except Exception as exc:
+            logger.warning("Warm-up failed for org %s: %s", org_id, exc)
+
+
+async def run_warmup() -> None:
+    """Warm the top-N orgs in a thread; flips /ready once done or timed out."""
+    limit = settings.warmup_top_orgs
+    if limit <= 0:
+        _state["done"] = True
+        return
+    timeout = settings.warmup_timeout_seconds
+    _state["deadline"] = time.monotonic() + timeout
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_warm, limit, settings.warmup_lookback_days), timeout)
+        logger.info(
+            "Warm-up finished: %d collections in %.2fs", _state["warmed"], time.perf_counter() - started
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Warm-up timed out after %.0fs (%d collections warmed)", timeout, _state["warmed"])
+    except Exception as exc:
+        logger.warning("Warm-up aborted: %s", exc)
+    finally:
+        _state["done"] = True
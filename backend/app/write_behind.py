@@ -0,0 +1,216 @@
+"""
+Write-behind persistence for finished chat exchanges.
+
+When a chat stream ends, the assistant message, the conversation's
+`updated_at` and the provider token counts are handed to `chat_writer`
+instead of being written from the stream's teardown. A background task
+flushes every CHAT_WRITE_BEHIND_INTERVAL_MS (sooner once
+CHAT_WRITE_BEHIND_MAX_BATCH answers are waiting). A flush does one
+transaction per org with a multi-row message INSERT, one bulk conversation
+UPDATE and a single usage increment. The app lifespan starts the writer and
+drains it on shutdown.
+
+A failed flush is retried on the next tick, up to _MAX_ATTEMPTS times.
+With CHAT_WRITE_BEHIND_INTERVAL_MS=0, or before the writer is started,
+answers are written immediately.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import insert, text, update
+
+from . import metrics
+from .config import get_settings
+from .db import SessionLocal
+from .dependencies import add_token_usage
+from .models import Conversation, Message
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_MAX_ATTEMPTS = 3
+
+
+class PendingAnswer:
+    """One finished exchange: the assistant message (if history is kept) and its token counts."""
+
+    __slots__ = (
+        "org_id",
+        "conversation_id",
+        "message",
+        "finished_at",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_prompt_tokens",
+        "attempts",
+    )
+
+    def __init__(
+        self,
+        org_id: UUID,
+        conversation_id: Optional[UUID],
+        message: Optional[Dict[str, Any]],
+        finished_at: datetime,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_prompt_tokens: int = 0,
+    ) -> None:
+        self.org_id = org_id
+        self.conversation_id = conversation_id
+        self.message = message
+        self.finished_at = finished_at
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_prompt_tokens = cached_prompt_tokens
+        self.attempts = 0
+
+
+def _write_org(org_id: UUID, items: List[PendingAnswer]) -> None:
+    with SessionLocal() as db:
+        try:
+            db.execute(text("SET LOCAL app.current_org_id = :org_id"), {"org_id": str(org_id)})
+        except Exception:
+            db.rollback()  # Non-Postgres dev databases have no RLS to satisfy
+        rows = [
+            {**item.message, "conversation_id": item.conversation_id, "created_at": item.finished_at}
+            for item in items
+            if item.message is not None
+        ]
+        if rows:
+            db.execute(insert(Message), rows)
+        touched: Dict[UUID, datetime] = {}
+        for item in items:
+            if item.conversation_id is not None:
+                touched[item.conversation_id] = max(item.finished_at, touched.get(item.conversation_id, item.finished_at))
+        if touched:
+            db.execute(update(Conversation), [{"id": cid, "updated_at": ts} for cid, ts in touched.items()])
+        prompt = sum(item.prompt_tokens for item in items)
+        completion = sum(item.completion_tokens for item in items)
+        cached = sum(item.cached_prompt_tokens for item in items)
+        if prompt or completion or cached:
+            add_token_usage(db, org_id, prompt, completion, cached)  # commits
+        else:
+            db.commit()
+
+
+class ChatWriteBehind:
+    def __init__(self, interval_ms: int, max_batch: int) -> None:
+        self.interval_ms = interval_ms
+        self.max_batch = max(1, max_batch)
+        self._pending: List[PendingAnswer] = []
+        self._submitted = 0
+        self._settled = 0
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._settled_changed: Optional[asyncio.Condition] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is None and self.interval_ms > 0:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._settled_changed = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and write everything still pending."""
+        task, self._task = self._task, None
+        if task is not None:
+            # Let an in-flight flush finish rather than cancel it mid-write
+            self._closing = True
+            self._wakeup.set()
+            await task
+        while self._pending:
+            await self._flush()
+
+    def submit(self, item: PendingAnswer) -> None:
+        if not self.running:
+            self._write([item])
+            return
+        self._pending.append(item)
+        self._submitted += 1
+        metrics.set_gauge("chat_write_behind_pending", len(self._pending))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def has_pending(self, conversation_id: UUID) -> bool:
+        return any(item.conversation_id == conversation_id for item in self._pending)
+
+    async def sync(self) -> None:
+        """Wait until everything submitted so far has been flushed (or given up on)."""
+        if not self.running:
+            return
+        target = self._submitted
+        self._wakeup.set()
+        async with self._settled_changed:
+            await self._settled_changed.wait_for(lambda: self._settled >= target or not self.running)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        metrics.set_gauge("chat_write_behind_pending", 0)
+        started = time.perf_counter()
+        failed = await asyncio.to_thread(self._write, batch)
+        metrics.observe("chat_write_behind_flush_ms", (time.perf_counter() - started) * 1000)
+        metrics.observe("chat_write_behind_batch", len(batch))
+        retry = [item for item in failed if item.attempts < _MAX_ATTEMPTS]
+        self._pending = retry + self._pending
+        self._settled += len(batch) - len(retry)
+        if self._settled_changed is not None:
+            async with self._settled_changed:
+                self._settled_changed.notify_all()
+
+    def _write(self, batch: List[PendingAnswer]) -> List[PendingAnswer]:
+        """Persist `batch` grouped by org; returns the items that could not be written."""
+        by_org: Dict[UUID, List[PendingAnswer]] = defaultdict(list)
+        for item in batch:
+            by_org[item.org_id].append(item)
+        failed: List[PendingAnswer] = []
+        for org_id, items in by_org.items():
+            try:
+                _write_org(org_id, items)
+                continue
+            except Exception:
+                if len(items) == 1:
+                    logger.exception("Write-behind flush failed for org %s", org_id)
+                    failed.extend(items)
+                    continue
+            # Write one by one so a single bad row does not sink the org's batch
+            for item in items:
+                try:
+                    _write_org(org_id, [item])
+                except Exception:
+                    logger.exception("Write-behind flush failed for org %s", org_id)
+                    failed.append(item)
+        for item in failed:
+            item.attempts += 1
+        if failed:
+            metrics.inc("chat_write_behind_failed", len(failed))
+        return failed
+
+
+chat_writer = ChatWriteBehind(
+    interval_ms=settings.chat_write_behind_interval_ms,
+    max_batch=settings.chat_write_behind_max_batch,
+)
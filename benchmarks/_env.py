@@ -0,0 +1,61 @@
+"""
+Shared bootstrap for benchmark scripts.
+
+Benchmarks import the backend directly, so the settings object needs the same
+placeholder environment the test-suite uses. Real values in the environment
+or .env always win.
+"""
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def bootstrap_env(**overrides: str) -> None:
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_aurora.db")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET", "bench-secret-key-32chars-xxxxxxxx")
+    os.environ.setdefault("GROQ_API_KEY", "gsk_bench_placeholder")
+    os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_placeholder")
+    os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_placeholder")
+    os.environ.setdefault("STRIPE_PRICE_PRO_MONTHLY", "price_placeholder")
+    os.environ.setdefault("STRIPE_PRICE_ENTERPRISE_MONTHLY", "price_placeholder")
+    os.environ.setdefault("STRIPE_CUSTOMER_PORTAL_RETURN_URL", "http://localhost:5173/app/billing")
+    for key, value in overrides.items():
+        os.environ[key] = value
+
+
+def percentiles(samples: list[float], points: tuple[int, ...] = (50, 95, 99)) -> dict[str, float]:
+    """Nearest-rank percentiles, in the same unit as the samples."""
+    if not samples:
+        return {f"p{p}": 0.0 for p in points}
+    ordered = sorted(samples)
+    out: dict[str, float] = {}
+    for p in points:
+        rank = max(1, -(-p * len(ordered) // 100))
+        out[f"p{p}"] = round(ordered[rank - 1], 3)
+    return out
+
+
+def write_results(name: str, results: dict[str, Any], output: str | None = None) -> Path:
+    """Write results as JSON alongside run metadata so regressions can be diffed."""
+    path = Path(output) if output else RESULTS_DIR / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = {
+        "benchmark": name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **results,
+    }
+    path.write_text(json.dumps(doc, indent=2))
+    return path
@@ -0,0 +1,106 @@
+"""
+Runs the mock LLM provider (`backend.app.mock_llm`) in a background thread,
+over TLS with a throwaway self-signed certificate by default so handshake
+costs are realistic.
+"""
+from __future__ import annotations
+
+import datetime
+import ipaddress
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+def make_self_signed_cert(directory: Path) -> tuple[Path, Path]:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([
+                x509.DNSName("localhost"),
+                x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+            ]),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = directory / "mock-cert.pem"
+    key_path = directory / "mock-key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+    )
+    return cert_path, key_path
+
+
+class MockSSEServer:
+    """Runs the mock provider under uvicorn in a background thread."""
+
+    def __init__(
+        self,
+        ttft_ms: float = 0.0,
+        tokens: int = 5,
+        tokens_per_sec: float = 0.0,
+        error_rate: float = 0.0,
+        tls: bool = True,
+        seed: int | None = None,
+    ) -> None:
+        import uvicorn
+
+        from backend.app.mock_llm import make_app
+
+        self._tmp = tempfile.TemporaryDirectory(prefix="mock_sse_")
+        self.cert_path = None
+        tls_options = {}
+        if tls:
+            self.cert_path, key_path = make_self_signed_cert(Path(self._tmp.name))
+            tls_options = {"ssl_certfile": str(self.cert_path), "ssl_keyfile": str(key_path)}
+        self.tls = tls
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        config = uvicorn.Config(
+            make_app(ttft_ms, tokens, tokens_per_sec, error_rate=error_rate, seed=seed),
+            host="127.0.0.1",
+            port=self.port,
+            log_level="warning",
+            **tls_options,
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"{'https' if self.tls else 'http'}://localhost:{self.port}"
+
+    def __enter__(self) -> "MockSSEServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+        self._tmp.cleanup()
@@ -0,0 +1,115 @@
+"""
+Load test: do concurrent Groq streams still serialise on the event loop?
+
+Runs N concurrent streams against a local mock of Groq's OpenAI-compatible SSE
+endpoint, twice:
+
+  * blocking — the previous pattern: open the stream in a thread, then iterate a
+    synchronous HTTP stream directly on the event loop;
+  * async    — `ai.stream_chat_completion(ai_provider="groq")` on the shared
+    async client.
+
+Reports wall time, per-stream TTFT percentiles and the worst event-loop stall
+seen by a 10 ms heartbeat. With the blocking pattern the loop stalls for a
+whole stream at a time, so every other stream's TTFT absorbs it; on the async
+path TTFT stays close to the single-stream value as N grows.
+
+    python -m benchmarks.groq_concurrency --streams 1,8,32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+
+from ._env import bootstrap_env, percentiles, write_results
+from ._mock_sse import MockSSEServer
+
+
+async def _blocking_stream(base_url: str) -> float:
+    import httpx
+
+    started = time.perf_counter()
+    client = httpx.Client()
+    request = client.build_request("POST", base_url + "/v1/chat/completions", json={"stream": True})
+    response = await asyncio.to_thread(client.send, request, stream=True)
+    ttft = None
+    for line in response.iter_lines():  # runs on the event loop, like `for chunk in stream`
+        if ttft is None and line.startswith("data: "):
+            ttft = time.perf_counter() - started
+    response.close()
+    client.close()
+    return (ttft or 0.0) * 1000
+
+
+async def _async_stream() -> float:
+    from backend.app import ai
+
+    started = time.perf_counter()
+    ttft = None
+    async for _ in ai.stream_chat_completion("free", "load test", ai_provider="groq", ai_api_key="bench-key"):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    return (ttft or 0.0) * 1000
+
+
+async def _run_level(fn, streams: int) -> dict:
+    stalls: list[float] = []
+    stop = asyncio.Event()
+
+    async def heartbeat() -> None:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append((time.perf_counter() - t0 - 0.01) * 1000)
+
+    beat = asyncio.create_task(heartbeat())
+    started = time.perf_counter()
+    ttfts = await asyncio.gather(*(fn() for _ in range(streams)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await beat
+    return {
+        "wall_seconds": round(wall, 3),
+        "ttft_ms": percentiles(list(ttfts)),
+        "max_loop_stall_ms": round(max(stalls, default=0.0), 3),
+    }
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    from backend.app import ai
+
+    results: dict = {}
+    for streams in (int(n) for n in args.streams.split(",")):
+        blocking = await _run_level(lambda: _blocking_stream(base_url), streams)
+        non_blocking = await _run_level(_async_stream, streams)
+        results[f"streams={streams}"] = {"blocking": blocking, "async": non_blocking}
+        print(
+            f"streams={streams:<4} blocking wall={blocking['wall_seconds']}s stall={blocking['max_loop_stall_ms']}ms  "
+            f"async wall={non_blocking['wall_seconds']}s stall={non_blocking['max_loop_stall_ms']}ms"
+        )
+    await ai.close_llm_http_clients()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", default="1,8,32", help="concurrent stream counts")
+    parser.add_argument("--ttft-ms", type=float, default=100.0, help="mock time to first token")
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/groq_concurrency.json)")
+    args = parser.parse_args()
+
+    with MockSSEServer(ttft_ms=args.ttft_ms, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec) as server:
+        os.environ["SSL_CERT_FILE"] = str(server.cert_path)
+        bootstrap_env(GROQ_BASE_URL=server.base_url)
+        results = asyncio.run(run(args, server.base_url))
+
+    path = write_results("groq_concurrency", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
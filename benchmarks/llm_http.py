@@ -0,0 +1,110 @@
+"""
+Connection-reuse benchmark for the OpenAI / Anthropic streaming path.
+
+Measures time to first token against a local TLS mock SSE server, comparing a
+new httpx.AsyncClient per request (the previous behaviour) with the pooled
+keep-alive clients used by `ai.stream_chat_completion`. The difference is the
+TCP + TLS handshake cost saved per request.
+
+    python -m benchmarks.llm_http
+    python -m benchmarks.llm_http --requests 500 --concurrency 1,16
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from ._env import bootstrap_env, percentiles, write_results
+from ._mock_sse import MockSSEServer
+
+_PATHS = {"openai": "/v1/chat/completions", "anthropic": "/v1/messages"}
+
+
+async def _fresh_client_ttft(base_url: str, provider: str) -> float:
+    import httpx
+
+    started = time.perf_counter()
+    ttft = None
+    async with httpx.AsyncClient() as client:
+        async with client.stream("POST", base_url + _PATHS[provider], json={"stream": True}) as response:
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data: "):
+                    ttft = time.perf_counter() - started
+    return (ttft or 0.0) * 1000
+
+
+async def _pooled_client_ttft(provider: str) -> float:
+    from backend.app import ai
+
+    started = time.perf_counter()
+    stream = ai.stream_chat_completion("free", "benchmark", ai_provider=provider, ai_api_key="bench-key")
+    await stream.__anext__()
+    ttft = time.perf_counter() - started
+    async for _ in stream:
+        pass
+    return ttft * 1000
+
+
+async def _measure(fn, requests: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: list[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            samples.append(await fn())
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return samples
+
+
+def _summary(samples: list[float]) -> dict:
+    return {**percentiles(samples), "mean": round(statistics.fmean(samples), 3)}
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    from backend.app import ai
+
+    results: dict = {}
+    for provider in args.providers.split(","):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            await _pooled_client_ttft(provider)  # open the pool before timing
+            fresh = await _measure(lambda: _fresh_client_ttft(base_url, provider), args.requests, concurrency)
+            pooled = await _measure(lambda: _pooled_client_ttft(provider), args.requests, concurrency)
+            fresh_s, pooled_s = _summary(fresh), _summary(pooled)
+            results[f"{provider}/c={concurrency}"] = {
+                "fresh_client_ttft_ms": fresh_s,
+                "pooled_client_ttft_ms": pooled_s,
+                "saved_ms_p50": round(fresh_s["p50"] - pooled_s["p50"], 3),
+                "saved_ms_mean": round(fresh_s["mean"] - pooled_s["mean"], 3),
+            }
+            print(
+                f"{provider:<9} c={concurrency:<3} fresh p50={fresh_s['p50']}ms  "
+                f"pooled p50={pooled_s['p50']}ms  saved≈{results[f'{provider}/c={concurrency}']['saved_ms_p50']}ms"
+            )
+        await ai.close_llm_http_clients()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per provider and concurrency level")
+    parser.add_argument("--concurrency", default="1,8")
+    parser.add_argument("--providers", default="openai,anthropic")
+    parser.add_argument("--tokens", type=int, default=5, help="tokens streamed per mock response")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/llm_http.json)")
+    args = parser.parse_args()
+
+    with MockSSEServer(tokens=args.tokens) as server:
+        os.environ["SSL_CERT_FILE"] = str(server.cert_path)
+        bootstrap_env(OPENAI_BASE_URL=server.base_url, ANTHROPIC_BASE_URL=server.base_url)
+        results = asyncio.run(run(args, server.base_url))
+
+    path = write_results("llm_http", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+End-to-end load test: N virtual users register, upload a document and chat.
+
+Every virtual user registers its own org, switches it to the offline `mock`
+AI provider, uploads a small Markdown document, waits for it to be indexed
+and then sends chat requests, reading the SSE stream like the web client.
+Reports throughput, per-phase latency, time to first token and inter-token
+latency percentiles, the chat handler's Server-Timing stages, and errors by
+kind.
+
+By default everything runs in this process and fully offline: the mock LLM
+provider (`backend.app.mock_llm`) and the API (SQLite, hashing embeddings,
+no Redis so rate limits are per process) are served by uvicorn in background
+threads from a temporary working directory. SQLite and the shared process
+cap what this mode can show; for capacity numbers, start the API against
+Postgres/Redis with MOCK_LLM_ENABLED=true and a running
+`python -m backend.app.mock_llm`, and pass --base-url.
+
+    python -m benchmarks.load_test --users 20 --chats 3
+    python -m benchmarks.load_test --users 50 --ttft-ms 400 --tokens-per-sec 40 --error-rate 0.02
+    python -m benchmarks.load_test --base-url http://localhost:8000 --users 100
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from ._env import bootstrap_env, percentiles, write_results
+from ._mock_sse import MockSSEServer
+
+_DOC = """# {org} quarterly notes
+
+Revenue for the quarter was {revenue:,} USD, up {growth}% on the previous quarter.
+The strongest region was {region}; churn held at {churn}%.
+The sales pipeline closed {deals} enterprise deals.
+"""
+
+_QUESTIONS = [
+    "What was revenue this quarter?",
+    "Which region performed best?",
+    "Summarize churn and growth.",
+    "How many enterprise deals closed?",
+]
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.phases: dict[str, list[float]] = {"register": [], "upload": [], "index_ready": [], "chat": []}
+        self.ttft: list[float] = []
+        self.inter_token: list[float] = []
+        self.server_timing: dict[str, list[float]] = {}
+        self.frames = 0
+        self.chats_ok = 0
+        self.errors: Counter = Counter()
+
+
+async def _chat(client, headers: dict, question: str, args: argparse.Namespace, stats: Stats) -> None:
+    payload: dict = {"message": question}
+    if args.flush_ms is not None:
+        payload["flush_ms"] = args.flush_ms
+    if args.flush_bytes is not None:
+        payload["flush_bytes"] = args.flush_bytes
+    started = time.perf_counter()
+    last = None
+    event = None
+    text = []
+    async with client.stream("POST", "/assistant/chat", json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            stats.errors[f"chat_http_{response.status_code}"] += 1
+            await response.aread()
+            return
+        for entry in response.headers.get("server-timing", "").split(","):
+            stage, _, dur = entry.strip().partition(";dur=")
+            if dur:
+                stats.server_timing.setdefault(stage, []).append(float(dur))
+        async for line in response.aiter_lines():
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:") and event is None:
+                now = time.perf_counter()
+                if last is None:
+                    stats.ttft.append((now - started) * 1000)
+                else:
+                    stats.inter_token.append((now - last) * 1000)
+                last = now
+                stats.frames += 1
+                text.append(line[5:].lstrip(" "))
+    stats.phases["chat"].append((time.perf_counter() - started) * 1000)
+    if "".join(text).startswith("Mock Error"):
+        stats.errors["provider_error"] += 1
+    else:
+        stats.chats_ok += 1
+
+
+async def _virtual_user(client, index: int, args: argparse.Namespace, stats: Stats) -> None:
+    rng = random.Random(index)
+    await asyncio.sleep(rng.uniform(0, args.ramp_seconds))
+    unique = uuid.uuid4().hex[:10]
+
+    started = time.perf_counter()
+    res = await client.post("/auth/register", json={
+        "org_name": f"Load Org {unique}",
+        "email": f"load_{unique}@example.com",
+        "password": "LoadTest123!",
+    })
+    if res.status_code != 200:
+        stats.errors[f"register_http_{res.status_code}"] += 1
+        return
+    stats.phases["register"].append((time.perf_counter() - started) * 1000)
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+    res = await client.patch("/settings/org/ai-prefs", json={"ai_provider": "mock"}, headers=headers)
+    if res.status_code != 200:
+        stats.errors[f"ai_prefs_http_{res.status_code}"] += 1
+        return
+
+    doc = _DOC.format(
+        org=unique,
+        revenue=rng.randint(100_000, 9_000_000),
+        growth=rng.randint(1, 30),
+        region=rng.choice(["EMEA", "APAC", "North America", "LATAM"]),
+        churn=rng.randint(1, 9),
+        deals=rng.randint(1, 40),
+    )
+    started = time.perf_counter()
+    res = await client.post(
+        "/documents/upload",
+        files={"file": ("notes.md", doc.encode(), "text/markdown")},
+        headers=headers,
+    )
+    if res.status_code != 202:
+        stats.errors[f"upload_http_{res.status_code}"] += 1
+        return
+    stats.phases["upload"].append((time.perf_counter() - started) * 1000)
+    document_id = res.json()["id"]
+
+    deadline = time.perf_counter() + args.index_timeout
+    while True:
+        res = await client.get(f"/documents/{document_id}/status", headers=headers)
+        status = res.json().get("status") if res.status_code == 200 else None
+        if status == "ready":
+            stats.phases["index_ready"].append((time.perf_counter() - started) * 1000)
+            break
+        if status == "failed" or time.perf_counter() > deadline:
+            stats.errors[f"index_{status or 'timeout'}"] += 1
+            break
+        await asyncio.sleep(0.1)
+
+    for i in range(args.chats):
+        try:
+            await _chat(client, headers, _QUESTIONS[(index + i) % len(_QUESTIONS)], args, stats)
+        except Exception as exc:
+            stats.errors[f"chat_{type(exc).__name__}"] += 1
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    import httpx
+
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users)
+    timeout = httpx.Timeout(args.request_timeout)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(_virtual_user(client, i, args, stats) for i in range(args.users)))
+        wall = time.perf_counter() - started
+
+    results = {
+        "wall_seconds": round(wall, 3),
+        "chats_ok": stats.chats_ok,
+        "chat_throughput_per_sec": round(stats.chats_ok / wall, 3),
+        "frames_per_sec": round(stats.frames / wall, 3),
+        "latency_ms": {phase: percentiles(samples) for phase, samples in stats.phases.items()},
+        "ttft_ms": percentiles(stats.ttft),
+        "inter_token_ms": percentiles(stats.inter_token),
+        "server_timing_ms": {stage: percentiles(samples) for stage, samples in stats.server_timing.items()},
+        "errors": dict(stats.errors),
+    }
+    print(
+        f"users={args.users} chats_ok={stats.chats_ok} wall={results['wall_seconds']}s "
+        f"throughput={results['chat_throughput_per_sec']}/s"
+    )
+    print(f"  ttft ms        {results['ttft_ms']}")
+    print(f"  inter-token ms {results['inter_token_ms']}")
+    for phase, summary in results["latency_ms"].items():
+        print(f"  {phase:<14} {summary}")
+    for stage, summary in results["server_timing_ms"].items():
+        print(f"  {'chat:' + stage:<14} {summary}")
+    if stats.errors:
+        print(f"  errors         {dict(stats.errors)}")
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_in_process(args: argparse.Namespace) -> dict:
+    import uvicorn
+
+    # Expected noise offline: no Redis, and tiny per-org indexes
+    logging.getLogger("backend.app.redis_client").setLevel(logging.ERROR)
+    logging.getLogger("backend.app.rate_limits").setLevel(logging.ERROR)
+    logging.getLogger("chromadb").setLevel(logging.ERROR)
+    workdir = tempfile.TemporaryDirectory(prefix="load_test_")
+    cwd = os.getcwd()
+    # Uploads land under ./storage, so run the API from a scratch directory
+    os.chdir(workdir.name)
+    try:
+        with MockSSEServer(
+            ttft_ms=args.ttft_ms,
+            tokens=args.tokens,
+            tokens_per_sec=args.tokens_per_sec,
+            error_rate=args.error_rate,
+            tls=False,
+            seed=1,
+        ) as llm:
+            bootstrap_env(
+                DATABASE_URL=f"sqlite:///{workdir.name}/load.db",
+                REDIS_URL=f"redis://127.0.0.1:{_free_port()}/0",
+                CHROMA_PERSIST_DIRECTORY=f"{workdir.name}/chroma",
+                EMBEDDING_BACKEND="hashing",
+                MOCK_LLM_ENABLED="true",
+                MOCK_LLM_BASE_URL=llm.base_url,
+                # Every virtual user registers from 127.0.0.1
+                REGISTER_RATE_LIMIT_PER_HOUR=str(max(5, args.users * 2)),
+            )
+            from backend.app.db import Base, engine
+            from backend.app.main import app
+
+            Base.metadata.create_all(bind=engine)
+            port = _free_port()
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                time.sleep(0.01)
+            try:
+                return asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+            finally:
+                server.should_exit = True
+                thread.join(timeout=10)
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--chats", type=int, default=3, help="chat requests per user")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="spread user start times over this window")
+    parser.add_argument("--base-url", help="drive an already running API instead of starting one in-process")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="mock provider time to first token")
+    parser.add_argument("--tokens", type=int, default=120, help="mock tokens per answer")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock provider calls that fail")
+    parser.add_argument("--flush-ms", type=int, help="per-request SSE coalescing interval")
+    parser.add_argument("--flush-bytes", type=int, help="per-request SSE coalescing size")
+    parser.add_argument("--index-timeout", type=float, default=60.0, help="seconds to wait for indexing")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/load_test.json)")
+    args = parser.parse_args()
+
+    if args.base_url:
+        bootstrap_env()
+        results = asyncio.run(run(args, args.base_url.rstrip("/")))
+    else:
+        results = _run_in_process(args)
+
+    path = write_results("load_test", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Login throughput and event-loop lag across bcrypt cost factors.
+
+For each cost factor, N concurrent logins verify a password either inline
+in the coroutine (how `login` used to run) or on a `PasswordHashPool`
+(how it runs now). A 5 ms ticker runs on the same loop; its lateness is
+the delay every other request on the worker, SSE streams included, would
+see. Reports logins per second, login latency and loop lag percentiles.
+
+    python -m benchmarks.password_hashing
+    python -m benchmarks.password_hashing --rounds 10,12 --logins 64 --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from ._env import bootstrap_env, percentiles, write_results
+
+_PASSWORD = "StrongPass123!"
+_TICK_SECONDS = 0.005
+
+
+async def _measure(verify, logins: int) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            expected = time.perf_counter() + _TICK_SECONDS
+            await asyncio.sleep(_TICK_SECONDS)
+            lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    latencies: list[float] = []
+
+    async def login():
+        started = time.perf_counter()
+        assert await verify()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await tick
+    return {
+        "logins_per_sec": round(logins / wall, 1),
+        "login_ms": percentiles(latencies),
+        "loop_lag_ms": {**percentiles(lags), "max": round(max(lags, default=0.0), 3)},
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from passlib.context import CryptContext
+
+    from backend.app.password_hashing import PasswordHashPool
+
+    pool = PasswordHashPool(workers=args.workers, max_queue=args.logins)
+    results: dict = {}
+    for rounds in (int(r) for r in args.rounds.split(",")):
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        hashed = context.hash(_PASSWORD)
+
+        async def inline():
+            return context.verify(_PASSWORD, hashed)
+
+        async def pooled():
+            return await asyncio.wrap_future(pool.submit(context.verify, _PASSWORD, hashed))
+
+        results[f"rounds_{rounds}"] = {
+            "inline": await _measure(inline, args.logins),
+            "pool": await _measure(pooled, args.logins),
+        }
+        print(f"rounds={rounds}: {results[f'rounds_{rounds}']}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", default="10,11,12,13", help="comma-separated bcrypt cost factors")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent logins per run")
+    parser.add_argument("--workers", type=int, default=2, help="PasswordHashPool threads")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/password_hashing.json)")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    results = asyncio.run(run(args))
+    path = write_results("password_hashing", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Rate limiter overhead per request against a real Redis.
+
+Compares three limiters. The first is the old fixed window (INCR, then
+EXPIRE on the first hit: two round trips). The second is the token-bucket
+Lua script from `backend.app.rate_limits` called directly (one EVALSHA per
+check). The third is the two-tier limiter the app uses, which spends leased
+tokens in memory. For each, --concurrency coroutines each run --checks limit
+checks over a spread of keys. Reports latency percentiles per check, checks
+per second and, for the two-tier limiter, Redis calls per check.
+
+Needs a reachable Redis (REDIS_URL, or --redis-url). Keys are written under
+a `bench:` prefix and deleted afterwards.
+
+    python -m benchmarks.rate_limiter
+    python -m benchmarks.rate_limiter --redis-url redis://localhost:6379/15 --checks 5000 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from ._env import bootstrap_env, percentiles, write_results
+
+
+async def _fixed_window(redis, key: str, limit: int, window_seconds: int) -> bool:
+    current = await redis.incr(key)
+    if current == 1:
+        await redis.expire(key, window_seconds)
+    return current <= limit
+
+
+async def _measure(check, checks: int, concurrency: int, keys: int, prefix: str) -> dict:
+    latencies: list[float] = []
+
+    async def worker(n: int):
+        for i in range(checks):
+            started = time.perf_counter()
+            await check(f"{prefix}:{(n * checks + i) % keys}")
+            latencies.append((time.perf_counter() - started) * 1_000_000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "checks_per_sec": round(len(latencies) / wall, 1),
+        "latency_us": percentiles(latencies),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from redis.exceptions import RedisError
+
+    from backend.app import metrics, rate_limits
+    from backend.app.redis_client import redis
+
+    try:
+        await redis.ping()
+    except RedisError as exc:
+        sys.exit(f"Redis is not reachable at {os.environ['REDIS_URL']}: {exc}")
+
+    prefix = f"bench:{uuid.uuid4().hex[:8]}"
+    try:
+        fixed = await _measure(
+            lambda key: _fixed_window(redis, key, args.limit, 60),
+            args.checks, args.concurrency, args.keys, f"{prefix}:fixed",
+        )
+        # rate_limits prefixes keys with "ratelimit:"
+        bucket = await _measure(
+            lambda key: rate_limits._token_bucket(keys=[f"ratelimit:{key}"], args=[args.limit, 60_000, 1, 0]),
+            args.checks, args.concurrency, args.keys, f"{prefix}:bucket",
+        )
+        calls_before = metrics.snapshot()["counters"].get("ratelimit_redis_calls", 0)
+        two_tier = await _measure(
+            lambda key: rate_limits.rate_limit(key, args.limit, 60),
+            args.checks, args.concurrency, args.keys, f"{prefix}:two_tier",
+        )
+        calls = metrics.snapshot()["counters"].get("ratelimit_redis_calls", 0) - calls_before
+        two_tier["redis_calls_per_check"] = round(calls / (args.checks * args.concurrency), 4)
+    finally:
+        for pattern in (f"{prefix}:*", f"ratelimit:{prefix}:*"):
+            async for key in redis.scan_iter(match=pattern, count=1000):
+                await redis.delete(key)
+        await redis.aclose()
+    return {"fixed_window": fixed, "token_bucket_lua": bucket, "two_tier": two_tier}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="defaults to REDIS_URL")
+    parser.add_argument("--checks", type=int, default=2000, help="checks per coroutine")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--keys", type=int, default=100, help="distinct limiter keys")
+    parser.add_argument("--limit", type=int, default=1_000_000, help="bucket size (high so checks stay allowed)")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/rate_limiter.json)")
+    args = parser.parse_args()
+
+    bootstrap_env(**({"REDIS_URL": args.redis_url} if args.redis_url else {}))
+    results = asyncio.run(run(args))
+    for name, summary in results.items():
+        print(f"{name}: {summary}")
+    path = write_results("rate_limiter", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
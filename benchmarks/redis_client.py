@@ -0,0 +1,105 @@
+"""
+Redis round trips saved by pipelining and the client-side cache.
+
+Two comparisons against a real Redis. The first reads the (user, org) token
+versions the way every claims-bearing request does, once with a plain MGET
+and once through `client_cache` (served from memory after the first read,
+invalidated by CLIENT TRACKING). The second sends --batch commands one
+await at a time versus through `run_pipeline`. Reports latency percentiles
+per operation and operations per second.
+
+Needs a reachable Redis 6+ (REDIS_URL, or --redis-url). Keys are written
+under a `bench:` prefix and deleted afterwards.
+
+    python -m benchmarks.redis_client
+    python -m benchmarks.redis_client --redis-url redis://localhost:6379/15 --ops 5000 --batch 8
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from ._env import bootstrap_env, percentiles, write_results
+
+
+async def _measure(op, ops: int) -> dict:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for i in range(ops):
+        t = time.perf_counter()
+        await op(i)
+        latencies.append((time.perf_counter() - t) * 1_000_000)
+    wall = time.perf_counter() - started
+    return {"ops_per_sec": round(ops / wall, 1), "latency_us": percentiles(latencies)}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from redis.exceptions import RedisError
+
+    from backend.app.redis_client import client_cache, org_version_key, redis, run_pipeline, user_version_key
+
+    try:
+        await redis.ping()
+    except RedisError as exc:
+        sys.exit(f"Redis is not reachable at {os.environ['REDIS_URL']}: {exc}")
+
+    prefix = f"bench:{uuid.uuid4().hex[:8]}"
+    users = [uuid.uuid4() for _ in range(args.users)]
+    org = uuid.uuid4()
+    version_keys = [[user_version_key(u), org_version_key(org)] for u in users]
+    client_cache.start()
+    try:
+        for _ in range(50):
+            if client_cache.synced:
+                break
+            await asyncio.sleep(0.1)
+        else:
+            sys.exit("Client-side cache did not start (CLIENT TRACKING needs Redis 6+)")
+
+        results = {
+            "versions_mget": await _measure(lambda i: redis.mget(version_keys[i % args.users]), args.ops),
+            "versions_client_cache": await _measure(
+                lambda i: client_cache.mget(version_keys[i % args.users]), args.ops
+            ),
+        }
+
+        async def sequential(i: int) -> None:
+            for n in range(args.batch):
+                await redis.incr(f"{prefix}:{n}")
+
+        async def pipelined(i: int) -> None:
+            await run_pipeline([("INCR", f"{prefix}:{n}") for n in range(args.batch)], "benchmark")
+
+        results[f"sequential_x{args.batch}"] = await _measure(sequential, args.ops // args.batch)
+        results[f"pipeline_x{args.batch}"] = await _measure(pipelined, args.ops // args.batch)
+    finally:
+        await client_cache.close()
+        async for key in redis.scan_iter(match=f"{prefix}:*", count=1000):
+            await redis.delete(key)
+        await redis.aclose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="defaults to REDIS_URL")
+    parser.add_argument("--ops", type=int, default=2000, help="operations per measurement")
+    parser.add_argument("--users", type=int, default=100, help="distinct users whose versions are read")
+    parser.add_argument("--batch", type=int, default=4, help="commands per pipelined call")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/redis_client.json)")
+    args = parser.parse_args()
+
+    bootstrap_env(**({"REDIS_URL": args.redis_url} if args.redis_url else {}))
+    results = asyncio.run(run(args))
+    for name, summary in results.items():
+        print(f"{name}: {summary}")
+    path = write_results("redis_client", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Retrieval benchmark: how does `query_context` scale with corpus size, top_k
+and tenant count?
+
+Generates a synthetic, labelled multi-tenant corpus, indexes it through
+`ai.index_document` into a throwaway Chroma directory and, at each size
+checkpoint, reports recall@k, MRR, query latency percentiles, indexing
+throughput and on-disk size. Runs fully offline on the hashing embedding.
+
+    python -m benchmarks.retrieval                       # 10k, 100k, 1M chunks
+    python -m benchmarks.retrieval --sizes 2000 --queries 50
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from ._env import bootstrap_env, percentiles, write_results
+
+FILLER = (
+    "the of and to in is for on with as by at from that this be are was it an or "
+    "data report quarter revenue growth customer product team market sales region "
+    "metric value total average trend increase decrease forecast plan budget cost "
+    "margin churn pipeline account invoice order service support release feature"
+).split()
+
+
+class SyntheticCorpus:
+    """
+    Each document gets a small signature of topic terms repeated in every
+    chunk; queries are built from a document's signature, so the document
+    id is the relevance label. Topic terms are shared across documents,
+    which makes retrieval harder as the corpus grows.
+    """
+
+    def __init__(self, seed: int, topic_pool: int, signature_size: int, chunks_per_doc: int) -> None:
+        self.rng = random.Random(seed)
+        self.topics = [f"t{i:05d}{self.rng.choice('abcdefghjk')}" for i in range(topic_pool)]
+        self.signature_size = signature_size
+        # chunk_text() uses 800-char windows with 150-char overlap
+        self.target_len = 800 + 650 * (chunks_per_doc - 1) - 10
+        self.signatures: dict[uuid.UUID, list[str]] = {}
+
+    def document(self, doc_id: uuid.UUID) -> str:
+        signature = self.rng.sample(self.topics, self.signature_size)
+        self.signatures[doc_id] = signature
+        words: list[str] = []
+        length = 0
+        while length < self.target_len:
+            sentence = self.rng.sample(FILLER, 8) + self.rng.sample(signature, 2)
+            self.rng.shuffle(sentence)
+            words.extend(sentence)
+            length += sum(len(w) + 1 for w in sentence)
+        return " ".join(words)
+
+    def query(self, doc_id: uuid.UUID) -> str:
+        terms = self.rng.sample(self.signatures[doc_id], 3) + self.rng.sample(FILLER, 3)
+        self.rng.shuffle(terms)
+        return " ".join(terms)
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def run(args: argparse.Namespace) -> dict:
+    persist_dir = Path(args.persist_dir or tempfile.mkdtemp(prefix="bench_chroma_"))
+    bootstrap_env(CHROMA_PERSIST_DIRECTORY=str(persist_dir), EMBEDDING_BACKEND=args.embedding)
+
+    from backend.app import ai
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    top_ks = sorted(int(k) for k in args.top_k.split(","))
+    tenants = [uuid.uuid4() for _ in range(args.tenants)]
+    corpus = SyntheticCorpus(args.seed, args.topic_pool, args.signature_size, args.chunks_per_doc)
+    doc_org: dict[uuid.UUID, uuid.UUID] = {}
+
+    checkpoints = []
+    total_chunks = 0
+    index_seconds = 0.0
+    try:
+        for size in sizes:
+            started = time.perf_counter()
+            stage_chunks = 0
+            while total_chunks < size:
+                doc_id = uuid.uuid4()
+                org_id = tenants[len(doc_org) % len(tenants)]
+                doc_org[doc_id] = org_id
+                n = ai.index_document(org_id, doc_id, corpus.document(doc_id), {"filename": f"doc-{doc_id}"})
+                total_chunks += n
+                stage_chunks += n
+            stage_seconds = time.perf_counter() - started
+            index_seconds += stage_seconds
+
+            sample = random.Random(args.seed + size).sample(list(doc_org), min(args.queries, len(doc_org)))
+            queries = [(doc_id, corpus.query(doc_id)) for doc_id in sample]
+            by_k = {}
+            for k in top_ks:
+                latencies: list[float] = []
+                hits = 0
+                reciprocal_rank = 0.0
+                for doc_id, q in queries:
+                    t0 = time.perf_counter()
+                    _, sources = ai.query_context(doc_org[doc_id], q, top_k=k)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    label = f"doc-{doc_id}"
+                    rank = next((s["idx"] for s in sources if s["filename"] == label), None)
+                    if rank is not None:
+                        hits += 1
+                        reciprocal_rank += 1.0 / rank
+                by_k[f"k={k}"] = {
+                    "recall": round(hits / len(queries), 4),
+                    "mrr": round(reciprocal_rank / len(queries), 4),
+                    "latency_ms": percentiles(latencies),
+                }
+
+            checkpoint = {
+                "chunks": total_chunks,
+                "documents": len(doc_org),
+                "tenants": len(tenants),
+                "indexing": {
+                    "stage_chunks": stage_chunks,
+                    "stage_seconds": round(stage_seconds, 3),
+                    "chunks_per_sec": round(stage_chunks / stage_seconds, 1) if stage_seconds else None,
+                    "cumulative_seconds": round(index_seconds, 3),
+                },
+                "disk_bytes": _dir_size(persist_dir),
+                "queries": by_k,
+            }
+            checkpoints.append(checkpoint)
+            print(
+                f"{total_chunks:>9} chunks  {checkpoint['indexing']['chunks_per_sec']} chunks/s  "
+                f"{checkpoint['disk_bytes'] / 1e6:.1f} MB  "
+                + "  ".join(f"{k}: R={v['recall']} MRR={v['mrr']} p95={v['latency_ms']['p95']}ms" for k, v in by_k.items())
+            )
+    finally:
+        if not args.keep and not args.persist_dir:
+            shutil.rmtree(persist_dir, ignore_errors=True)
+
+    return {
+        "config": {
+            "sizes": sizes,
+            "top_k": top_ks,
+            "tenants": args.tenants,
+            "queries": args.queries,
+            "chunks_per_doc": args.chunks_per_doc,
+            "topic_pool": args.topic_pool,
+            "signature_size": args.signature_size,
+            "embedding": args.embedding,
+            "seed": args.seed,
+        },
+        "checkpoints": checkpoints,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="chunk-count checkpoints")
+    parser.add_argument("--top-k", default="1,5,10")
+    parser.add_argument("--tenants", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="queries per checkpoint and top_k")
+    parser.add_argument("--chunks-per-doc", type=int, default=4)
+    parser.add_argument("--topic-pool", type=int, default=5000)
+    parser.add_argument("--signature-size", type=int, default=6)
+    parser.add_argument("--embedding", default="hashing", help="EMBEDDING_BACKEND to benchmark with")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--persist-dir", help="reuse a Chroma directory instead of a temp one")
+    parser.add_argument("--keep", action="store_true", help="keep the temp Chroma directory")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/retrieval.json)")
+    args = parser.parse_args()
+
+    results = run(args)
+    path = write_results("retrieval", results, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+SSE token coalescing: frames, bytes and CPU per chat stream.
+
+Serves `ai.sse_chat_response` over a synthetic provider stream of small
+deltas (a send timestamp plus 1-3 characters, at a realistic token rate)
+from a local uvicorn server and reads it back with httpx, so every frame
+pays the real ASGI send, socket write and client parse. For each flush setting it reports frames and
+bytes per stream, process CPU time per stream (server + client) and the
+delivery delay each delta picks up while buffered.
+
+    python -m benchmarks.sse_coalescing
+    python -m benchmarks.sse_coalescing --deltas 2000 --tokens-per-sec 200 --settings 0/0,40/256
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+from ._env import bootstrap_env, percentiles, write_results
+
+
+def _make_app(deltas: int, tokens_per_sec: float):
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+
+    from backend.app import ai
+
+    async def provider():
+        rng = random.Random(7)
+        for _ in range(deltas):
+            await asyncio.sleep(1 / tokens_per_sec)
+            # Each delta carries its send time so the client can measure delay
+            yield json.dumps(time.perf_counter()) + "x" * rng.randint(1, 3) + "|"
+
+    async def stream(request):
+        return await ai.sse_chat_response(
+            provider(),
+            flush_ms=int(request.query_params["flush_ms"]),
+            flush_bytes=int(request.query_params["flush_bytes"]),
+        )
+
+    return Starlette(routes=[Route("/stream", stream)])
+
+
+async def _one_stream(client, flush_ms: int, flush_bytes: int) -> dict:
+    frames = wire_bytes = 0
+    delays: list[float] = []
+    params = {"flush_ms": flush_ms, "flush_bytes": flush_bytes}
+    async with client.stream("GET", "/stream", params=params) as response:
+        async for line in response.aiter_lines():
+            wire_bytes += len(line) + 2
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            frames += 1
+            now = time.perf_counter()
+            for delta in line[6:].split("|")[:-1]:
+                delays.append((now - float(delta.rstrip("x"))) * 1000)
+    return {"frames": frames, "bytes": wire_bytes, "delays": delays}
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    import httpx
+
+    results: dict = {}
+    limits = httpx.Limits(max_connections=args.streams)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+        for setting in args.settings.split(","):
+            flush_ms, flush_bytes = (int(v) for v in setting.split("/"))
+            cpu_started = time.process_time()
+            runs = await asyncio.gather(*(_one_stream(client, flush_ms, flush_bytes) for _ in range(args.streams)))
+            cpu_ms = (time.process_time() - cpu_started) * 1000
+            delays = [d for r in runs for d in r["delays"]]
+            summary = {
+                "frames_per_stream": round(sum(r["frames"] for r in runs) / len(runs), 1),
+                "bytes_per_stream": round(sum(r["bytes"] for r in runs) / len(runs), 1),
+                "cpu_ms_per_stream": round(cpu_ms / len(runs), 3),
+                "delivery_delay_ms": percentiles(delays),
+            }
+            results[f"flush_ms={flush_ms},flush_bytes={flush_bytes}"] = summary
+            print(
+                f"{setting:<9} frames={summary['frames_per_stream']:<8} bytes={summary['bytes_per_stream']:<9} "
+                f"cpu={summary['cpu_ms_per_stream']}ms  delay p99={summary['delivery_delay_ms']['p99']}ms"
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deltas", type=int, default=1000, help="provider deltas per stream")
+    parser.add_argument("--tokens-per-sec", type=float, default=400.0)
+    parser.add_argument("--streams", type=int, default=20, help="concurrent streams per setting")
+    parser.add_argument("--settings", default="0/0,20/128,40/256,100/1024", help="flush_ms/flush_bytes pairs")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/sse_coalescing.json)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    bootstrap_env()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        _make_app(args.deltas, args.tokens_per_sec), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        results = asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+    path = write_results("sse_coalescing", {"config": vars(args), "results": results}, args.output)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ const UsageMeters: React.FC<Props> = ({ usage, onUpgradeClick }) => {
 
   const items = [
     { label: 'AI Queries', used: usage.ai_queries_used, limit: usage.ai_queries_limit },
+    { label: 'AI Tokens', used: usage.ai_tokens_used, limit: usage.ai_tokens_limit },
     { label: 'Documents', used: usage.documents_uploaded, limit: usage.documents_limit },
     { label: 'Team Seats', used: usage.seats_used, limit: usage.seats_limit },
   ];
@@ -47,7 +48,7 @@ const UsageMeters: React.FC<Props> = ({ usage, onUpgradeClick }) => {
         </div>
       )}
 
-      <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
+      <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-4 gap-4">
         {items.map(({ label, used, limit }) => {
           const pct = !limit || limit === 0 ? 0 : Math.min(used / limit, 1) * 100;
           return (
@@ -55,8 +56,8 @@ const UsageMeters: React.FC<Props> = ({ usage, onUpgradeClick }) => {
               <div className="flex items-center justify-between mb-2">
                 <span className="text-xs font-medium text-slate-500 dark:text-[#8e8e8e]">{label}</span>
                 <span className="text-sm font-semibold text-slate-900 dark:text-white">
-                  {used}
-                  {limit ? ` / ${limit}` : ' · ∞'}
+                  {used.toLocaleString()}
+                  {limit ? ` / ${limit.toLocaleString()}` : ' · ∞'}
                 </span>
               </div>
               <div className="progress-bar">
@@ -21,6 +21,11 @@ export interface UsageMetrics {
   period: string;
   ai_queries_used: number;
   ai_queries_limit: number | null;
+  ai_tokens_used: number;
+  ai_tokens_limit: number | null;
+  prompt_tokens_used: number;
+  completion_tokens_used: number;
+  cached_prompt_tokens_used: number;
   documents_uploaded: number;
   documents_limit: number | null;
   seats_used: number;
@@ -28,11 +28,17 @@ from unittest.mock import AsyncMock, patch  # noqa: E402
 # ── Mock Redis everywhere it's imported (patch at point of use) ────────────────
 @pytest.fixture(autouse=True)
 def mock_redis():
-    """Disable Redis for all tests — rate limiting always allows, blacklist always clean."""
+    """
+    Disable Redis for all tests — rate limiting always allows, blacklist always
+    clean, usage counters go straight to the database.
+    """
+    from backend.app.rate_limits import RateLimitResult
+
     with (
-        patch("backend.app.routes_auth.rate_limit", new=AsyncMock(return_value=True)),
+        patch("backend.app.rate_limits.rate_limit", new=AsyncMock(return_value=RateLimitResult(True, 0, 60))),
         patch("backend.app.routes_auth.is_token_blacklisted", new=AsyncMock(return_value=False)),
         patch("backend.app.routes_auth.blacklist_token", new=AsyncMock(return_value=None)),
+        patch("backend.app.usage_counters._use_redis", return_value=False),
     ):
         yield
 
@@ -62,7 +68,11 @@ def create_tables():
 @pytest.fixture()
 def client():
     """FastAPI TestClient with DB override."""
+    from sse_starlette.sse import AppStatus
+
     app.dependency_overrides[get_db] = override_get_db
+    # sse-starlette keeps one exit Event per process; each TestClient runs its own loop
+    AppStatus.should_exit_event = None
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
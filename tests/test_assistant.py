@@ -0,0 +1,233 @@
+"""
+Assistant tests — LLM and vector store are patched out so these run offline.
+"""
+import asyncio
+import json
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from backend.app import ai, metrics
+
+
+async def _fake_stream(org_plan, prompt, usage=None, **kwargs):
+    for token in ("Answer", " to: ", prompt.question):
+        yield token
+    if usage is not None:
+        usage.provider, usage.model = "groq", "fake-model"
+        usage.prompt_tokens, usage.completion_tokens = 100, 3
+
+
+def _fake_contexts(org_id, questions, top_k=5):
+    return [("", []) for _ in questions]
+
+
+def _batch(client, headers, questions):
+    with (
+        patch("backend.app.routes_assistant.stream_chat_completion", new=_fake_stream),
+        patch("backend.app.routes_assistant.query_context_batch", new=_fake_contexts),
+    ):
+        return client.post("/assistant/batch", json={"questions": questions}, headers=headers)
+
+
+def test_batch_streams_one_ndjson_line_per_question(client, auth_headers):
+    questions = ["What is revenue?", "Who is the CEO?", "Top region?"]
+    res = _batch(client, auth_headers, questions)
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    for line in lines:
+        assert line["answer"] == f"Answer to: {questions[line['index']]}"
+
+
+def test_batch_counts_every_question_against_usage(client, auth_headers):
+    _batch(client, auth_headers, ["a", "b", "c", "d"])
+    metrics = client.get("/usage/", headers=auth_headers).json()["usage"]
+    assert metrics["ai_queries_used"] == 4
+    assert (metrics["prompt_tokens_used"], metrics["completion_tokens_used"]) == (400, 12)
+    assert metrics["ai_tokens_used"] == 412
+
+
+def test_batch_gives_back_questions_that_fail(client, auth_headers):
+    async def flaky_provider(provider, model, api_key, prompt, usage):
+        usage.provider, usage.model = provider, model
+        if prompt.question == "boom":
+            raise ai.LLMProviderError(provider, 401)
+        usage.prompt_tokens, usage.completion_tokens = 100, 3
+        yield "fine"
+
+    def failing_retrieval(org_id, questions, top_k=5):
+        raise RuntimeError("vector store down")
+
+    with (
+        patch("backend.app.ai._open_stream", new=flaky_provider),
+        patch("backend.app.routes_assistant.query_context_batch", new=_fake_contexts),
+    ):
+        res = client.post("/assistant/batch", json={"questions": ["a", "boom", "b"]}, headers=auth_headers)
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    errors = [line for line in lines if "error" in line]
+    assert len(errors) == 1 and "401" in errors[0]["error"] and "answer" not in errors[0]
+    assert client.get("/usage/", headers=auth_headers).json()["usage"]["ai_queries_used"] == 2
+
+    with (
+        patch("backend.app.routes_assistant.query_context_batch", new=failing_retrieval),
+        pytest.raises(RuntimeError, match="vector store down"),
+    ):
+        client.post("/assistant/batch", json={"questions": ["c", "d"]}, headers=auth_headers)
+    assert client.get("/usage/", headers=auth_headers).json()["usage"]["ai_queries_used"] == 2
+
+
+async def test_batch_gives_back_questions_cut_off_by_a_disconnect(client, auth_headers):
+    from backend.app import routes_assistant, schemas
+    from backend.app.db import SessionLocal
+    from backend.app.models import Organization, User
+
+    async def slow_stream(org_plan, prompt, usage=None, **kwargs):
+        if prompt.question == "slow":
+            await asyncio.sleep(60)
+        async for token in _fake_stream(org_plan, prompt, usage, **kwargs):
+            yield token
+
+    user_id = client.get("/auth/me", headers=auth_headers).json()["user"]["id"]
+    with (
+        SessionLocal() as db,
+        patch("backend.app.routes_assistant.stream_chat_completion", new=slow_stream),
+        patch("backend.app.routes_assistant.query_context_batch", new=_fake_contexts),
+    ):
+        user = db.get(User, uuid.UUID(user_id))
+        org = db.get(Organization, user.org_id)
+        payload = schemas.BatchChatRequest(questions=["a", "slow", "slow"])
+        response = await routes_assistant.chat_batch(payload, db, org, user)
+        lines = response.body_iterator
+        assert json.loads(await lines.__anext__())["question"] == "a"
+        await lines.aclose()  # the client went away
+
+    assert client.get("/usage/", headers=auth_headers).json()["usage"]["ai_queries_used"] == 1
+
+
+def test_chat_rejected_once_token_allowance_is_spent(client, auth_headers):
+    from backend.app.config import PLAN_LIMITS
+
+    with patch.dict(PLAN_LIMITS["free"], {"max_ai_tokens": 150}):
+        assert _batch(client, auth_headers, ["a", "b"]).status_code == 200  # 206 tokens metered
+        res = _batch(client, auth_headers, ["c"])
+    assert res.status_code == 429
+    assert "token limit" in res.json()["detail"]
+
+
+def test_batch_over_plan_limit_is_rejected_whole(client, auth_headers):
+    assert _batch(client, auth_headers, ["q"] * 48).status_code == 200
+    res = _batch(client, auth_headers, ["q"] * 3)  # free plan allows 50
+    assert res.status_code == 429
+    metrics = client.get("/usage/", headers=auth_headers).json()["usage"]
+    assert metrics["ai_queries_used"] == 48
+
+
+async def test_disconnect_closes_upstream_stream():
+    closed = []
+
+    async def upstream(*args):
+        try:
+            for i in range(1000):
+                yield f"tok{i} "
+        finally:
+            closed.append(True)
+
+    before = metrics.snapshot()["counters"].get("llm_streams_cancelled{provider=groq}", 0)
+    with patch("backend.app.ai._provider_stream", new=upstream):
+        response = await ai.sse_chat_response(ai.stream_chat_completion("free", "prompt"))
+        events = response.body_iterator
+        assert (await events.__anext__())["data"] == "tok0 "
+        await events.aclose()  # what sse-starlette's cancellation leaves behind
+
+    assert closed == [True]
+    after = metrics.snapshot()["counters"]["llm_streams_cancelled{provider=groq}"]
+    assert after == before + 1
+
+
+async def _deltas(n, delay=0.0):
+    for i in range(n):
+        if delay:
+            await asyncio.sleep(delay)
+        yield "ab"
+
+
+async def _collect(stream):
+    return [c async for c in stream]
+
+
+async def test_coalescing_flushes_by_size_and_keeps_first_token():
+    chunks = [c async for c in ai.coalesce_tokens(_deltas(21), flush_ms=10_000, flush_bytes=10)]
+    assert chunks[0] == "ab"  # first token is never delayed
+    assert chunks[1:] == ["ab" * 5] * 4
+    assert "".join(chunks) == "ab" * 21
+
+
+async def test_coalescing_flushes_on_interval_without_next_delta():
+    async def stalled():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.2)
+        yield "c"
+
+    stream = ai.coalesce_tokens(stalled(), flush_ms=20, flush_bytes=0)
+    assert await stream.__anext__() == "a"
+    # "b" must arrive after ~20 ms, not after the 200 ms stall
+    assert await asyncio.wait_for(stream.__anext__(), 0.1) == "b"
+    assert [c async for c in stream] == ["c"]
+
+
+async def test_coalescing_ends_cleanly_on_an_empty_source():
+    chunks = await asyncio.wait_for(_collect(ai.coalesce_tokens(_deltas(0), flush_ms=20, flush_bytes=10)), 1)
+    assert chunks == []
+
+
+async def test_coalescing_raises_an_error_before_the_first_token():
+    async def failing():
+        raise RuntimeError("provider down")
+        yield  # pragma: no cover
+
+    with pytest.raises(RuntimeError, match="provider down"):
+        await asyncio.wait_for(_collect(ai.coalesce_tokens(failing(), flush_ms=20, flush_bytes=10)), 1)
+
+
+async def test_coalescing_disabled_passes_deltas_through():
+    chunks = [c async for c in ai.coalesce_tokens(_deltas(5), flush_ms=0, flush_bytes=0)]
+    assert chunks == ["ab"] * 5
+
+
+async def test_usage_estimated_when_provider_reports_none():
+    async def upstream(*args):
+        yield "four"
+        yield " chars each"
+
+    usage = ai.LLMUsage()
+    with patch("backend.app.ai._provider_stream", new=upstream):
+        # a provider normally sets this when it is called
+        usage.provider = "groq"
+        out = [t async for t in ai.stream_chat_completion("free", ai.build_prompt("q", "ctx"), usage=usage)]
+    assert "".join(out) == "four chars each"
+    assert usage.estimated is True
+    assert usage.completion_tokens == 4  # ceil(15 / 4)
+    assert usage.prompt_tokens == ai.estimate_tokens(ai.build_prompt("q", "ctx").text())
+
+
+def test_chat_reports_server_timing_for_pre_stream_stages(client, auth_headers):
+    import time
+
+    def slow_context(org_id, question):
+        time.sleep(0.05)
+        return "", []
+
+    with (
+        patch("backend.app.routes_assistant.stream_chat_completion", new=_fake_stream),
+        patch("backend.app.routes_assistant.query_context", new=slow_context),
+    ):
+        res = client.post("/assistant/chat", json={"message": "q"}, headers=auth_headers)
+    assert res.status_code == 200
+    stages = dict(entry.strip().split(";dur=") for entry in res.headers["server-timing"].split(","))
+    assert {"ratelimit", "quota", "queue", "retrieval", "bookkeeping", "prestream"} <= set(stages)
+    assert float(stages["retrieval"]) >= 50
+    assert client.get("/usage/", headers=auth_headers).json()["usage"]["ai_queries_used"] == 1
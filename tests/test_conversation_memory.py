@@ -0,0 +1,82 @@
+"""
+Multi-turn memory: last K exchanges verbatim, older ones in a rolling summary.
+"""
+import asyncio
+from unittest.mock import patch
+
+from backend.app import ai, conversation_memory
+from backend.app.config import PLAN_LIMITS
+
+
+def test_history_is_replayed_between_system_prefix_and_question():
+    prompt = ai.build_prompt("q3", "ctx", summary="earlier", turns=[("q2", "a2")])
+    messages = ai._openai_messages(prompt)
+    assert [m["role"] for m in messages] == ["system", "system", "user", "assistant", "user"]
+    assert messages[1]["content"].endswith("earlier")
+    assert messages[-1]["content"] == "Context:\nctx\n\nQuestion: q3"
+
+    payload = ai._anthropic_payload("claude", prompt)
+    assert [block["text"] for block in payload["system"]][1].endswith("earlier")
+    assert [m["role"] for m in payload["messages"]] == ["user", "assistant", "user"]
+    # Breakpoint after the replayed turns, none on the new question
+    assert payload["messages"][1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert all("cache_control" not in block for block in payload["messages"][2]["content"])
+
+
+def test_extractive_summary_stays_within_budget():
+    summary = None
+    for i in range(50):
+        summary = conversation_memory.extractive_summary(summary, [(f"question {i}", "answer " * 40)], 500)
+        assert len(summary) <= 500
+    assert "question 49" in summary and "question 0" not in summary
+
+
+def test_chat_replays_recent_turns_and_folds_older_ones(client, auth_headers):
+    prompts = []
+    summarised = []
+
+    async def fake_chat(org_plan, prompt, usage=None, **kwargs):
+        prompts.append(prompt)
+        yield f"answer {len(prompts)}"
+
+    async def fake_summary(org_plan, prompt, usage=None, **kwargs):
+        summarised.append(prompt.question)
+        usage.provider, usage.prompt_tokens, usage.completion_tokens = "groq", 40, 5
+        yield f"summary after {len(summarised)}"
+
+    on_loop = []
+
+    def off_loop(fn):
+        def wrapper(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(fn.__name__)
+            except RuntimeError:
+                pass
+            return fn(*args)
+        return wrapper
+
+    with (
+        patch.dict(PLAN_LIMITS["free"], {"conversation_history": True}),
+        patch.object(conversation_memory.settings, "conversation_memory_turns", 1),
+        patch("backend.app.routes_assistant.stream_chat_completion", new=fake_chat),
+        patch("backend.app.routes_assistant.query_context", new=lambda org_id, q: ("", [])),
+        patch("backend.app.conversation_memory.stream_chat_completion", new=fake_summary),
+        patch.object(conversation_memory, "_load_evicted", new=off_loop(conversation_memory._load_evicted)),
+        patch.object(conversation_memory, "_store_summary", new=off_loop(conversation_memory._store_summary)),
+    ):
+        assert client.post("/assistant/chat", json={"message": "q1"}, headers=auth_headers).status_code == 200
+        conv_id = client.get("/assistant/conversations", headers=auth_headers).json()["conversations"][0]["id"]
+        for question in ("q2", "q3"):
+            res = client.post("/assistant/chat", json={"message": question, "conversation_id": conv_id}, headers=auth_headers)
+            assert res.status_code == 200
+
+    assert (prompts[0].summary, prompts[0].turns) == (None, [])
+    # Turn 2 sees turn 1 verbatim; turn 3 sees turn 2 verbatim and turn 1 summarised
+    assert (prompts[1].summary, prompts[1].turns) == (None, [("q1", "answer 1")])
+    assert (prompts[2].summary, prompts[2].turns) == ("summary after 1", [("q2", "answer 2")])
+    assert "User: q1\nAssistant: answer 1" in summarised[0]
+    assert len(summarised) == 2  # one incremental fold per exchange once the window is full
+    assert on_loop == []  # the summary refresh keeps its database work off the event loop
+    usage = client.get("/usage/", headers=auth_headers).json()["usage"]
+    assert usage["prompt_tokens_used"] >= 80
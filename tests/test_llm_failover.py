@@ -0,0 +1,117 @@
+"""
+Provider failover, hedging and circuit breaker tests — provider streams are faked.
+"""
+import asyncio
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from backend.app import ai, circuit_breaker
+from backend.app.circuit_breaker import CircuitBreaker
+from backend.app.llm_scheduler import LLMScheduler
+
+CANDIDATES = [("groq", "m1", "k1"), ("openai", "m2", "k2")]
+
+
+@pytest.fixture(autouse=True)
+def _fresh_breakers():
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def _fake_providers(behaviour: dict, closed: list):
+    async def fake(provider, model, api_key, prompt, usage):
+        try:
+            delay, status = behaviour[provider]
+            await asyncio.sleep(delay)
+            if status is not None:
+                raise ai.LLMProviderError(provider, status)
+            for i in range(3):
+                yield f"{provider}{i} "
+        finally:
+            closed.append(provider)
+
+    return patch("backend.app.ai._open_stream", new=fake)
+
+
+async def _collect(hedge_after_ms=None, slot=None):
+    prompt = ai.ChatPrompt.from_text("p")
+    stream = ai._failover_stream(CANDIDATES, prompt, hedge_after_ms, ai.LLMUsage(), slot)
+    return "".join([t async for t in stream])
+
+
+async def test_retryable_error_fails_over_to_secondary():
+    closed: list = []
+    with _fake_providers({"groq": (0, 503), "openai": (0, None)}, closed):
+        assert await _collect() == "openai0 openai1 openai2 "
+    assert circuit_breaker.get_breaker("groq")._failures == 1
+
+
+async def test_auth_error_does_not_fail_over():
+    closed: list = []
+    with _fake_providers({"groq": (0, 401), "openai": (0, None)}, closed):
+        with pytest.raises(ai.LLMProviderError) as exc_info:
+            await _collect()
+    assert exc_info.value.status_code == 401
+    assert closed == ["groq"]
+
+
+async def test_slow_primary_is_hedged_and_loser_closed():
+    closed: list = []
+    with _fake_providers({"groq": (1.0, None), "openai": (0, None)}, closed):
+        started = asyncio.get_running_loop().time()
+        assert await _collect(hedge_after_ms=50) == "openai0 openai1 openai2 "
+        assert asyncio.get_running_loop().time() - started < 0.5
+    assert sorted(closed) == ["groq", "openai"]
+
+
+async def test_failover_and_hedge_hold_a_slot_for_the_serving_provider():
+    scheduler = LLMScheduler(
+        max_concurrency=4, provider_max_concurrency=1, max_queue_depth=0, max_wait_seconds=1.0
+    )
+    for behaviour, hedge_after_ms in (
+        ({"groq": (0, 503), "openai": (0, None)}, None),
+        ({"groq": (1.0, None), "openai": (0, None)}, 50),
+    ):
+        slot = await scheduler.acquire("pro", uuid.uuid4(), "groq")
+        held = []
+
+        async def fake(provider, model, api_key, prompt, usage):
+            held.append((provider, scheduler._active_by_provider[provider]))
+            delay, status = behaviour[provider]
+            await asyncio.sleep(delay)
+            if status is not None:
+                raise ai.LLMProviderError(provider, status)
+            yield f"{provider} "
+
+        with patch("backend.app.ai._open_stream", new=fake):
+            assert await _collect(hedge_after_ms, slot) == "openai "
+        slot.release()
+        assert held == [("groq", 1), ("openai", 1)]
+        assert scheduler._active == 0
+
+
+async def test_open_breaker_skips_provider():
+    breaker = circuit_breaker.get_breaker("groq")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    closed: list = []
+    with _fake_providers({"groq": (0, None), "openai": (0, None)}, closed):
+        assert await _collect() == "openai0 openai1 openai2 "
+    assert closed == ["openai"]
+
+
+def test_breaker_half_open_allows_single_probe():
+    breaker = CircuitBreaker("x", failure_threshold=2, cooldown_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half_open"  # zero cooldown
+    breaker.cooldown_seconds = 60
+    breaker._opened_at -= 61
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # probe already in flight
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
@@ -0,0 +1,75 @@
+"""
+LLM admission scheduler tests — ordering, fairness and fast rejection.
+"""
+import asyncio
+import uuid
+
+import pytest
+
+from backend.app.llm_scheduler import LLMScheduler, QueueFull
+
+
+def _scheduler(**overrides) -> LLMScheduler:
+    config = {"max_concurrency": 1, "provider_max_concurrency": 1, "max_queue_depth": 10, "max_wait_seconds": 5}
+    config.update(overrides)
+    return LLMScheduler(**config)
+
+
+async def _drain(scheduler: LLMScheduler, holder, waiters: list) -> list:
+    """Release the held slot and record the order in which queued callers get served."""
+    order: list = []
+
+    async def run(label, coro):
+        slot = await coro
+        order.append(label)
+        await asyncio.sleep(0)
+        slot.release()
+
+    tasks = [asyncio.create_task(run(label, coro)) for label, coro in waiters]
+    await asyncio.sleep(0)
+    holder.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+async def test_priority_plan_jumps_the_queue():
+    scheduler = _scheduler()
+    holder = await scheduler.acquire("free", uuid.uuid4(), "groq")
+    order = await _drain(scheduler, holder, [
+        ("free", scheduler.acquire("free", uuid.uuid4(), "groq")),
+        ("pro", scheduler.acquire("pro", uuid.uuid4(), "groq")),
+        ("enterprise", scheduler.acquire("enterprise", uuid.uuid4(), "groq")),
+    ])
+    assert order[0] == "enterprise"
+
+
+async def test_orgs_within_a_plan_are_served_round_robin():
+    scheduler = _scheduler()
+    busy_org, quiet_org = uuid.uuid4(), uuid.uuid4()
+    holder = await scheduler.acquire("pro", busy_org, "groq")
+    order = await _drain(scheduler, holder, [
+        ("busy", scheduler.acquire("pro", busy_org, "groq")),
+        ("busy", scheduler.acquire("pro", busy_org, "groq")),
+        ("busy", scheduler.acquire("pro", busy_org, "groq")),
+        ("quiet", scheduler.acquire("pro", quiet_org, "groq")),
+    ])
+    assert order.index("quiet") <= 1
+
+
+async def test_full_queue_is_rejected_with_retry_after():
+    scheduler = _scheduler(max_queue_depth=1)
+    holder = await scheduler.acquire("free", uuid.uuid4(), "groq")
+    queued = asyncio.create_task(scheduler.acquire("free", uuid.uuid4(), "groq"))
+    await asyncio.sleep(0)
+    with pytest.raises(QueueFull) as exc:
+        await scheduler.acquire("free", uuid.uuid4(), "groq")
+    assert exc.value.retry_after >= 1
+    holder.release()
+    (await queued).release()
+
+
+async def test_provider_cap_does_not_block_other_providers():
+    scheduler = _scheduler(max_concurrency=2, provider_max_concurrency=1)
+    await scheduler.acquire("free", uuid.uuid4(), "openai")
+    slot = await asyncio.wait_for(scheduler.acquire("free", uuid.uuid4(), "groq"), timeout=1)
+    slot.release()
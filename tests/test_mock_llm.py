@@ -0,0 +1,32 @@
+"""
+Offline mock LLM provider — the server itself and the `mock` ai_provider guard.
+"""
+import json
+
+import httpx
+
+from backend.app.mock_llm import make_app
+
+
+async def _post(app, path: str) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://mock") as client:
+        return await client.post(path, json={"messages": [{"role": "user", "content": "hi"}], "stream": True})
+
+
+async def test_mock_streams_openai_deltas_and_usage():
+    res = await _post(make_app(ttft_ms=0, tokens=3, tokens_per_sec=0), "/v1/chat/completions")
+    assert res.status_code == 200
+    events = [json.loads(line[6:]) for line in res.text.splitlines() if line.startswith("data: {")]
+    assert [e["choices"][0]["delta"]["content"] for e in events[:-1]] == ["tok0 ", "tok1 ", "tok2 "]
+    assert events[-1]["usage"]["completion_tokens"] == 3
+
+
+async def test_mock_error_rate():
+    res = await _post(make_app(ttft_ms=0, tokens=3, tokens_per_sec=0, error_rate=1.0), "/v1/messages")
+    assert res.status_code == 503
+
+
+def test_mock_provider_rejected_when_disabled(client, auth_headers):
+    res = client.patch("/settings/org/ai-prefs", json={"ai_provider": "mock"}, headers=auth_headers)
+    assert res.status_code == 400
@@ -0,0 +1,53 @@
+"""
+bcrypt runs on a bounded pool, off the event loop.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.app.password_hashing import PasswordHashPool, PasswordPoolFull, check_password
+from backend.app.security import get_password_hash
+
+
+def test_pool_rejects_past_its_queue_bound_and_recovers():
+    pool = PasswordHashPool(workers=1, max_queue=1)
+    gate = threading.Event()
+    running = pool.submit(gate.wait)
+    queued = pool.submit(lambda: "queued")
+    with pytest.raises(PasswordPoolFull):
+        pool.submit(lambda: "rejected")
+    gate.set()
+    assert queued.result(timeout=2) == "queued" and running.result(timeout=2)
+    assert pool.submit(lambda: "again").result(timeout=2) == "again"
+
+
+async def test_check_password_does_not_block_the_event_loop():
+    hashed = get_password_hash("StrongPass123!")
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    assert await check_password("StrongPass123!", hashed)
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    # The loop kept ticking while bcrypt ran on the pool
+    assert ticks >= int(elapsed / 0.005 / 4)
+
+
+def test_sync_password_routes_hash_on_the_pool(client, registered_user, auth_headers):
+    res = client.post(
+        "/settings/profile/password",
+        headers=auth_headers,
+        json={"current_password": registered_user["password"], "new_password": "EvenStronger456!"},
+    )
+    assert res.status_code == 200
+    login = {"email": registered_user["email"], "password": "EvenStronger456!"}
+    assert client.post("/auth/login", json=login).status_code == 200
@@ -0,0 +1,39 @@
+"""
+Principal cache: authenticated requests skip the user/org SELECTs, and
+writes that change a cached row invalidate it.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@contextmanager
+def _principal_selects():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sql = statement.lower()
+        if sql.startswith("select") and ("from users" in sql or "from organizations" in sql):
+            statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+
+def test_repeat_requests_resolve_principal_from_cache(client, auth_headers):
+    assert client.get("/usage/", headers=auth_headers).status_code == 200
+    with _principal_selects() as selects:
+        for _ in range(3):
+            assert client.get("/usage/", headers=auth_headers).status_code == 200
+    assert selects == []
+
+
+def test_ai_prefs_change_invalidates_cached_org(client, auth_headers):
+    assert client.get("/auth/me", headers=auth_headers).json()["organization"]["ai_provider"] == "groq"
+    res = client.patch("/settings/org/ai-prefs", json={"ai_provider": "openai"}, headers=auth_headers)
+    assert res.status_code == 200
+    assert client.get("/auth/me", headers=auth_headers).json()["organization"]["ai_provider"] == "openai"
@@ -0,0 +1,51 @@
+"""
+Prompt layout and provider usage parsing — cache-friendly prefixes and cached-token counts.
+"""
+from backend.app import ai
+
+
+def test_static_instructions_are_a_separate_stable_prefix():
+    a = ai.build_prompt("What is revenue?", "[Source 1] revenue.csv\nrev 10")
+    b = ai.build_prompt("Who is the CEO?", "[Source 1] org.md\nceo Ada")
+    assert a.system == b.system == ai.ANALYST_SYSTEM_PROMPT
+    messages = ai._openai_messages(a)
+    assert messages[0] == {"role": "system", "content": ai.ANALYST_SYSTEM_PROMPT}
+    assert messages[1]["content"].endswith("Question: What is revenue?")
+
+
+def test_anthropic_payload_marks_system_prefix_cacheable():
+    payload = ai._anthropic_payload("claude", ai.build_prompt("q", "ctx"))
+    assert payload["system"] == [
+        {"type": "text", "text": ai.ANALYST_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+    ]
+    assert [block["text"] for block in payload["messages"][0]["content"]] == ["Context:\nctx", "Question: q"]
+
+
+def test_bare_text_prompt_is_a_single_user_message():
+    assert ai._openai_messages(ai.ChatPrompt.from_text("hello")) == [{"role": "user", "content": "hello"}]
+    assert "system" not in ai._anthropic_payload("claude", ai.ChatPrompt.from_text("hello"))
+
+
+def test_anthropic_usage_counts_cached_tokens():
+    usage = ai.LLMUsage()
+    ai._read_anthropic_usage(
+        {"type": "message_start", "message": {"usage": {
+            "input_tokens": 40, "cache_read_input_tokens": 1200, "cache_creation_input_tokens": 0,
+        }}},
+        usage,
+    )
+    ai._read_anthropic_usage({"type": "message_delta", "usage": {"output_tokens": 85}}, usage)
+    assert (usage.prompt_tokens, usage.cached_prompt_tokens, usage.completion_tokens) == (1240, 1200, 85)
+
+
+def test_openai_and_groq_usage_chunks():
+    usage = ai.LLMUsage()
+    ai._read_openai_usage(
+        {"choices": [], "usage": {"prompt_tokens": 2000, "completion_tokens": 90,
+                                  "prompt_tokens_details": {"cached_tokens": 1536}}},
+        usage,
+    )
+    assert (usage.prompt_tokens, usage.cached_prompt_tokens) == (2000, 1536)
+    groq = ai.LLMUsage()
+    ai._read_openai_usage({"x_groq": {"usage": {"prompt_tokens": 300, "completion_tokens": 20}}}, groq)
+    assert (groq.prompt_tokens, groq.completion_tokens, groq.cached_prompt_tokens) == (300, 20, None)
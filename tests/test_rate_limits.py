@@ -0,0 +1,72 @@
+"""
+Two-tier token-bucket rate limits: leased local tokens, plan-aware chat
+limits and RateLimit-* headers. The Redis script is replaced by a fake.
+"""
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from backend.app.config import PLAN_LIMITS
+from backend.app.rate_limits import RateLimitResult, TwoTierRateLimiter
+
+
+class FakeBucket:
+    """The Lua script's contract without refill over time."""
+
+    def __init__(self, tokens, retry_ms=3000):
+        self.tokens = tokens
+        self.retry_ms = retry_ms
+        self.calls = 0
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        capacity, _, want, give_back = args
+        self.tokens = min(capacity, self.tokens + give_back)
+        granted = min(want, self.tokens)
+        self.tokens -= granted
+        return [granted, self.tokens, 1000, 0 if granted else self.retry_ms]
+
+
+def _limiter(**overrides):
+    options = {"lease_ttl": 60, "max_lease": 16, "max_keys": 100, "redis_retry_seconds": 5}
+    return TwoTierRateLimiter(**{**options, **overrides})
+
+
+async def test_leased_tokens_serve_most_checks_without_redis():
+    bucket = FakeBucket(tokens=100)
+    limiter = _limiter()
+    with patch("backend.app.rate_limits._token_bucket", new=bucket):
+        results = [await limiter.check("chat:u1", 100, 60) for _ in range(60)]
+    assert all(r.allowed for r in results)
+    assert bucket.calls <= 10
+    # Leasing never hands out more than the shared bucket holds
+    assert 100 - bucket.tokens <= 60 + 16
+
+
+async def test_denial_is_remembered_locally_with_headers():
+    bucket = FakeBucket(tokens=0, retry_ms=3000)
+    limiter = _limiter()
+    with patch("backend.app.rate_limits._token_bucket", new=bucket):
+        results = [await limiter.check("login:a@b.c", 10, 60) for _ in range(5)]
+    assert not any(r.allowed for r in results) and bucket.calls == 1
+    headers = results[-1].headers()
+    assert headers["RateLimit-Remaining"] == "0" and headers["Retry-After"] == "3"
+    assert headers["RateLimit-Policy"] == "10;w=60"
+
+
+async def test_redis_outage_degrades_to_per_worker_limits():
+    script = AsyncMock(side_effect=RedisConnectionError())
+    limiter = _limiter()
+    with patch("backend.app.rate_limits._token_bucket", new=script):
+        results = [await limiter.check("register:1.2.3.4", 3, 3600) for _ in range(5)]
+    assert [r.allowed for r in results] == [True, True, True, False, False]
+    assert script.await_count == 1  # Redis is not retried until the retry window passes
+
+
+def test_chat_uses_plan_rate_and_returns_429_headers(client, auth_headers):
+    denied = RateLimitResult(False, 10, 60, remaining=0, reset_seconds=6, retry_after=6)
+    with patch("backend.app.rate_limits.rate_limit", new=AsyncMock(return_value=denied)) as limiter:
+        res = client.post("/assistant/chat", json={"message": "hi"}, headers=auth_headers)
+    assert limiter.await_args.args[1:] == (PLAN_LIMITS["free"]["chat_requests_per_minute"], 60)
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "6" and res.headers["RateLimit-Remaining"] == "0"
@@ -0,0 +1,65 @@
+"""
+Redis client helpers: the tracking-invalidated client-side cache and
+pipelined multi-command calls. Redis itself is replaced by mocks.
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from backend.app.redis_client import ClientSideCache, run_pipeline
+
+
+def _synced_cache():
+    cache = ClientSideCache(prefixes=("authver:",), max_keys=2)
+    cache.synced = True
+    return cache
+
+
+async def test_client_cache_serves_repeat_reads_until_invalidated():
+    cache = _synced_cache()
+    fake_mget = AsyncMock(return_value=["3", None])
+    with patch("backend.app.redis_client.redis.mget", new=fake_mget):
+        keys = ["authver:user:1", "authver:org:1"]
+        assert await cache.mget(keys) == ["3", None]
+        assert await cache.mget(keys) == ["3", None]
+        assert fake_mget.await_count == 1
+
+        cache.invalidate(["authver:user:1"])
+        fake_mget.return_value = ["4"]
+        assert await cache.mget(keys) == ["4", None]
+        fake_mget.assert_awaited_with(["authver:user:1"])
+
+
+async def test_client_cache_drops_fills_raced_by_an_invalidation():
+    cache = _synced_cache()
+
+    async def mget(keys):
+        # A write lands while this read is in flight
+        cache.invalidate(keys)
+        return ["1"]
+
+    with patch("backend.app.redis_client.redis.mget", new=AsyncMock(side_effect=mget)) as fake_mget:
+        await cache.mget(["authver:user:1"])
+        await cache.mget(["authver:user:1"])
+    assert fake_mget.await_count == 2
+
+
+async def test_client_cache_passes_through_until_tracking_is_up():
+    cache = ClientSideCache(prefixes=("authver:",), max_keys=10)
+    with patch("backend.app.redis_client.redis.mget", new=AsyncMock(return_value=["1"])) as fake_mget:
+        await cache.mget(["authver:user:1"])
+        await cache.mget(["authver:user:1"])
+    assert fake_mget.await_count == 2
+
+
+async def test_run_pipeline_sends_commands_together_and_fails_soft():
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[1, 2])
+    pipe.__aenter__ = AsyncMock(return_value=pipe)
+    pipe.__aexit__ = AsyncMock(return_value=False)
+    with patch("backend.app.redis_client.redis.pipeline", return_value=pipe):
+        assert await run_pipeline([("DEL", "a", "b"), ("INCR", "c")], "test") == [1, 2]
+        assert [c.args for c in pipe.execute_command.call_args_list] == [("DEL", "a", "b"), ("INCR", "c")]
+
+        pipe.execute.side_effect = RedisConnectionError()
+        assert await run_pipeline([("INCR", "c")], "test") is None
@@ -0,0 +1,64 @@
+"""
+Refresh-token blocklist: per-worker Bloom filters in front of Redis EXISTS,
+rotated by token expiry window.
+"""
+import time
+from unittest.mock import AsyncMock, patch
+
+from backend.app.token_blocklist import BloomFilter, TokenBlocklist, is_token_blacklisted
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.001)
+    revoked = [f"revoked-{i}" for i in range(1000)]
+    for jti in revoked:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in revoked)
+    false_positives = sum(f"valid-{i}" in bloom for i in range(10_000))
+    assert false_positives < 50
+
+
+def test_filters_are_dropped_once_their_window_has_expired():
+    blocklist = TokenBlocklist(window_seconds=60, capacity=100, error_rate=0.01)
+    now = time.time()
+    blocklist.add("soon", now + 30)
+    blocklist.add("later", now + 150)
+    assert blocklist.might_contain("soon", now + 30)
+    assert len(blocklist._filters) == 2
+
+    blocklist._rotate(now + 120)
+    assert len(blocklist._filters) == 1
+    assert not blocklist.might_contain("soon", now + 30)
+    assert blocklist.might_contain("later", now + 150)
+
+
+def test_pubsub_messages_feed_the_filter():
+    blocklist = TokenBlocklist(window_seconds=3600, capacity=100, error_rate=0.01)
+    exp = int(time.time()) + 600
+    blocklist._apply(f"jti-1 {exp}")
+    blocklist._apply("garbage")
+    assert blocklist.might_contain("jti-1", exp)
+
+
+async def test_only_possible_hits_reach_redis_once_synced():
+    blocklist = TokenBlocklist(window_seconds=3600, capacity=100, error_rate=0.01)
+    exp = time.time() + 600
+    blocklist.add("revoked", exp)
+    fake_redis = AsyncMock()
+    fake_redis.exists.return_value = 1
+    with (
+        patch("backend.app.token_blocklist.token_blocklist", new=blocklist),
+        patch("backend.app.token_blocklist.redis", new=fake_redis),
+    ):
+        # Not synced yet: every check goes to Redis
+        assert await is_token_blacklisted("valid", exp)
+        assert fake_redis.exists.await_count == 1
+
+        blocklist.synced = True
+        fake_redis.exists.return_value = 0
+        assert not await is_token_blacklisted("valid", exp)
+        assert fake_redis.exists.await_count == 1
+
+        fake_redis.exists.return_value = 1
+        assert await is_token_blacklisted("revoked", exp)
+        assert fake_redis.exists.await_count == 2
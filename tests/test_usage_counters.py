@@ -0,0 +1,87 @@
+"""
+Quota counters: one atomic check-and-increment per charge in Redis (scripts
+mocked), deltas upserted into `usage` by the flusher (real test database).
+"""
+import uuid
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from backend.app.db import SessionLocal
+from backend.app.models import Usage
+from backend.app.usage_counters import UsageFlusher, UsageLimitExceeded, _write_deltas, charge
+
+
+async def test_charge_seeds_an_unseen_counter_then_enforces_the_limit():
+    org_id = uuid.uuid4()
+    charge_script = AsyncMock(side_effect=[[-1, 0], [1, 4]])
+    # The first seed raced a flush commit and is read again
+    seed_script = AsyncMock(side_effect=[-1, 1])
+    with (
+        patch("backend.app.usage_counters._use_redis", return_value=True),
+        patch("backend.app.usage_counters.redis.get", new=AsyncMock(side_effect=["2", "3"])),
+        patch("backend.app.usage_counters._charge_script", new=charge_script),
+        patch("backend.app.usage_counters._seed_script", new=seed_script),
+        patch(
+            "backend.app.usage_counters._read_row",
+            return_value={"ai_queries_used": 3, "documents_uploaded": 1},
+        ) as read_row,
+        patch("backend.app.usage_counters._charge_db") as charge_db,
+    ):
+        assert await charge(org_id, "ai_queries_used", 1, 5) == 4
+        assert read_row.call_count == 2
+        assert seed_script.await_args.kwargs["args"][1:] == [3, "ai_queries_used", 3, "documents_uploaded", 1]
+
+        charge_script.side_effect = [[0, 5]]
+        with pytest.raises(UsageLimitExceeded) as exc:
+            await charge(org_id, "ai_queries_used", 1, 5)
+        assert exc.value.used == 5
+        charge_db.assert_not_called()
+
+
+def _usage_row(org_id, period):
+    with SessionLocal() as db:
+        return db.query(Usage).filter(Usage.org_id == org_id, Usage.period == period).one()
+
+
+def test_flush_upserts_deltas_into_the_usage_row(client, auth_headers):
+    org_id = uuid.UUID(client.get("/auth/me", headers=auth_headers).json()["organization"]["id"])
+    period = "2099-01"
+
+    _write_deltas([(org_id, period, {"ai_queries_used": 3, "documents_uploaded": 1})])
+    row = _usage_row(org_id, period)
+    assert (row.ai_queries_used, row.documents_uploaded, row.seats_used) == (3, 1, 1)
+
+    _write_deltas([(org_id, period, {"ai_queries_used": 2, "documents_uploaded": -1})])
+    row = _usage_row(org_id, period)
+    assert (row.ai_queries_used, row.documents_uploaded, row.seats_used) == (5, 0, 1)
+
+
+async def test_claims_are_cleared_only_after_the_commit():
+    org_id = uuid.uuid4()
+    member = f"{org_id}:2099-01"
+    flusher = UsageFlusher(interval_seconds=60)
+    claim = AsyncMock(return_value=[["ai_queries_used", "2", "documents_uploaded", "0", "_claimed_at", "1"], 0])
+    with (
+        patch("backend.app.usage_counters.redis.spop", new=AsyncMock(side_effect=[[member, "held:2099-01"], []])),
+        patch("backend.app.usage_counters._claim_script", new=claim),
+        patch("backend.app.usage_counters._write_deltas", side_effect=RuntimeError("database down")) as write,
+        patch.object(UsageFlusher, "_finish", new=AsyncMock()) as finish,
+        patch("backend.app.usage_counters.run_pipeline", new=AsyncMock(return_value=[1, 1])) as pipeline,
+    ):
+        await flusher.flush()
+        assert write.call_args.args[0] == [(org_id, "2099-01", {"ai_queries_used": 2})]
+        finish.assert_not_awaited()
+        # The failed claim is released for the next flush; the one held elsewhere is re-queued
+        assert [c.args[0] for c in pipeline.await_args_list] == [
+            [("SADD", "usage:dirty", member), ("HSET", f"usage:processing:{member}", "_claimed_at", 0)],
+            [("SADD", "usage:dirty", "held:2099-01")],
+        ]
+
+        write.side_effect = None
+        pipeline.reset_mock()
+        with patch("backend.app.usage_counters.redis.spop", new=AsyncMock(return_value=[member])):
+            claim.return_value = [["ai_queries_used", "2", "_claimed_at", "1"]]
+            await flusher.flush()
+        finish.assert_awaited_once_with([member])
+        pipeline.assert_not_awaited()
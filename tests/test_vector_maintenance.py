@@ -0,0 +1,96 @@
+"""
+Vector store maintenance against a throwaway Chroma directory and the test
+database.
+"""
+import uuid
+from unittest.mock import patch
+
+import chromadb
+import pytest
+
+from backend.app import vector_maintenance
+from backend.app.db import SessionLocal
+from backend.app.models import Document, Organization
+
+
+@pytest.fixture()
+def store(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    with (
+        patch.object(vector_maintenance, "chroma_client", client),
+        patch.object(vector_maintenance.settings, "chroma_persist_directory", str(tmp_path)),
+    ):
+        yield client
+
+
+def _org() -> uuid.UUID:
+    org_id = uuid.uuid4()
+    with SessionLocal() as db:
+        db.add(Organization(id=org_id, name="Vectors", slug=f"vectors-{org_id.hex[:8]}"))
+        db.commit()
+    return org_id
+
+
+def _document(org_id: uuid.UUID, status: str = "ready") -> str:
+    doc_id = uuid.uuid4()
+    with SessionLocal() as db:
+        db.add(Document(id=doc_id, org_id=org_id, filename="a.txt", size_bytes=1, status=status))
+        db.commit()
+    return str(doc_id)
+
+
+def _index(collection, doc_id: str, chunks: int = 2) -> None:
+    ids = [f"{doc_id}_{i}" for i in range(chunks)]
+    collection.add(ids=ids, embeddings=[[0.1, 0.2, 0.3]] * chunks, documents=["text"] * chunks)
+
+
+def test_reconcile_drops_orphans_and_keeps_live_chunks(store):
+    org_id = _org()
+    collection = store.get_or_create_collection(f"org_{org_id}", embedding_function=None)
+    live, failed, deleted = _document(org_id), _document(org_id, "failed"), str(uuid.uuid4())
+    for doc_id in (live, failed, deleted):
+        _index(collection, doc_id)
+    store.get_or_create_collection(f"org_{uuid.uuid4()}", embedding_function=None)
+
+    report = vector_maintenance.reconcile(pause_seconds=0)
+
+    assert report["chunks_deleted"] == 4
+    assert len(report["collections_deleted"]) == 1
+    assert sorted(collection.get()["ids"]) == [f"{live}_0", f"{live}_1"]
+
+
+def test_reconcile_keeps_documents_indexed_while_it_runs(store):
+    org_id = _org()
+    collection = store.get_or_create_collection(f"org_{org_id}", embedding_function=None)
+    _index(collection, _document(org_id))
+    read_live = vector_maintenance._live_document_ids
+    uploaded = []
+
+    def read_then_upload(org, stale_before):
+        live = read_live(org, stale_before)
+        # An upload commits and finishes indexing right after the database read
+        uploaded.append(_document(org_id))
+        _index(collection, uploaded[0])
+        return live
+
+    with patch.object(vector_maintenance, "_live_document_ids", side_effect=read_then_upload):
+        report = vector_maintenance.reconcile(pause_seconds=0)
+
+    assert report["chunks_deleted"] == 0
+    assert f"{uploaded[0]}_0" in collection.get()["ids"]
+
+
+def test_compact_removes_unreferenced_segment_dirs_offline_only(store, tmp_path):
+    collection = store.get_or_create_collection(f"org_{_org()}", embedding_function=None)
+    _index(collection, str(uuid.uuid4()))
+    stray = tmp_path / str(uuid.uuid4())
+    stray.mkdir()
+    (stray / "data_level0.bin").write_bytes(b"\0" * 1024)
+
+    online = vector_maintenance.run_maintenance(pause_seconds=0)
+    assert "vacuumed" not in online and stray.exists()
+
+    report = vector_maintenance.compact()
+    assert report["segment_dirs_removed"] == [stray.name]
+    assert report["vacuumed"]
+    assert not stray.exists()
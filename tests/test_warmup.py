@@ -0,0 +1,49 @@
+"""
+Startup warm-up: picking the hot orgs to pre-load.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from backend.app import warmup
+from backend.app.db import SessionLocal
+from backend.app.models import AuditLog
+
+
+def test_hot_orgs_are_ranked_by_recent_ai_queries():
+    busy, quiet, stale = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    with SessionLocal() as db:
+        db.add_all(
+            [AuditLog(org_id=busy, action="ai_query") for _ in range(3)]
+            + [AuditLog(org_id=quiet, action="ai_query")]
+            + [AuditLog(org_id=stale, action="ai_query", created_at=old) for _ in range(5)]
+            + [AuditLog(org_id=quiet, action="document_uploaded") for _ in range(5)]
+        )
+        db.commit()
+
+    ranked = [org for org in warmup.hot_org_ids(limit=1000, lookback_days=7) if org in (busy, quiet, stale)]
+    assert ranked == [busy, quiet]
+
+
+def test_postgres_ranking_goes_through_the_rls_safe_function():
+    org_id = uuid.uuid4()
+    db = MagicMock()
+    db.get_bind.return_value.dialect.name = "postgresql"
+    db.execute.return_value.all.return_value = [(org_id,)]
+    session = MagicMock()
+    session.return_value.__enter__.return_value = db
+    with patch.object(warmup, "SessionLocal", session):
+        assert warmup.hot_org_ids(limit=5, lookback_days=7) == [org_id]
+    statement, params = db.execute.call_args.args
+    assert "hot_orgs(:since, :limit)" in str(statement) and params["limit"] == 5
+
+
+def test_warm_logs_when_no_org_qualifies(caplog):
+    with (
+        patch.object(warmup, "hot_org_ids", return_value=[]),
+        caplog.at_level(logging.INFO, logger="backend.app.warmup"),
+    ):
+        warmup._warm(limit=5, lookback_days=7)
+    assert "no orgs with AI queries" in caplog.text
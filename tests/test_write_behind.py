@@ -0,0 +1,58 @@
+"""
+Write-behind queue for finished chat answers (DB writes patched out).
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from backend.app.write_behind import ChatWriteBehind, PendingAnswer
+
+
+def _answer(org_id, content="answer"):
+    message = {"role": "assistant", "content": content}
+    return PendingAnswer(org_id, uuid.uuid4(), message, datetime.now(timezone.utc), 10, 2)
+
+
+async def test_answers_are_batched_per_org_and_flushed_on_sync():
+    writes = []
+    org_a, org_b = uuid.uuid4(), uuid.uuid4()
+    writer = ChatWriteBehind(interval_ms=10_000, max_batch=100)
+    with patch("backend.app.write_behind._write_org", new=lambda org_id, items: writes.append((org_id, len(items)))):
+        writer.start()
+        for org_id in (org_a, org_b, org_a, org_a):
+            writer.submit(_answer(org_id))
+        assert writes == []  # nothing written from the submitting coroutine
+        await asyncio.wait_for(writer.sync(), timeout=1)
+        assert sorted(writes, key=lambda w: w[1]) == [(org_b, 1), (org_a, 3)]
+        await writer.close()
+
+
+async def test_bad_answer_is_isolated_and_retried_then_dropped():
+    org_id = uuid.uuid4()
+    written = []
+
+    def write(org_id, items):
+        if any(item.message["content"] == "bad" for item in items):
+            raise RuntimeError("constraint violation")
+        written.extend(item.message["content"] for item in items)
+
+    writer = ChatWriteBehind(interval_ms=10, max_batch=100)
+    with patch("backend.app.write_behind._write_org", new=write):
+        writer.start()
+        writer.submit(_answer(org_id, "good"))
+        writer.submit(_answer(org_id, "bad"))
+        await asyncio.wait_for(writer.sync(), timeout=2)
+        await writer.close()
+    assert written == ["good"]
+
+
+async def test_close_drains_pending_answers():
+    writes = []
+    writer = ChatWriteBehind(interval_ms=60_000, max_batch=100)
+    with patch("backend.app.write_behind._write_org", new=lambda org_id, items: writes.extend(items)):
+        writer.start()
+        for _ in range(3):
+            writer.submit(_answer(uuid.uuid4()))
+        await writer.close()
+    assert len(writes) == 3 and not writer.running